@@ -0,0 +1,117 @@
+import time
+import numpy as np
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+from loguru import logger
+from sensors.base import Measurement
+from metrics import metrics
+
+aggregator_log = logger.bind(tags=['aggregator'])
+
+
+@dataclass(slots=True)
+class Aggregate:
+  mean        : float
+  min         : float
+  max         : float
+  last        : float
+  count       : int
+  dimension   : str
+  unit        : str
+  sensor_name : str
+  sensor_id   : str
+  timestamp   : datetime
+
+  @property
+  def value(self) -> float:
+    return self.mean
+
+  def measurement(self) -> Measurement:
+    # The window reduced to a single reading, for sinks that only store one value
+    return Measurement(
+      value       = self.mean,
+      dimension   = self.dimension,
+      unit        = self.unit,
+      sensor_name = self.sensor_name,
+      sensor_id   = self.sensor_id,
+      timestamp   = self.timestamp
+    )
+
+
+class Window:
+  # Preallocated buffer for one series, reused for every window once it has been summarized
+
+  __slots__ = ('values', 'count', 'opened', 'timestamp')
+
+  def __init__(self, size:int):
+    self.values    = np.empty(size, dtype=np.float64)
+    self.count     = 0
+    self.opened    = None
+    self.timestamp = None
+
+  def add(self, value:float, timestamp:datetime):
+    if self.count == 0:
+      self.opened = time.monotonic()
+    self.values[self.count] = value
+    self.count    += 1
+    self.timestamp = timestamp
+
+  @property
+  def full(self) -> bool:
+    return self.count == len(self.values)
+
+  @property
+  def age(self) -> float:
+    return time.monotonic() - self.opened if self.count else 0.0
+
+  def summarize(self, series:Tuple[str, str, str, str]) -> Aggregate:
+    sensor_name, sensor_id, dimension, unit = series
+    values    = self.values[:self.count]
+    aggregate = Aggregate(
+      mean        = float(values.mean()),
+      min         = float(values.min()),
+      max         = float(values.max()),
+      last        = float(values[-1]),
+      count       = self.count,
+      dimension   = dimension,
+      unit        = unit,
+      sensor_name = sensor_name,
+      sensor_id   = sensor_id,
+      timestamp   = self.timestamp
+    )
+    self.count = 0
+    return aggregate
+
+
+class Aggregator:
+
+  def __init__(self, windows:Optional[Dict[Union[str, Tuple[str, str]], int]]=None, max_age:float=60.0):
+    # windows maps a dimension, or a (sensor_name, dimension) pair that takes precedence over it,
+    # to the number of readings per window, other series pass through. A window is also closed
+    # once it is max_age seconds old, so slow series still report.
+    self.windows = windows or {}
+    self.max_age = max_age
+    self.series  : Dict[Tuple[str, str, str, str], Window] = {}
+
+  def add(self, measurement:Measurement) -> List[Union[Measurement, Aggregate]]:
+    size = self.windows.get((measurement.sensor_name, measurement.dimension), self.windows.get(measurement.dimension))
+    if not size:
+      return [measurement]
+
+    key    = (measurement.sensor_name, measurement.sensor_id, measurement.dimension, measurement.unit)
+    window = self.series.get(key)
+    if window is None:
+      window = self.series[key] = Window(size)
+
+    window.add(measurement.value, measurement.timestamp)
+    metrics.increment('aggregator.readings', dimension=measurement.dimension)
+
+    if window.full or window.age >= self.max_age:
+      metrics.increment('aggregator.aggregates', dimension=measurement.dimension)
+      return [window.summarize(key)]
+    return []
+
+  def flush(self) -> List[Aggregate]:
+    # Summarizes every partially filled window, e.g. before shutting down
+    return [window.summarize(key) for key, window in self.series.items() if window.count]
@@ -0,0 +1,72 @@
+import math
+import time
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from loguru import logger
+from sensors.base import Measurement
+from aggregator import Aggregate
+from metrics import metrics
+
+aligner_log = logger.bind(tags=['aligner'])
+
+
+@dataclass(slots=True)
+class Sample:
+  # Everything one sensor reported in one tick, keyed by dimension, each stamped with the tick
+  sensor_name : str
+  sensor_id   : str
+  timestamp   : datetime
+  items       : Dict[str, Union[Measurement, Aggregate]] = field(default_factory=dict)
+
+
+class Aligner:
+
+  def __init__(
+    self,
+    tick  : float               = 1.0,
+    grace : Optional[float]     = None,
+    clock : Callable[[], float] = time.time
+  ):
+    # Snaps readings to the start of their tick and groups those from one sensor, so they can be
+    # sent as a single point. A sample is closed when the sensor reports for a later tick, or
+    # grace seconds (one tick by default) after its own tick has ended.
+    self.tick    = tick
+    self.grace   = tick if grace is None else grace
+    self.clock   = clock
+    self.samples : Dict[Tuple[str, str], Sample] = {}
+
+  def snap(self, timestamp:datetime) -> datetime:
+    return datetime.fromtimestamp(math.floor(timestamp.timestamp() / self.tick) * self.tick)
+
+  def add(self, item:Union[Measurement, Aggregate]) -> List[Sample]:
+    # Returns the samples that closed, oldest first
+    closed = self.expire()
+    key    = (item.sensor_name, item.sensor_id)
+    tick   = self.snap(item.timestamp)
+    sample = self.samples.get(key)
+
+    if sample is not None and sample.timestamp != tick:
+      closed.append(self.close(key))
+      sample = None
+    if sample is None:
+      sample = self.samples[key] = Sample(item.sensor_name, item.sensor_id, tick)
+
+    if item.dimension in sample.items:
+      # A sensor read faster than the tick keeps its latest reading
+      metrics.increment('aligner.replaced', dimension=item.dimension)
+      aligner_log.trace(f'Replaced {item.sensor_name} {item.dimension} in its tick', value=item.value)
+    sample.items[item.dimension] = replace(item, timestamp=tick)
+    return closed
+
+  def expire(self) -> List[Sample]:
+    deadline = self.clock() - self.tick - self.grace
+    return [self.close(key) for key, sample in list(self.samples.items()) if sample.timestamp.timestamp() <= deadline]
+
+  def close(self, key:Tuple[str, str]) -> Sample:
+    metrics.increment('aligner.samples')
+    return self.samples.pop(key)
+
+  def flush(self) -> List[Sample]:
+    # Closes every open sample, e.g. before shutting down
+    return [self.close(key) for key in list(self.samples)]
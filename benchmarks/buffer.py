@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# Compares the SQLite and segment buffer backends on insert rate, drain rate and bytes written.
+# Run from the repository root: python -m benchmarks.buffer --rows 100000 --batch 10
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import psutil
+from datetime import datetime, timedelta
+from sensors.base import Measurement
+from clients import MeasurementBuffer, SegmentBuffer
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(description='Compare buffer backends')
+  parser.add_argument('--rows',    type=int, default=100_000, help='Readings to insert and drain')
+  parser.add_argument('--batch',   type=int, default=10,      help='Readings per insert, as committed by GroupCommitWriter')
+  parser.add_argument('--chunk',   type=int, default=500,     help='Readings per drained chunk')
+  parser.add_argument('--probes',  type=int, default=4,       help='Distinct series')
+  parser.add_argument('--sync',    action='store_true',       help='fsync every commit (synchronous=FULL for SQLite)')
+  parser.add_argument('--dir',     default=None,              help='Directory to run in, e.g. on the SD card (default: a temporary one)')
+  return parser.parse_args()
+
+
+def written() -> int:
+  # Bytes handed to write() by this process, whether or not they have reached the disk yet
+  return psutil.Process().io_counters().write_chars
+
+
+def size(path:str) -> int:
+  if os.path.isfile(path):
+    return os.path.getsize(path)
+  return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def run(name:str, buffer, path:str, readings, args):
+  before  = written()
+  started = time.perf_counter()
+  for i in range(0, len(readings), args.batch):
+    buffer.insert_many(readings[i:i + args.batch])
+  insert_seconds = time.perf_counter() - started
+  insert_bytes   = written() - before
+  peak           = size(path)
+
+  before  = written()
+  started = time.perf_counter()
+  drained = 0
+  for ids, batch in buffer.iter_pending(chunk_size=args.chunk):
+    drained += len(batch)
+    buffer.acknowledge(ids)
+  drain_seconds = time.perf_counter() - started
+  drain_bytes   = written() - before
+  buffer.close()
+
+  print(f'{name}')
+  print(f'  insert  {len(readings) / insert_seconds:>10,.0f} rows/s  {insert_bytes / len(readings):>7.1f} bytes written per row')
+  print(f'  drain   {drained / drain_seconds:>10,.0f} rows/s  {drain_bytes / max(drained, 1):>7.1f} bytes written per row')
+  print(f'  on disk {peak / len(readings):>10.1f} bytes per row at peak, {size(path):,} bytes after draining')
+
+
+def main():
+  args      = parse_args()
+  directory = tempfile.mkdtemp(dir=args.dir)
+  start     = datetime(2025, 1, 1)
+  readings  = [
+    Measurement(36.6 + (i % 100) / 100, 'temperature', 'degree_Celsius', 'DS18B20', f'28-{i % args.probes:012x}', start + timedelta(seconds=i))
+    for i in range(args.rows)
+  ]
+  try:
+    # The database sits in its own directory so the WAL is counted too
+    path = os.path.join(directory, 'sqlite')
+    run('sqlite', MeasurementBuffer(
+      db_path     = os.path.join(path, 'buffer.db'),
+      max_size    = args.rows,
+      synchronous = 'FULL' if args.sync else 'NORMAL'
+    ), path, readings, args)
+
+    path = os.path.join(directory, 'segments')
+    run('segment', SegmentBuffer(
+      directory = path,
+      max_size  = args.rows,
+      sync      = args.sync
+    ), path, readings, args)
+  finally:
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+  main()
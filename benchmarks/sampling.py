@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# Drives the real Sampler, MeasurementBuffer and (optionally) InfluxClient with simulated sensors.
+# Run from the repository root: python -m benchmarks.sampling --speed 100 --seconds 10
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from loguru import logger
+from sensors import Simulation, SimulatedDS18B20, SimulatedSHT41, SimulatedSI7021, SimulatedRaspberryPi
+from sampler import Sampler
+from clients import InfluxClient, MeasurementBuffer
+from metrics import metrics
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(description='Load test the sampling path with simulated sensors')
+  parser.add_argument('--speed',        type=float, default=100.0, help='Simulated seconds per real second')
+  parser.add_argument('--seconds',      type=float, default=10.0,  help='Real seconds to run for')
+  parser.add_argument('--probes',       type=int,   default=4,     help='DS18B20 probes on the simulated bus')
+  parser.add_argument('--latency',      type=float, default=0.0,   help='Extra simulated seconds per read')
+  parser.add_argument('--failure-rate', type=float, default=0.01,  help='Share of reads that fail')
+  parser.add_argument('--influx',       action='store_true',       help='Also write to the InfluxDB in INFLUX_* variables')
+  return parser.parse_args()
+
+
+async def run(args):
+  simulation = Simulation(speed=args.speed, latency=args.latency, failure_rate=args.failure_rate, seed=1)
+  sampler    = Sampler(
+    sensors    = [
+      SimulatedDS18B20(simulation, count=args.probes),
+      SimulatedSHT41(simulation),
+      SimulatedSI7021(simulation),
+      SimulatedRaspberryPi(simulation)
+    ],
+    dimensions = ['temperature', 'relative_humidity', 'cpu_load', 'cpu_temp', 'memory_usage', 'disk_usage']
+  )
+
+  directory = tempfile.mkdtemp()
+  buffer    = MeasurementBuffer(db_path=os.path.join(directory, 'benchmark.db'), max_size=10_000_000)
+  influx    = None
+  if args.influx:
+    influx = InfluxClient(
+      url    = os.getenv('INFLUX_URL'),
+      token  = os.getenv('INFLUX_TOKEN'),
+      org    = os.getenv('INFLUX_ORG'),
+      bucket = os.getenv('INFLUX_BUCKET'),
+      buffer = buffer
+    )
+
+  count       = 0
+  insert_time = 0.0
+  started     = time.perf_counter()
+  async for measurement in sampler.run():
+    count += 1
+    t = time.perf_counter()
+    if influx:
+      influx.insert_measurement(measurement)
+    else:
+      buffer.insert(measurement)
+    insert_time += time.perf_counter() - t
+    if t - started >= args.seconds:
+      break
+
+  elapsed = time.perf_counter() - started
+  print(f'Readings:        {count} in {elapsed:.1f}s ({count / elapsed:.1f}/s, {args.speed:g}x real time)')
+  print(f'Insert time:     {1000 * insert_time / max(count, 1):.3f} ms per reading')
+  print(f'Buffered rows:   {buffer.length}')
+  print(f'Skipped (busy):  {sum(metrics.counter("sampler.skipped", sensor=s.name) for s in sampler.sensors):.0f}')
+  for name, tags, fields in metrics.snapshot():
+    if name == 'executor.seconds':
+      print(f'Executor {tags["measurable"]:<32} mean {1000 * fields["mean"]:.2f} ms, max {1000 * fields["max"]:.2f} ms')
+
+
+if __name__ == '__main__':
+  logger.remove()
+  logger.add(sys.stderr, level='WARNING')
+  asyncio.run(run(parse_args()))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# Compares write precisions and gzip levels on request body bytes and CPU per 1,000 points.
+# Run from the repository root: python -m benchmarks.uplink --points 100000 --batch 500
+import gzip
+import time
+import argparse
+from datetime import datetime, timedelta
+from sensors.base import Measurement
+from sensors.batch import MeasurementBatch
+from clients.line_protocol import LineEncoder, PRECISIONS
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(description='Compare uplink precision and compression settings')
+  parser.add_argument('--points', type=int,   default=100_000,      help='Points to encode')
+  parser.add_argument('--batch',  type=int,   default=500,          help='Points per request, as AsyncInfluxClient batch_size')
+  parser.add_argument('--probes', type=int,   default=4,            help='Distinct series')
+  parser.add_argument('--period', type=float, default=1.0,          help='Seconds between readings of a series')
+  parser.add_argument('--repeat', type=int,   default=3,            help='Runs per setting, the fastest is reported')
+  parser.add_argument('--levels', type=int,   nargs='+',            default=[0, 1, 3, 6, 9], help='gzip levels, 0 for none')
+  return parser.parse_args()
+
+
+def run(batches, precision:str, level:int):
+  encoder = LineEncoder(precision)
+  size    = 0
+  started = time.process_time()
+  for batch in batches:
+    body = encoder.encode(batch)
+    if level:
+      body = gzip.compress(body, level)
+    size += len(body)
+  return size, time.process_time() - started
+
+
+def main():
+  args  = parse_args()
+  start = datetime(2025, 1, 1)
+  readings = [
+    Measurement(
+      round(36.6 + (i % 100) / 100 + (i % 7) / 1000, 3), 'temperature', 'degree_Celsius', 'DS18B20',
+      f'28-{i % args.probes:012x}', start + timedelta(seconds=(i // args.probes) * args.period, microseconds=(i % args.probes) * 93_750)
+    )
+    for i in range(args.points)
+  ]
+  batches = [MeasurementBatch.from_measurements(readings[i:i + args.batch]) for i in range(0, len(readings), args.batch)]
+
+  per = 1000 / args.points
+  print(f'{args.points:,} points in requests of {args.batch}')
+  print(f'{"precision":>9} {"gzip":>4} {"bytes/1k points":>16} {"cpu ms/1k points":>17}')
+  for precision in PRECISIONS:
+    for level in args.levels:
+      size, seconds = min(run(batches, precision, level) for _ in range(args.repeat))
+      print(f'{precision:>9} {level or "-":>4} {size * per:>16,.0f} {seconds * 1000 * per:>17.2f}')
+
+
+if __name__ == '__main__':
+  main()
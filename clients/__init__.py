@@ -1,7 +1,17 @@
 from .influx import InfluxClient
+from .influx_async import AsyncInfluxClient
 from .buffer import MeasurementBuffer
+from .segment import SegmentBuffer
+from .writer import GroupCommitWriter
+from .drain import BufferDrain
+from .line_protocol import LineEncoder
 
 __ALL__ = [
   InfluxClient,
-  MeasurementBuffer
+  AsyncInfluxClient,
+  MeasurementBuffer,
+  SegmentBuffer,
+  GroupCommitWriter,
+  BufferDrain,
+  LineEncoder
 ]
\ No newline at end of file
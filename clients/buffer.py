@@ -1,148 +1,533 @@
 # clients/buffer.py
 import os
-import time
 import json
+import time
 import sqlite3
-from dataclasses import asdict, is_dataclass
-from typing import List, Optional, Tuple
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 from datetime import datetime
 from dotenv import load_dotenv
 from sensors.base import Measurement
+from sensors.batch import MeasurementBatch, StringTable, timestamp_ns, from_timestamp_ns
+from aggregator import Aggregate
+from metrics import metrics
+
+
+# Version 1 kept each row as JSON text, version 2 typed columns and a series table,
+# version 3 dropped the processed flag as acknowledged rows are deleted straight away, and
+# version 4 added the columns of rows that summarize a window
+SCHEMA_VERSION = 4
+
+
+# Kept as constants so sqlite3's per-connection statement cache reuses the compiled statements
+INSERT_SERIES      = '''
+  INSERT INTO series (sensor_name, sensor_id, dimension, unit)
+  VALUES (?, ?, ?, ?)
+'''
+SELECT_SERIES      = 'SELECT id, sensor_name, sensor_id, dimension, unit FROM series'
+CREATE_SERIES      = '''
+  CREATE TABLE IF NOT EXISTS series (
+    id          INTEGER PRIMARY KEY,
+    sensor_name TEXT    NOT NULL,
+    sensor_id   TEXT    NOT NULL,
+    dimension   TEXT    NOT NULL,
+    unit        TEXT    NOT NULL,
+    UNIQUE (sensor_name, sensor_id, dimension, unit)
+  )
+'''
+INSERT_MEASUREMENT = '''
+  INSERT INTO measurements (timestamp, value, series_id, minimum, maximum, latest, count)
+  VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+COUNT_MEASUREMENTS = 'SELECT COUNT(*) FROM measurements'
+DROP_OLDEST        = '''
+  DELETE FROM measurements WHERE id IN (
+    SELECT id FROM measurements
+    ORDER BY id ASC LIMIT ?
+  )
+'''
+# Every other row of each series in the oldest span, as rows of different series are interleaved
+DOWNSAMPLE_OLDEST  = '''
+  DELETE FROM measurements WHERE id IN (
+    SELECT id FROM (
+      SELECT id, ROW_NUMBER() OVER (PARTITION BY series_id ORDER BY id) AS n FROM (
+        SELECT id, series_id FROM measurements
+        ORDER BY id ASC LIMIT ?
+      )
+    )
+    WHERE n % 2 = 0
+  )
+'''
+SELECT_PENDING     = '''
+  SELECT id, timestamp, value, series_id, minimum, maximum, latest, count FROM measurements
+  ORDER BY id ASC LIMIT ?
+'''
+SELECT_AFTER       = '''
+  SELECT id, timestamp, value, series_id, minimum, maximum, latest, count FROM measurements
+  WHERE id > ?
+  ORDER BY id ASC LIMIT ?
+'''
+OLDEST_UNCOMPACTED = '''
+  SELECT MIN(timestamp) FROM measurements
+  WHERE resolution < ? AND timestamp >= ? AND timestamp < ? AND id > ?
+'''
+# Raw rows have no minimum, maximum or latest of their own, so their value stands in. The
+# latest of a bucket comes from its row with the highest timestamp. Each aggregate takes the
+# lowest id of its bucket, so it is replayed where its oldest row was and a chunk range that
+# covered that row still covers it. Buckets with a row the drain has read but not yet
+# acknowledged are left for later.
+COMPACT            = '''
+  SELECT
+    MIN(id),
+    bucket * :step,
+    SUM(value * count) / SUM(count),
+    series_id,
+    MIN(COALESCE(minimum, value)),
+    MAX(COALESCE(maximum, value)),
+    MAX(CASE WHEN n = 1 THEN COALESCE(latest, value) END),
+    SUM(count),
+    :resolution
+  FROM (
+    SELECT *, timestamp / :step AS bucket, ROW_NUMBER() OVER (
+      PARTITION BY series_id, timestamp / :step ORDER BY timestamp DESC, id DESC
+    ) AS n
+    FROM measurements
+    WHERE resolution < :resolution AND timestamp >= :start AND timestamp < :end
+  )
+  GROUP BY series_id, bucket
+  HAVING MIN(id) > :leased
+'''
+DELETE_COMPACTED   = '''
+  DELETE FROM measurements
+  WHERE resolution < ? AND series_id = ? AND timestamp >= ? AND timestamp < ?
+'''
+INSERT_COMPACTED   = '''
+  INSERT INTO measurements (id, timestamp, value, series_id, minimum, maximum, latest, count, resolution)
+  VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+ACKNOWLEDGE        = '''
+  DELETE FROM measurements
+  WHERE id BETWEEN ? AND ?
+'''
+
+
+# Summary columns of a row that is a single reading
+RAW = (None, None, None, 1)
+
+
+# What to do once unsent rows alone exceed max_size
+OVERFLOW_POLICIES = ('drop_oldest', 'downsample', 'refuse')
+
 
 class MeasurementBuffer:
-  
-  def __init__(self, db_path='measurement_buffer.db', max_size=10000):
-    self.type     = Measurement
-    self.db_path  = db_path
-    self.max_size = max_size
+
+  def __init__(
+    self,
+    db_path      : str = 'measurement_buffer.db',
+    max_size     : int = 10000,
+    synchronous  : str = 'NORMAL',
+    cache_size   : int = -2000,
+    rotate_chunk : int = 100,
+    overflow     : str = 'drop_oldest',
+    tiers        : Optional[Sequence[Tuple[float, float]]] = None,
+    clock        : Callable[[], float] = time.time
+  ):
+    if overflow not in OVERFLOW_POLICIES:
+      raise ValueError(f'overflow must be one of {OVERFLOW_POLICIES}, not {overflow}')
+    
+    self.type         = Measurement
+    self.db_path      = db_path
+    self.max_size     = max_size
+    self.synchronous  = synchronous
+    self.cache_size   = cache_size
+    self.rotate_chunk = rotate_chunk
+    self.overflow     = overflow
+    self.clock        = clock
     
+    # Retention tiers as (age, resolution) in seconds: unsent rows older than age are compacted
+    # into one row per series and resolution-wide bucket, e.g. [(3600, 60), (86400, 3600)]
+    self.tiers = sorted(tiers or [], key=lambda tier: tier[1])
+    
+    # Every row in the table is unsent. They are counted in memory, and only counted
+    # from the table once, at startup
+    self.pending_count = 0
+
+    # The highest id iter_pending has handed out that is not acknowledged yet. Compaction leaves
+    # those rows alone, so the ids of a chunk being written still name the rows it holds.
+    self.leased = 0
+
+    # The series table is small and only grows, so it is mirrored in both directions in memory
+    self.series_ids : Dict[Tuple[str, str, str, str], int] = {}
+    self.series     : Dict[int, Tuple[str, str, str, str]] = {}
+
     # Ensure the database directory exists
     os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
-    
+
+    # One connection for the life of the buffer, shared by the event loop and the
+    # Influx batching thread, so every use goes through the lock
+    self.lock = threading.RLock()
+    self.conn = self.connect()
+
     # Initialize the database
     self.initialize_db()
-  
+
+  def connect(self) -> sqlite3.Connection:
+    conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=64)
+    # WAL appends to a log instead of rewriting the journal on every commit, and with
+    # synchronous=NORMAL it only fsyncs at checkpoints, which spares the SD card
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+    conn.execute(f'PRAGMA cache_size = {int(self.cache_size)}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+  def close(self):
+    with self.lock:
+      self.conn.close()
+
   def initialize_db(self):
-    # Creates a table and index if either does not exist
+    # Creates the tables, or brings an older database up to SCHEMA_VERSION
     try:
-      with sqlite3.connect(self.db_path) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-          CREATE TABLE IF NOT EXISTS measurements (
-            id         INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp  REAL    NOT NULL,
-            processed  INTEGER DEFAULT 0,
-            data       TEXT    NOT NULL
-          )            
-        ''')
+      with self.lock:
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(measurements)')]
+        if version == 0 and 'data' in columns:
+          # Databases from before the schema was versioned
+          version = 1
+        
+        if version == 0:
+          with self.conn as conn:
+            self.create_tables(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        elif version < SCHEMA_VERSION:
+          for target in range(version + 1, SCHEMA_VERSION + 1):
+            self.migrate(target)
+          # Hands the space freed by the migration back to the file system
+          self.conn.execute('VACUUM')
+        
+        for series_id, *key in self.conn.execute(SELECT_SERIES):
+          self.series_ids[tuple(key)] = series_id
+          self.series[series_id]      = tuple(key)
         
-        cursor.execute('''
-          CREATE INDEX IF NOT EXISTS idx_processed ON measurements(processed)
-        ''')
-        conn.commit()
+        self.pending_count = self.conn.execute(COUNT_MEASUREMENTS).fetchone()[0]
     except Exception as e:
       print(f"Error initializing database: {e}")
 
-  def serialize(self, measurement:Measurement):
-    # Converts a Measurement into a string
-    measurement_dict = asdict(measurement)
-    for k, v in measurement_dict.items():
-      if isinstance(v, datetime):
-        measurement_dict[k] = v.isoformat()
-    return json.dumps(measurement_dict)
-  
-  def deserialize(self, string:str):
-    # Converts a string into a Measurement
-    string_dict = json.loads(string)
-    for k, v in string_dict.items():
-      if k == 'timestamp' and isinstance(v, str):
-        string_dict[k] = datetime.fromisoformat(v)
-    return self.type(**string_dict)
-  
-  def insert(self, measurement):
+  def create_tables(self, cursor:sqlite3.Cursor):
+    # One row per sensor, dimension and unit combination, referenced by every measurement of it
+    cursor.execute(CREATE_SERIES)
+    
+    # timestamp is when the measurement was taken, in nanoseconds since the epoch. Rows compacted
+    # into a bucket of resolution seconds hold the mean as value, the rest stay NULL for raw rows.
+    cursor.execute('''
+      CREATE TABLE IF NOT EXISTS measurements (
+        id         INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp  INTEGER NOT NULL,
+        value      REAL    NOT NULL,
+        series_id  INTEGER NOT NULL REFERENCES series(id),
+        minimum    REAL,
+        maximum    REAL,
+        latest     REAL,
+        count      INTEGER NOT NULL DEFAULT 1,
+        resolution INTEGER NOT NULL DEFAULT 0
+      )
+    ''')
+
+  def migrate(self, version:int):
+    # Each migration runs in its own transaction, so a failed one leaves the database as it was
+    self.conn.execute('BEGIN')
     try:
-      with sqlite3.connect(self.db_path) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-          INSERT INTO measurements (timestamp, data, processed)
-          VALUES (?, ?, 0)
-        ''', (time.time(), self.serialize(measurement))
+      getattr(self, f'migrate_to_{version}')(self.conn.cursor())
+      self.conn.execute(f'PRAGMA user_version = {version}')
+      self.conn.commit()
+    except Exception:
+      self.conn.rollback()
+      raise
+
+  def migrate_to_2(self, cursor:sqlite3.Cursor):
+    # Moves the JSON rows into typed columns, keeping their ids and processed flags
+    cursor.execute('ALTER TABLE measurements RENAME TO measurements_json')
+    cursor.execute('DROP INDEX IF EXISTS idx_processed')
+    cursor.execute(CREATE_SERIES)
+    cursor.execute('''
+      CREATE TABLE measurements (
+        id         INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp  INTEGER NOT NULL,
+        value      REAL    NOT NULL,
+        series_id  INTEGER NOT NULL REFERENCES series(id),
+        processed  INTEGER DEFAULT 0
+      )
+    ''')
+    cursor.execute('CREATE INDEX idx_processed ON measurements(processed)')
+    
+    series = {}
+    rows   = cursor.execute('SELECT id, processed, data FROM measurements_json ORDER BY id')
+    while chunk := rows.fetchmany(1000):
+      migrated = []
+      for row_id, processed, data in chunk:
+        d   = json.loads(data)
+        key = (d['sensor_name'], str(d['sensor_id']), d['dimension'], d['unit'])
+        if key not in series:
+          series[key] = self.conn.execute(INSERT_SERIES, key).lastrowid
+        timestamp = timestamp_ns(datetime.fromisoformat(d['timestamp']))
+        migrated.append((row_id, timestamp, d['value'], series[key], processed))
+      self.conn.executemany('''
+        INSERT INTO measurements (id, timestamp, value, series_id, processed)
+        VALUES (?, ?, ?, ?, ?)
+      ''', migrated)
+    
+    # Carries the id sequence over, so ids of rows deleted before the migration are not reused
+    cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'measurements'")
+    cursor.execute("UPDATE sqlite_sequence SET name = 'measurements' WHERE name = 'measurements_json'")
+    cursor.execute('DROP TABLE measurements_json')
+
+  def migrate_to_3(self, cursor:sqlite3.Cursor):
+    # Processed rows were only kept until the next delete_processed
+    cursor.execute('DELETE FROM measurements WHERE processed = 1')
+    cursor.execute('DROP INDEX IF EXISTS idx_processed')
+    cursor.execute('ALTER TABLE measurements DROP COLUMN processed')
+
+  def migrate_to_4(self, cursor:sqlite3.Cursor):
+    cursor.execute('ALTER TABLE measurements ADD COLUMN minimum REAL')
+    cursor.execute('ALTER TABLE measurements ADD COLUMN maximum REAL')
+    cursor.execute('ALTER TABLE measurements ADD COLUMN latest REAL')
+    cursor.execute('ALTER TABLE measurements ADD COLUMN count INTEGER NOT NULL DEFAULT 1')
+    cursor.execute('ALTER TABLE measurements ADD COLUMN resolution INTEGER NOT NULL DEFAULT 0')
+
+  def encode(
+    self, 
+    cursor       : sqlite3.Cursor, 
+    measurements : Union[List[Union[Measurement, Aggregate]], MeasurementBatch], 
+    added        : Dict[Tuple[str, str, str, str], int]
+  ) -> List[Tuple[int, float, int, Optional[float], Optional[float], Optional[float], int]]:
+    # Turns measurements into (timestamp, value, series_id, minimum, maximum, latest, count) rows.
+    # Series seen for the first time are inserted with the rows and collected in added, to be
+    # cached once the transaction commits.
+    if isinstance(measurements, MeasurementBatch):
+      summaries = measurements.summaries
+      readings  = (
+        (timestamp, value, (sensor_name, str(sensor_id), dimension, unit), summaries.get(i, RAW))
+        for i, (value, timestamp, dimension, unit, sensor_name, sensor_id) in enumerate(measurements.rows())
+      )
+    else:
+      readings = (
+        (
+          timestamp_ns(m.timestamp), 
+          m.value, 
+          (m.sensor_name, str(m.sensor_id), m.dimension, m.unit), 
+          (m.min, m.max, m.last, m.count) if isinstance(m, Aggregate) else RAW
         )
+        for m in measurements
+      )
+    
+    rows = []
+    for timestamp, value, key, summary in readings:
+      series_id = self.series_ids.get(key)
+      if series_id is None:
+        series_id = added.get(key)
+      if series_id is None:
+        series_id = added[key] = cursor.execute(INSERT_SERIES, key).lastrowid
+      rows.append((timestamp, value, series_id, *summary))
+    return rows
+
+  def decode(
+    self, 
+    timestamp : int, 
+    value     : float, 
+    series_id : int, 
+    minimum   : Optional[float] = None, 
+    maximum   : Optional[float] = None, 
+    latest    : Optional[float] = None, 
+    count     : int             = 1
+  ) -> Union[Measurement, Aggregate]:
+    sensor_name, sensor_id, dimension, unit = self.series[series_id]
+    if minimum is not None:
+      return Aggregate(
+        mean        = value,
+        min         = minimum,
+        max         = maximum,
+        last        = latest,
+        count       = count,
+        dimension   = dimension,
+        unit        = unit,
+        sensor_name = sensor_name,
+        sensor_id   = sensor_id,
+        timestamp   = from_timestamp_ns(timestamp)
+      )
+    return self.type(
+      value       = value,
+      dimension   = dimension,
+      unit        = unit,
+      sensor_name = sensor_name,
+      sensor_id   = sensor_id,
+      timestamp   = from_timestamp_ns(timestamp)
+    )
+
+  def rotate(self, cursor:sqlite3.Cursor, pending_count:int) -> int:
+    # Deletes rows in chunks of at least rotate_chunk once the table is over max_size, following
+    # the overflow policy. Returns how many rows were removed.
+    excess = pending_count - self.max_size
+    # With 'refuse' the insert was turned away before it got here
+    if excess <= 0 or self.overflow == 'refuse':
+      return 0
+    
+    chunk = max(excess, self.rotate_chunk)
+    if self.overflow == 'drop_oldest':
+      cursor.execute(DROP_OLDEST, (chunk,))
+    else:
+      # Halves the resolution of the oldest unsent rows instead of losing a whole span
+      cursor.execute(DOWNSAMPLE_OLDEST, (2 * chunk,))
+    metrics.increment('buffer.dropped', cursor.rowcount, policy=self.overflow)
+    return cursor.rowcount
+
+  def insert(self, measurement):
+    return self.insert_many([measurement])
+
+  def insert_many(self, measurements:Union[Iterable[Measurement], MeasurementBatch]):
+    # Inserts a whole sampling cycle or batch with one executemany in a single transaction
+    if not isinstance(measurements, MeasurementBatch):
+      measurements = list(measurements)
+    count = len(measurements)
+    if not count:
+      return True
+    
+    try:
+      with self.lock:
+        if self.overflow == 'refuse' and self.pending_count + count > self.max_size:
+          metrics.increment('buffer.refused', count)
+          return False
         
-        # Check if we need to rotate old processed records
-        cursor.execute('SELECT COUNT(*) FROM measurements')
-        count = cursor.fetchone()[0]
-        if count > self.max_size:
-          # Delete oldest processed records
-          cursor.execute(
-            'DELETE FROM measurements WHERE processed = 1 ORDER BY id ASC LIMIT ?', 
-            (count - self.max_size,)
-          )
-        conn.commit()
+        added = {}
+        with self.conn as conn:
+          cursor = conn.cursor()
+          cursor.executemany(INSERT_MEASUREMENT, self.encode(cursor, measurements, added))
+          removed = self.rotate(cursor, self.pending_count + count)
+        
+        # Only counted and cached once the transaction has committed
+        for key, series_id in added.items():
+          self.series_ids[key]   = series_id
+          self.series[series_id] = key
+        self.pending_count += count - removed
         return True
     except Exception as e:
-      print(f"Error inserting measurement: {e}")
+      print(f"Error inserting measurements: {e}")
       return False
-  
+
+  def insert_batch(self, batch:MeasurementBatch):
+    return self.insert_many(batch)
+
   def get_pending(self, limit:int=100):
     try:
-      with sqlite3.connect(self.db_path) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-          SELECT id, data FROM measurements 
-          WHERE processed = 0 
-          ORDER BY id ASC LIMIT ?
-        ''', (limit,)
-        )
-        results = []
-        for row_id, data in cursor.fetchall():
-          measurement = self.deserialize(data)
-          results.append((row_id, measurement))
-        return results
+      with self.lock:
+        rows = self.conn.execute(SELECT_PENDING, (limit,)).fetchall()
+        return [(row_id, self.decode(*row)) for row_id, *row in rows]
     except Exception as e:
       print(f"Error getting pending measurements: {e}")
       return []
-  
-  def mark_processed(self, measurement_id):
-    try:
-      with sqlite3.connect(self.db_path) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-          UPDATE measurements 
-          SET processed = 1
-          WHERE id = ? 
-        ''', (measurement_id,)
-        )
-        conn.commit()
-        return cursor.rowcount > 0
-    except Exception as e:
-      print(f"Error marking measurement as processed: {e}")
-      return False
-  
-  def delete_processed(self):
+
+  def iter_pending(self, chunk_size:int=500, after:int=0) -> Iterator[Tuple[range, MeasurementBatch]]:
+    # Streams unsent rows in id order, one chunk in memory at a time. Each page starts after the
+    # last id seen, so it is a seek on the primary key however far into the backlog it is, and
+    # rows acknowledged or inserted between chunks are picked up correctly. Yields the chunk's
+    # ids as a range, ready for acknowledge, with its rows as a MeasurementBatch, which only
+    # builds Measurements when iterated.
+    strings = StringTable()
+    while True:
+      try:
+        with self.lock:
+          rows = self.conn.execute(SELECT_AFTER, (after, chunk_size)).fetchall()
+          series = self.series
+          if rows:
+            self.leased = max(self.leased, rows[-1][0])
+      except Exception as e:
+        print(f"Error getting pending measurements: {e}")
+        return
+      if not rows:
+        return
+      
+      batch = MeasurementBatch(strings)
+      for _, timestamp, value, series_id, minimum, maximum, latest, count in rows:
+        sensor_name, sensor_id, dimension, unit = series[series_id]
+        summary = None if minimum is None else (minimum, maximum, latest, count)
+        batch.add(value, timestamp, dimension, unit, sensor_name, sensor_id, summary)
+      
+      first, after = rows[0][0], rows[-1][0]
+      yield range(first, after + 1), batch
+
+  def compact(self, max_buckets:int=60) -> int:
+    # One incremental step of retention: compacts the oldest unsent rows due for a coarser tier,
+    # at most max_buckets of that tier's buckets, in one short transaction so inserts and the
+    # drain are not held up. Only whole buckets are compacted, and a window whose buckets are all
+    # leased is stepped over. Returns how many rows it folded into aggregates, 0 once there is
+    # nothing left to do.
+    now = int(self.clock() * 1_000_000_000)
+    for age, resolution in self.tiers:
+      step   = int(resolution * 1_000_000_000)
+      cutoff = (now - int(age * 1_000_000_000)) // step * step
+      start  = 0
+      while start < cutoff:
+        try:
+          with self.lock:
+            oldest = self.conn.execute(OLDEST_UNCOMPACTED, (resolution, start, cutoff, self.leased)).fetchone()[0]
+            if oldest is None:
+              break
+            
+            start  = oldest // step * step
+            end    = min(cutoff, start + max_buckets * step)
+            params = dict(step=step, resolution=resolution, start=start, end=end, leased=self.leased)
+            with self.conn as conn:
+              aggregates = conn.execute(COMPACT, params).fetchall()
+              buckets    = [(resolution, series_id, timestamp, timestamp + step) for _, timestamp, _, series_id, *_ in aggregates]
+              # The bucket's rows are deleted first, as its aggregate reuses the lowest of their ids
+              deleted    = conn.executemany(DELETE_COMPACTED, buckets).rowcount if buckets else 0
+              conn.executemany(INSERT_COMPACTED, aggregates)
+            self.pending_count += len(aggregates) - deleted
+        except Exception as e:
+          print(f"Error compacting measurements: {e}")
+          return 0
+        
+        if deleted:
+          metrics.increment('buffer.compacted', deleted, resolution=resolution)
+          return deleted
+        start = end
+    return 0
+
+  def release(self):
+    # Gives up the lease on rows read by iter_pending, once their write has failed
+    with self.lock:
+      self.leased = 0
+
+  def acknowledge(self, ids:Union[range, Iterable[int]]) -> int:
+    # Deletes acknowledged rows in one transaction, a DELETE per run of consecutive ids. A range
+    # can span ids that are already gone, so a drained chunk is acknowledged with
+    # range(first_id, last_id + 1). Returns how many rows were deleted.
+    if isinstance(ids, range) and ids.step == 1:
+      runs = [(ids.start, ids.stop - 1)] if ids else []
+    else:
+      runs = []
+      for i in sorted(set(ids)):
+        if runs and i == runs[-1][1] + 1:
+          runs[-1][1] = i
+        else:
+          runs.append([i, i])
+    if not runs:
+      return 0
+    
     try:
-      with sqlite3.connect(self.db_path) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-          DELETE FROM measurements 
-          WHERE processed = 1
-        ''')
-        conn.commit()
+      with self.lock:
+        with self.conn as conn:
+          cursor = conn.executemany(ACKNOWLEDGE, runs)
+        self.pending_count -= cursor.rowcount
+        if runs[-1][1] >= self.leased:
+          self.leased = 0
         return cursor.rowcount
     except Exception as e:
-      print(f"Error deleting processed measurements: {e}")
+      print(f"Error acknowledging measurements: {e}")
       return 0
-    
+
+  def mark_processed(self, measurement_id):
+    return self.acknowledge([measurement_id]) > 0
+
   @property
   def length(self):
-    try:
-      with sqlite3.connect(self.db_path) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-          SELECT COUNT(*) FROM measurements
-          WHERE processed = 0 
-        ''')
-        return cursor.fetchone()[0]
-    except Exception as e:
-      print(f"Error getting buffer length: {e}")
-      return 0
\ No newline at end of file
+    return self.pending_count
@@ -0,0 +1,130 @@
+# clients/drain.py
+import time
+import asyncio
+import inspect
+from typing import Optional, Tuple
+from loguru import logger
+from sensors.batch import MeasurementBatch
+from metrics import metrics
+
+drain_log = logger.bind(tags=['drain'])
+
+
+class BufferDrain:
+  # Replays the buffered backlog to InfluxDB, oldest first, while the uplink is healthy.
+  #
+  # The chunk size adapts to how fast InfluxDB takes writes: it doubles while a write takes less
+  # than target_seconds and halves when it takes longer or fails. After each chunk the drain
+  # sleeps in proportion to how long the write took, so it only uses `share` of the uplink's
+  # time and live writes, which go through the client's own WriteAPI, are never stuck behind it.
+
+  def __init__(
+    self,
+    influx,
+    buffer,
+    min_batch      : int   = 100,
+    max_batch      : int   = 5_000,
+    target_seconds : float = 1.0,
+    share          : float = 0.5,
+    idle_seconds   : float = 5.0,
+    max_backoff    : float = 300.0
+  ):
+    if not 0 < share <= 1:
+      raise ValueError('share must be in (0, 1]')
+    self.influx         = influx
+    self.buffer         = buffer
+    self.min_batch      = min_batch
+    self.max_batch      = max_batch
+    self.target_seconds = target_seconds
+    self.share          = share
+    self.idle_seconds   = idle_seconds
+    self.max_backoff    = max_backoff
+
+    self.batch_size = min_batch
+    self.backoff    = idle_seconds
+    self.after      = 0
+    self.rate       = None
+
+  async def run(self):
+    # Supervises the drain: any error backs off and tries again, only cancellation stops it.
+    # Rows read by a drain that was stopped mid-write are no longer leased.
+    await asyncio.to_thread(self.buffer.release)
+    while True:
+      try:
+        if not await self.call(self.influx.ping):
+          await self.wait('InfluxDB is unreachable')
+          continue
+
+        drained = await self.step()
+        if drained is None:
+          await asyncio.sleep(self.idle_seconds)
+      except asyncio.CancelledError:
+        raise
+      except Exception as e:
+        metrics.increment('drain.errors')
+        self.batch_size = max(self.min_batch, self.batch_size // 2)
+        await self.wait(f'Error draining buffer: {e}')
+
+  async def call(self, method, *args):
+    # AsyncInfluxClient is awaited on the loop, InfluxClient blocks so runs in a thread
+    if inspect.iscoroutinefunction(method):
+      return await method(*args)
+    return await asyncio.to_thread(method, *args)
+
+  async def wait(self, reason:str):
+    # Passed as an argument, since loguru would str.format an error body such as {"code": ...}
+    drain_log.warning('{reason}', reason=reason, retry_in=self.backoff)
+    await asyncio.sleep(self.backoff)
+    self.backoff = min(self.max_backoff, 2 * self.backoff)
+
+  def read(self) -> Optional[Tuple[range, MeasurementBatch]]:
+    chunk = next(self.buffer.iter_pending(chunk_size=self.batch_size, after=self.after), None)
+    if chunk is None and self.after and self.buffer.length:
+      # Rows below the keyset cursor, e.g. after the buffer was reopened, start it over
+      self.after = 0
+      chunk = next(self.buffer.iter_pending(chunk_size=self.batch_size, after=self.after), None)
+    return chunk
+
+  async def step(self) -> Optional[int]:
+    # Writes and acknowledges one chunk. Returns how many rows were acknowledged, or None when
+    # there was nothing to drain.
+    chunk = await asyncio.to_thread(self.read)
+    if chunk is None:
+      self.report(0)
+      return None
+    ids, batch = chunk
+
+    started = time.monotonic()
+    try:
+      await self.call(self.influx.write_chunk, batch)
+    except Exception:
+      # The chunk is read again on the next attempt, compaction may fold it in meanwhile
+      await asyncio.to_thread(self.buffer.release)
+      raise
+    elapsed = time.monotonic() - started
+    drained = await asyncio.to_thread(self.buffer.acknowledge, ids)
+    self.after   = ids[-1]
+    self.backoff = self.idle_seconds
+
+    if elapsed < self.target_seconds and len(batch) >= self.batch_size:
+      self.batch_size = min(self.max_batch, 2 * self.batch_size)
+    elif elapsed > self.target_seconds:
+      self.batch_size = max(self.min_batch, self.batch_size // 2)
+
+    # Rows per second of wall time, averaged over the last few chunks
+    pause = elapsed * (1 - self.share) / self.share
+    rate  = len(batch) / max(elapsed + pause, 1e-6)
+    self.rate = rate if self.rate is None else 0.8 * self.rate + 0.2 * rate
+
+    metrics.increment('drain.rows', drained)
+    metrics.observe('drain.write_seconds', elapsed)
+    self.report(self.buffer.length)
+    await asyncio.sleep(pause)
+    return drained
+
+  def report(self, backlog:int):
+    metrics.gauge('drain.backlog', backlog)
+    metrics.gauge('drain.batch_size', self.batch_size)
+    if self.rate:
+      metrics.gauge('drain.rate', self.rate)
+      metrics.gauge('drain.eta_seconds', backlog / self.rate)
@@ -1,14 +1,19 @@
 # clients/influx.py
 import os
+import time
 import asyncio
+import threading
 from datetime import datetime
-from dataclasses import asdict
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
 from influxdb_client import InfluxDBClient, Point
-from influxdb_client.client.write_api import WriteOptions
+from influxdb_client.client.write_api import WriteOptions, SYNCHRONOUS
 from sensors.base import Measurement
+from sensors.batch import MeasurementBatch, timestamp_ns
+from aggregator import Aggregate
+from metrics import metrics
 from .buffer import MeasurementBuffer
+from .line_protocol import LineEncoder
 from loguru import logger
 
 
@@ -27,31 +32,50 @@ class InfluxClient:
     batch_size      : int = 500,
     flush_interval  : int = 1_000,
     jitter_interval : int = 2_000,
-    retry_interval  : int = 5_000  
+    retry_interval  : int = 5_000,
+    max_retries     : int = 5,
+    precision       : str = 'ns',
+    enable_gzip     : bool = False
   ):
-    self.url    = url
-    self.token  = token
-    self.org    = org
-    self.bucket = bucket
-    self.buffer = buffer 
+    self.url        = url
+    self.token      = token
+    self.org        = org
+    self.bucket     = bucket
+    self.buffer     = buffer 
+    self.batch_size = batch_size
     
     if not all([self.url, self.token, self.org, self.bucket]):
       influx_log.critical('Missing InfluxDB environment variables')
       raise ValueError("Missing InfluxDB environment variables")
     
-    self.client = InfluxDBClient(url=self.url, token=self.token, org=self.org)
+    # gzip here is the library's, always at level 9, AsyncInfluxClient lets the level be chosen
+    self.client = InfluxDBClient(url=self.url, token=self.token, org=self.org, enable_gzip=enable_gzip)
     influx_log.info(
       'Initialized InfluxDBClient', 
-      url = self.url, 
-      org = self.org
+      url         = self.url, 
+      org         = self.org,
+      precision   = precision,
+      enable_gzip = enable_gzip
     )
     
-    self.write_api = self.client.write_api(write_options=WriteOptions(
-      batch_size      = batch_size,
-      flush_interval  = flush_interval,
-      jitter_interval = jitter_interval,
-      retry_interval  = retry_interval
-    ))
+    # Lines queued on the batching WriteAPI, mapped to the rows they came from until their batch
+    # is written or given up on: line -> [row, copies queued, monotonic time queued]
+    self.inflight      = {}
+    self.inflight_lock = threading.Lock()
+    self.encoder       = LineEncoder(precision)
+    
+    self.write_api = self.client.write_api(
+      write_options    = WriteOptions(
+        batch_size      = batch_size,
+        flush_interval  = flush_interval,
+        jitter_interval = jitter_interval,
+        retry_interval  = retry_interval,
+        max_retries     = max_retries
+      ),
+      success_callback = self.on_success,
+      error_callback   = self.on_error,
+      retry_callback   = self.on_retry
+    )
     influx_log.info(
       'Initialized InfluxDB WriteAPI', 
       batch_size      = batch_size, 
@@ -60,66 +84,171 @@ class InfluxClient:
       retry_interval  = retry_interval
     )
     
+    # The backlog is replayed through its own blocking WriteAPI, so a chunk is only
+    # acknowledged once InfluxDB has accepted it, and never queues in front of live writes
+    self.drain_api = self.client.write_api(write_options=SYNCHRONOUS)
     
-  def create_point(self, measurement:Measurement) -> Point:
-    influx_log.trace('Creating point')
+  def ping(self) -> bool:
+    return self.client.ping()
     
-    data  = asdict(measurement)
-    point = Point(measurement.sensor_name)
+  def close(self):
+    # Flushes the batches still queued, so any that fail reach the buffer through on_error
+    self.write_api.close()
+    self.drain_api.close()
+    self.client.close()
     
-    if measurement.timestamp:
-      point.time(int(measurement.timestamp.timestamp() * 1_000_000_000))
-      
-    for t in ['dimension', 'unit', 'sensor_id']:
-      point.tag(t, getattr(measurement, t))
-      
-    point.field("value", measurement.value)
+  def track(self, lines:List[bytes], rows:List[Tuple]):
+    now = time.monotonic()
+    with self.inflight_lock:
+      for line, row in zip(lines, rows):
+        entry = self.inflight.get(line)
+        if entry:
+          entry[1] += 1
+        else:
+          self.inflight[line] = [row, 1, now]
+
+  def settle(self, data:bytes) -> Tuple[List[Tuple], Optional[float]]:
+    # Takes the lines of a finished batch out of flight. Returns their rows and when the
+    # oldest of them was queued. Lines that were not tracked, e.g. metrics, are skipped.
+    rows    = []
+    started = None
+    with self.inflight_lock:
+      for line in data.split(b'\n'):
+        entry = self.inflight.get(line)
+        if entry is None:
+          continue
+        entry[1] -= 1
+        if not entry[1]:
+          del self.inflight[line]
+        rows.append(entry[0])
+        started = entry[2] if started is None else min(started, entry[2])
+    return rows, started
+
+  def buffer_rows(self, rows:List[Tuple]):
+    # Rows are (value, timestamp, dimension, unit, sensor_name, sensor_id, summary), and all
+    # go to the buffer in one insert
+    batch = MeasurementBatch()
+    for row in rows:
+      batch.add(*row)
+    self.buffer.insert_batch(batch)
+
+  def on_success(self, conf:Tuple[str, str, str], data:bytes):
+    rows, started = self.settle(data)
+    metrics.increment('influx.batches', outcome='success')
+    metrics.increment('influx.points', len(rows), outcome='success')
+    if started is not None:
+      metrics.observe('influx.batch_seconds', time.monotonic() - started, outcome='success')
+
+  def on_error(self, conf:Tuple[str, str, str], data:bytes, exception:Exception):
+    # Called on the batching thread once a batch has failed for good
+    rows, started = self.settle(data)
+    metrics.increment('influx.batches', outcome='error')
+    metrics.increment('influx.points', len(rows), outcome='error')
+    if started is not None:
+      metrics.observe('influx.batch_seconds', time.monotonic() - started, outcome='error')
     
-    return point
+    influx_log.error(f'Error writing batch, buffering {len(rows)} measurements: {exception}')
+    if rows:
+      self.buffer_rows(rows)
+
+  def on_retry(self, conf:Tuple[str, str, str], data:bytes, exception:Exception):
+    metrics.increment('influx.retries')
+    influx_log.warning(f'Retrying batch: {exception}')
+
+  def write(self, lines:List[bytes], rows:List[Tuple]):
+    # Queues lines on the batching WriteAPI and returns straight away. A batch that fails later
+    # comes back through on_error, only a failure to queue is handled here.
+    if not self.write_api:
+      self.buffer_rows(rows)
+      return False
+    
+    self.track(lines, rows)
+    try:
+      self.write_api.write(bucket=self.bucket, record=lines, write_precision=self.encoder.precision)
+      return True
+    except Exception as e:
+      influx_log.error(f'Error queueing measurements: {e}')
+      self.settle(b'\n'.join(lines))
+      self.buffer_rows(rows)
+      return False
+
+  def insert_batch(self, batch:MeasurementBatch):
+    influx_log.trace('Inserting batch')
+    if not len(batch):
+      return True
+    rows = [(*row, batch.summaries.get(i)) for i, row in enumerate(batch.rows())]
+    return self.write(self.encoder.encode(batch).split(b'\n'), rows)
   
   def insert_measurement(self, measurement:Measurement):
     influx_log.trace('Inserting measurement')
-    if self.write_api:
-      try:
-        point = self.create_point(measurement)
-        self.write_api.write(bucket=self.bucket, record=point)
-        return True
-      except Exception as e:
-        print(e)
-        self.buffer.insert(measurement)
-    else:
-      self.buffer.insert(measurement)
+    m  = measurement
+    ts = timestamp_ns(m.timestamp) if m.timestamp else None
+    return self.write(
+      [self.encoder.measurement(m).encode()], 
+      [(m.value, ts, m.dimension, m.unit, m.sensor_name, m.sensor_id, None)]
+    )
+  
+  def insert_aggregate(self, aggregate:Aggregate):
+    influx_log.trace('Inserting aggregate')
+    a  = aggregate
+    ts = timestamp_ns(a.timestamp) if a.timestamp else None
+    return self.write(
+      [self.encoder.aggregate(a).encode()], 
+      [(a.mean, ts, a.dimension, a.unit, a.sensor_name, a.sensor_id, (a.min, a.max, a.last, a.count))]
+    )
   
   def insert_bias(self, bias, measurement):
     influx_log.trace('Inserting bias')
-    point = Point('Bias')
-    if measurement.timestamp:
-      point.time(int(measurement.timestamp.timestamp() * 1_000_000_000))
-    for t in ['dimension', 'unit', 'sensor_id']:
-      point.tag(t, getattr(measurement, t))
-    point.field("value", bias)
+    line = self.encoder.measurement(measurement, name='Bias', value=bias)
     
     if self.write_api:
       try:
-        self.write_api.write(bucket=self.bucket, record=point)
+        self.write_api.write(bucket=self.bucket, record=line.encode(), write_precision=self.encoder.precision)
         return True
       except Exception as e:
         logger.error(e)
 
-  def process_buffer(self, limit:int=100):
+  def insert_metrics(self, snapshot):
+    influx_log.trace('Inserting metrics')
+    now    = self.encoder.timestamp(int(datetime.now().timestamp() * 1_000_000_000))
+    points = []
+    for name, tags, fields in snapshot:
+      point = Point('Metrics').tag('metric', name).time(now, self.encoder.precision)
+      for k, v in tags.items():
+        point.tag(k, v)
+      for k, v in fields.items():
+        point.field(k, v)
+      points.append(point)
+    
+    if self.write_api and points:
+      try:
+        self.write_api.write(bucket=self.bucket, record=points)
+        return True
+      except Exception as e:
+        influx_log.error(f'Error inserting metrics: {e}')
+
+  def write_chunk(self, batch:MeasurementBatch):
+    # Raises if the write fails, so the caller knows not to acknowledge the chunk
+    self.drain_api.write(bucket=self.bucket, record=self.encoder.encode(batch), write_precision=self.encoder.precision)
+
+  def process_buffer(self, limit:Optional[int]=None) -> int:
     influx_log.trace(
       'Processing buffer', 
       buffer_length = self.buffer.length
     )
     
-    buffer_length = self.buffer.length
-    buffer_measurements = self.buffer.get_pending(limit=limit)
-    
-    for i, m in buffer_measurements:
+    # Replays the backlog in chunks of batch_size and acknowledges each once written. Stops
+    # at the first failed write, so rows are never acknowledged unwritten.
+    processed = 0
+    for ids, batch in self.buffer.iter_pending(chunk_size=self.batch_size):
       try:
-        point = self.create_point(m)
-        self.write_api.write(bucket=self.bucket, record=point)
-        self.buffer.mark_processed(i)
+        self.write_chunk(batch)
       except Exception as e:
-        influx_log.error(f'Error processing buffered measurement: {e}')
-        continue
\ No newline at end of file
+        influx_log.error(f'Error processing buffered measurements: {e}')
+        self.buffer.release()
+        break
+      
+      processed += self.buffer.acknowledge(ids)
+      if limit is not None and processed >= limit:
+        break
+    return processed
@@ -0,0 +1,295 @@
+# clients/influx_async.py
+import gzip
+import time
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Deque, List, Optional, Tuple
+from influxdb_client import Point, WriteService
+from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
+from sensors.base import Measurement
+from sensors.batch import MeasurementBatch, timestamp_ns
+from aggregator import Aggregate
+from aligner import Sample
+from metrics import metrics
+from .buffer import MeasurementBuffer
+from .line_protocol import LineEncoder
+from loguru import logger
+
+influx_log = logger.bind(tags=['influx'])
+
+
+class Batch:
+  # Lines waiting to be written together, the rows to buffer if they are not, and a future
+  # that resolves to whether they were written
+
+  def __init__(self):
+    self.lines   : List[bytes] = []
+    self.rows    : List[Tuple] = []
+    self.started = time.monotonic()
+    self.future  = asyncio.get_running_loop().create_future()
+
+  def __len__(self):
+    return len(self.lines)
+
+
+class AsyncInfluxClient:
+  # Writes to InfluxDB from the event loop over one keep-alive connection, without the
+  # threaded WriteAPI and its scheduler. Backlog chunks from BufferDrain go over a connection of
+  # their own, so live batches are never queued behind history on a slow uplink.
+  #
+  # Lines are batched in the loop and sent once batch_size are waiting or the oldest has
+  # waited flush_interval ms. Writers are held back while max_pending lines are queued or in
+  # flight. A batch that fails is not retried: its rows go to the buffer and BufferDrain
+  # replays them once InfluxDB is reachable again.
+  #
+  # Timestamps are written at `precision` (s, ms, us or ns) and request bodies are gzipped at
+  # gzip_level, 0 sending them uncompressed. When grouped, readings are written as one point per
+  # sensor and timestamp with a field per dimension, live and when the buffer is replayed.
+
+  def __init__(
+    self,
+    url             : str,
+    token           : str,
+    org             : str,
+    bucket          : str,
+    buffer          : MeasurementBuffer,
+    batch_size      : int = 500,
+    flush_interval  : int = 1_000,
+    max_pending     : int = 10_000,
+    timeout         : int = 10_000,
+    connections     : int = 1,
+    precision       : str  = 'ns',
+    gzip_level      : int  = 0,
+    grouped         : bool = False
+  ):
+    self.url            = url
+    self.token          = token
+    self.org            = org
+    self.bucket         = bucket
+    self.buffer         = buffer
+    self.batch_size     = batch_size
+    self.flush_interval = flush_interval
+    self.max_pending    = max_pending
+    self.timeout        = timeout
+    self.connections    = connections
+    self.gzip_level     = gzip_level
+
+    if not all([self.url, self.token, self.org, self.bucket]):
+      influx_log.critical('Missing InfluxDB environment variables')
+      raise ValueError("Missing InfluxDB environment variables")
+
+    self.encoder   = LineEncoder(precision, grouped)
+    self.client    = None
+    self.service   = None
+    self.drain     = None
+    self.backlog   = None
+    self.task      = None
+    self.batches   : Deque[Batch] = deque()
+    self.queued    = 0
+    self.closing   = False
+    self.wakeup    = asyncio.Event()
+    self.space     = asyncio.Condition()
+
+  async def start(self):
+    # The async client has to be created inside the running loop
+    self.client = InfluxDBClientAsync(
+      url                     = self.url,
+      token                   = self.token,
+      org                     = self.org,
+      timeout                 = self.timeout,
+      connection_pool_maxsize = self.connections
+    )
+    self.service = WriteService(self.client.api_client)
+    self.drain   = InfluxDBClientAsync(
+      url                     = self.url,
+      token                   = self.token,
+      org                     = self.org,
+      timeout                 = self.timeout,
+      connection_pool_maxsize = 1
+    )
+    self.backlog = WriteService(self.drain.api_client)
+    self.task    = asyncio.create_task(self.run())
+    influx_log.info(
+      'Initialized InfluxDBClientAsync',
+      url            = self.url,
+      org            = self.org,
+      batch_size     = self.batch_size,
+      flush_interval = self.flush_interval,
+      precision      = self.encoder.precision,
+      gzip_level     = self.gzip_level
+    )
+    return self
+
+  async def close(self):
+    # Sends everything still queued, failures going to the buffer as usual
+    self.closing = True
+    self.wakeup.set()
+    if self.task:
+      await self.task
+      self.task = None
+    if self.client:
+      await self.client.close()
+      self.client = None
+    if self.drain:
+      await self.drain.close()
+      self.drain = None
+
+  async def __aenter__(self):
+    return await self.start()
+
+  async def __aexit__(self, exc_type, exc, tb):
+    await self.close()
+
+  async def ping(self) -> bool:
+    return await self.client.ping()
+
+  async def run(self):
+    while True:
+      if not self.batches:
+        if self.closing:
+          return
+        self.wakeup.clear()
+        await self.wakeup.wait()
+        continue
+
+      batch = self.batches[0]
+      ready = self.closing or len(self.batches) > 1 or len(batch) >= self.batch_size
+      wait  = batch.started + self.flush_interval / 1000 - time.monotonic()
+      if not ready and wait > 0:
+        self.wakeup.clear()
+        try:
+          await asyncio.wait_for(self.wakeup.wait(), wait)
+        except asyncio.TimeoutError:
+          pass
+        continue
+
+      self.batches.popleft()
+      await self.send(batch)
+
+  async def post(self, body:bytes, service:Optional[WriteService]=None):
+    # Compressed here rather than with the library's enable_gzip, which is fixed at level 9.
+    # Raises unless InfluxDB accepted the whole body.
+    options = {}
+    if self.gzip_level:
+      body = await asyncio.to_thread(gzip.compress, body, self.gzip_level)
+      options['content_encoding'] = 'gzip'
+    metrics.increment('influx.bytes', len(body))
+    _, status, _ = await (service or self.service).post_write_async(
+      org                    = self.org,
+      bucket                 = self.bucket,
+      body                   = body,
+      precision              = self.encoder.precision,
+      content_type           = 'text/plain; charset=utf-8',
+      async_req              = False,
+      _return_http_data_only = False,
+      **options
+    )
+    if status not in (201, 204):
+      raise ConnectionError(f'Unexpected status {status}')
+
+  async def send(self, batch:Batch):
+    try:
+      await self.post(b'\n'.join(batch.lines))
+      written = True
+    except Exception as e:
+      written = False
+      influx_log.error(f'Error writing batch, buffering {len(batch)} measurements: {e}')
+      # Metrics lines carry no row and are not buffered
+      rows = [row for row in batch.rows if row is not None]
+      if rows:
+        await asyncio.to_thread(self.buffer_rows, rows)
+
+    outcome = 'success' if written else 'error'
+    metrics.increment('influx.batches', outcome=outcome)
+    metrics.increment('influx.points', len(batch), outcome=outcome)
+    metrics.observe('influx.batch_seconds', time.monotonic() - batch.started, outcome=outcome)
+    batch.future.set_result(written)
+
+    async with self.space:
+      self.queued -= len(batch)
+      self.space.notify_all()
+
+  def buffer_rows(self, rows:List[Tuple]):
+    batch = MeasurementBatch()
+    for row in rows:
+      batch.add(*row)
+    self.buffer.insert_batch(batch)
+
+  async def write(self, lines:List[bytes], rows:List[Tuple]) -> asyncio.Future:
+    # Waits while the queue is full, then queues the lines. The returned future resolves to
+    # True once their batch is written, or False once it has been buffered instead.
+    if not lines:
+      future = asyncio.get_running_loop().create_future()
+      future.set_result(True)
+      return future
+
+    async with self.space:
+      await self.space.wait_for(lambda: self.queued < self.max_pending)
+      self.queued += len(lines)
+
+    if not self.batches or len(self.batches[-1]) >= self.batch_size:
+      self.batches.append(Batch())
+      self.wakeup.set()
+    batch = self.batches[-1]
+    batch.lines.extend(lines)
+    batch.rows.extend(rows)
+    if len(batch) >= self.batch_size:
+      self.wakeup.set()
+    return batch.future
+
+  async def insert_batch(self, batch:MeasurementBatch) -> asyncio.Future:
+    influx_log.trace('Inserting batch')
+    rows = [(*row, batch.summaries.get(i)) for i, row in enumerate(batch.rows())]
+    return await self.write(self.encoder.encode(batch).split(b'\n') if rows else [], rows)
+
+  async def insert_measurement(self, measurement:Measurement) -> asyncio.Future:
+    influx_log.trace('Inserting measurement')
+    m  = measurement
+    ts = timestamp_ns(m.timestamp) if m.timestamp else None
+    return await self.write(
+      [self.encoder.measurement(m).encode()],
+      [(m.value, ts, m.dimension, m.unit, m.sensor_name, m.sensor_id, None)]
+    )
+
+  async def insert_aggregate(self, aggregate:Aggregate) -> asyncio.Future:
+    influx_log.trace('Inserting aggregate')
+    a  = aggregate
+    ts = timestamp_ns(a.timestamp) if a.timestamp else None
+    return await self.write(
+      [self.encoder.aggregate(a).encode()],
+      [(a.mean, ts, a.dimension, a.unit, a.sensor_name, a.sensor_id, (a.min, a.max, a.last, a.count))]
+    )
+
+  async def insert_sample(self, sample:Sample) -> asyncio.Future:
+    influx_log.trace('Inserting sample')
+    ts   = timestamp_ns(sample.timestamp) if sample.timestamp else None
+    rows = [
+      (i.value, ts, i.dimension, i.unit, i.sensor_name, i.sensor_id, (i.min, i.max, i.last, i.count) if isinstance(i, Aggregate) else None)
+      for i in sample.items.values()
+    ]
+    return await self.write([self.encoder.sample(sample).encode()], rows)
+
+  async def insert_bias(self, bias, measurement:Measurement) -> asyncio.Future:
+    influx_log.trace('Inserting bias')
+    line = self.encoder.measurement(measurement, name='Bias', value=bias)
+    return await self.write([line.encode()], [None])
+
+  async def insert_metrics(self, snapshot) -> Optional[asyncio.Future]:
+    influx_log.trace('Inserting metrics')
+    now   = self.encoder.timestamp(int(datetime.now().timestamp() * 1_000_000_000))
+    lines = []
+    for name, tags, fields in snapshot:
+      point = Point('Metrics').tag('metric', name).time(now, self.encoder.precision)
+      for k, v in tags.items():
+        point.tag(k, v)
+      for k, v in fields.items():
+        point.field(k, v)
+      lines.append(point.to_line_protocol().encode())
+    if lines:
+      return await self.write(lines, [None] * len(lines))
+
+  async def write_chunk(self, batch:MeasurementBatch):
+    # Written straight away rather than queued, and raises if the write fails, so BufferDrain
+    # only acknowledges chunks InfluxDB has accepted
+    await self.post(self.encoder.encode(batch), self.backlog)
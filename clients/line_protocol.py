@@ -0,0 +1,188 @@
+# clients/line_protocol.py
+import math
+from typing import Dict, List, Optional, Tuple
+from sensors.base import Measurement
+from sensors.batch import MeasurementBatch, timestamp_ns
+from aggregator import Aggregate
+from aligner import Sample
+
+# The same escaping influxdb_client applies, so lines match Point.to_line_protocol() byte for byte
+ESCAPE_MEASUREMENT = str.maketrans({',': r'\,', ' ': r'\ ', '\n': r'\n', '\t': r'\t', '\r': r'\r'})
+ESCAPE_KEY         = str.maketrans({',': r'\,', '=': r'\=', ' ': r'\ ', '\n': r'\n', '\t': r'\t', '\r': r'\r'})
+ESCAPE_STRING      = str.maketrans({'"': r'\"', '\\': r'\\'})
+
+TAGS = ('dimension', 'sensor_id', 'unit')
+
+# Nanoseconds per unit of each write precision InfluxDB accepts
+PRECISIONS = {'ns': 1, 'us': 1_000, 'ms': 1_000_000, 's': 1_000_000_000}
+
+
+def escape_tag_value(value) -> str:
+  value = str(value).translate(ESCAPE_KEY)
+  if value.endswith('\\'):
+    value += ' '
+  return value
+
+
+def format_value(value) -> Optional[str]:
+  # Returns None for values Point leaves out: None, NaN and infinities
+  if value is None:
+    return None
+  if isinstance(value, bool):
+    return 'true' if value else 'false'
+  if isinstance(value, int):
+    return f'{value}i'
+  if isinstance(value, str):
+    return '"' + value.translate(ESCAPE_STRING) + '"'
+  if not math.isfinite(value):
+    return None
+  s = str(value)
+  return s[:-2] if s.endswith('.0') else s
+
+
+def format_fields(fields:Dict[str, object]) -> str:
+  formatted = []
+  for key, value in sorted(fields.items()):
+    value = format_value(value)
+    if value is not None:
+      formatted.append(str(key).translate(ESCAPE_KEY) + '=' + value)
+  return ','.join(formatted)
+
+
+class LineEncoder:
+  # Encodes readings straight to line protocol without building Points. The escaped
+  # "measurement,tags " prefix of each series is built once and kept. Timestamps are taken in
+  # nanoseconds and truncated to `precision`, which has to match the precision written with.
+  #
+  # When grouped, rows of one sensor that share a timestamp, as the Aligner leaves them, are
+  # written as one point: a field per dimension and a <dimension>_unit string field for its unit.
+  # sensor_id is the only tag, so the series is the same whichever dimensions a point carries.
+
+  def __init__(self, precision:str='ns', grouped:bool=False):
+    if precision not in PRECISIONS:
+      raise ValueError(f'precision must be one of {", ".join(PRECISIONS)}')
+    self.precision = precision
+    self.divisor   = PRECISIONS[precision]
+    self.grouped   = grouped
+    self.prefixes  : Dict[Tuple[str, ...], str] = {}
+
+  def timestamp(self, timestamp:int) -> int:
+    return timestamp // self.divisor
+
+  def prefix(self, name:str, tags:Tuple[str, ...], values:Tuple[str, ...]) -> str:
+    key    = (name, *tags, *values)
+    prefix = self.prefixes.get(key)
+    if prefix is None:
+      parts = [str(name).translate(ESCAPE_MEASUREMENT)]
+      for tag, value in sorted(zip(tags, values)):
+        if value is None:
+          continue
+        tag, value = str(tag).translate(ESCAPE_KEY), escape_tag_value(value)
+        if tag and value:
+          parts.append(f'{tag}={value}')
+      prefix = self.prefixes[key] = ','.join(parts) + ' '
+    return prefix
+
+  def line(
+    self,
+    name      : str,
+    fields    : Dict[str, object],
+    timestamp : Optional[int],
+    dimension : str,
+    unit      : str,
+    sensor_id : str
+  ) -> str:
+    # An empty string when no field is left to write, as Point does
+    fields = format_fields(fields)
+    if not fields:
+      return ''
+    line = self.prefix(name, TAGS, (dimension, sensor_id, unit)) + fields
+    return line if timestamp is None else f'{line} {timestamp // self.divisor}'
+
+  def measurement(self, measurement:Measurement, name:Optional[str]=None, value=None) -> str:
+    # name and value replace the reading's own, e.g. for the Bias point
+    m = measurement
+    if self.grouped and name is None:
+      return self.sample(Sample(m.sensor_name, m.sensor_id, m.timestamp, {m.dimension: m}))
+    return self.line(
+      name or m.sensor_name,
+      {'value': m.value if value is None else value},
+      timestamp_ns(m.timestamp) if m.timestamp else None,
+      m.dimension, m.unit, m.sensor_id
+    )
+
+  def aggregate(self, aggregate:Aggregate) -> str:
+    # value keeps existing queries working, the rest describe the window
+    a = aggregate
+    if self.grouped:
+      return self.sample(Sample(a.sensor_name, a.sensor_id, a.timestamp, {a.dimension: a}))
+    return self.line(
+      a.sensor_name,
+      {'value': a.mean, 'min': a.min, 'max': a.max, 'last': a.last, 'count': a.count},
+      timestamp_ns(a.timestamp) if a.timestamp else None,
+      a.dimension, a.unit, a.sensor_id
+    )
+
+  def group(self, name:str, sensor_id:str, timestamp:Optional[int], entries:List[Tuple]) -> str:
+    # entries are (dimension, unit, value, summary), summary being (min, max, last, count) or None
+    fields = {}
+    for dimension, unit, value, summary in entries:
+      fields[dimension]           = value
+      fields[f'{dimension}_unit'] = unit
+      if summary is not None:
+        for f, v in zip(('min', 'max', 'last', 'count'), summary):
+          fields[f'{dimension}_{f}'] = v
+
+    fields = format_fields(fields)
+    if not fields:
+      return ''
+    line = self.prefix(name, ('sensor_id',), (sensor_id,)) + fields
+    return line if timestamp is None else f'{line} {timestamp // self.divisor}'
+
+  def sample(self, sample:Sample) -> str:
+    # One Aligner Sample as a single point
+    entries = [
+      (d, i.unit, i.value, (i.min, i.max, i.last, i.count) if isinstance(i, Aggregate) else None)
+      for d, i in sample.items.items()
+    ]
+    timestamp = timestamp_ns(sample.timestamp) if sample.timestamp else None
+    return self.group(sample.sensor_name, sample.sensor_id, timestamp, entries)
+
+  def groups(self, batch:MeasurementBatch) -> List[str]:
+    # Rows are grouped by sensor and timestamp, in the order each group first appears
+    summaries = batch.summaries
+    groups    : Dict[Tuple[str, str, int], List[Tuple]] = {}
+    for i, (value, timestamp, dimension, unit, sensor_name, sensor_id) in enumerate(batch.rows()):
+      groups.setdefault((sensor_name, sensor_id, timestamp), []).append((dimension, unit, value, summaries.get(i)))
+    return [self.group(name, sensor_id, timestamp, entries) for (name, sensor_id, timestamp), entries in groups.items()]
+
+  def lines(self, batch:MeasurementBatch) -> List[str]:
+    if self.grouped:
+      return self.groups(batch)
+
+    # The hot path for batches and backlog replay: plain float values take no dict or sort
+    prefix    = self.prefix
+    summaries = batch.summaries
+    divisor   = self.divisor
+    lines     = []
+    for i, (value, timestamp, dimension, unit, sensor_name, sensor_id) in enumerate(batch.rows()):
+      timestamp //= divisor
+      series  = prefix(sensor_name, TAGS, (dimension, sensor_id, unit))
+      summary = summaries.get(i)
+      if summary is None and math.isfinite(value):
+        s = repr(value)
+        if s.endswith('.0'):
+          s = s[:-2]
+        lines.append(f'{series}value={s} {timestamp}')
+        continue
+
+      fields = {'value': value}
+      if summary is not None:
+        fields.update(zip(('min', 'max', 'last', 'count'), summary))
+      fields = format_fields(fields)
+      lines.append(f'{series}{fields} {timestamp}' if fields else '')
+    return lines
+
+  def encode(self, batch:MeasurementBatch) -> bytes:
+    # The whole batch as one newline separated buffer, encoded in a single pass
+    return '\n'.join(self.lines(batch)).encode()
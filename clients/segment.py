@@ -0,0 +1,492 @@
+# clients/segment.py
+import os
+import json
+import mmap
+import zlib
+import struct
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+from loguru import logger
+from sensors.base import Measurement
+from sensors.batch import MeasurementBatch, StringTable, timestamp_ns, from_timestamp_ns
+from aggregator import Aggregate
+from metrics import metrics
+from .buffer import OVERFLOW_POLICIES
+
+segment_log = logger.bind(tags=['segment'])
+
+
+# id, timestamp in nanoseconds, value and series id, followed by a crc32 of those 28 bytes
+BODY   = struct.Struct('<QqdI')
+CRC    = struct.Struct('<I')
+RECORD = struct.Struct('<QqdII')
+
+# Rows that summarize a window also have id, min, max, last and count, followed by a crc32 of
+# those 36 bytes, in the segment's .sum file. Raw readings, nearly all rows, stay 32 bytes.
+SUMMARY_BODY = struct.Struct('<QdddI')
+SUMMARY      = struct.Struct('<QdddII')
+
+
+class Segment:
+  # One file of consecutive records, named after the id of its first record, and the
+  # summaries of any of them that are aggregates
+
+  __slots__ = ('path', 'first_id', 'count', 'map', 'mapped', 'summaries')
+
+  def __init__(self, path:str, first_id:int, count:int=0):
+    self.path      = path
+    self.first_id  = first_id
+    self.count     = count
+    self.map       = None
+    self.mapped    = 0
+    self.summaries = None
+
+  @property
+  def summary_path(self) -> str:
+    return self.path[:-4] + '.sum'
+
+  @property
+  def last_id(self) -> int:
+    return self.first_id + self.count - 1
+
+  def view(self) -> mmap.mmap:
+    # Maps the records written so far. Only the segment being appended to is ever remapped.
+    if self.map is None or self.mapped != self.count:
+      self.close()
+      with open(self.path, 'rb') as f:
+        self.map = mmap.mmap(f.fileno(), self.count * RECORD.size, access=mmap.ACCESS_READ)
+      self.mapped = self.count
+    return self.map
+
+  def load(self) -> Dict[int, Tuple[float, float, float, int]]:
+    # Reads the summaries once, up to the first torn or corrupt one
+    if self.summaries is None:
+      self.summaries = {}
+      if os.path.exists(self.summary_path):
+        with open(self.summary_path, 'rb') as f:
+          data = f.read()
+        for offset in range(0, len(data) - SUMMARY.size + 1, SUMMARY.size):
+          row_id, minimum, maximum, latest, count, crc = SUMMARY.unpack_from(data, offset)
+          if zlib.crc32(data[offset:offset + SUMMARY_BODY.size]) != crc:
+            break
+          self.summaries[row_id] = (minimum, maximum, latest, count)
+    return self.summaries
+
+  def close(self):
+    if self.map is not None:
+      self.map.close()
+      self.map = None
+
+
+class SegmentBuffer:
+  # A drop-in alternative to MeasurementBuffer for long outages. Readings are appended as
+  # fixed-size binary records to segment files and read back through mmap. Acknowledgement
+  # advances a persisted cursor, and a segment file is deleted once every record in it is
+  # acknowledged, so flash only ever sees appends and whole-file deletes.
+
+  def __init__(
+    self,
+    directory           : str  = 'measurement_segments',
+    max_size            : int  = 10000,
+    records_per_segment : int  = 4096,
+    sync                : bool = False,
+    overflow            : str  = 'drop_oldest'
+  ):
+    if overflow not in OVERFLOW_POLICIES or overflow == 'downsample':
+      raise ValueError(f'overflow must be drop_oldest or refuse, not {overflow}')
+
+    self.type                = Measurement
+    self.directory           = directory
+    self.max_size            = max_size
+    self.records_per_segment = records_per_segment
+    self.sync                = sync
+    self.overflow            = overflow
+
+    # Every id up to and including cursor is acknowledged, acked holds the ids above it
+    # that were acknowledged out of order. Only the cursor survives a restart.
+    self.cursor        = 0
+    self.acked         : Set[int] = set()
+    self.next_id       = 1
+    self.pending_count = 0
+    self.segments      : List[Segment] = []
+    self.file          = None
+
+    self.series_ids : Dict[Tuple[str, str, str, str], int] = {}
+    self.series     : Dict[int, Tuple[str, str, str, str]] = {}
+
+    os.makedirs(directory, exist_ok=True)
+    self.cursor_path = os.path.join(directory, 'cursor')
+    self.series_path = os.path.join(directory, 'series')
+
+    self.lock = threading.RLock()
+    self.open()
+
+  def open(self):
+    # Loads the cursor and series, then recovers the segments, dropping a torn or
+    # corrupt tail left by a crash in the middle of an append
+    with self.lock:
+      if os.path.exists(self.cursor_path):
+        with open(self.cursor_path) as f:
+          self.cursor = int(f.read() or 0)
+
+      if os.path.exists(self.series_path):
+        with open(self.series_path, 'r+b') as f:
+          valid = 0
+          for line in f:
+            try:
+              series_id, *key = json.loads(line)
+            except ValueError:
+              break
+            valid += len(line)
+            self.series_ids[tuple(key)] = series_id
+            self.series[series_id]      = tuple(key)
+          # A torn last line would otherwise swallow the next series appended
+          f.truncate(valid)
+      self.series_file = open(self.series_path, 'a')
+
+      names = sorted(name for name in os.listdir(self.directory) if name.endswith('.seg'))
+      for name in names:
+        path    = os.path.join(self.directory, name)
+        segment = Segment(path, int(name[:-4]), os.path.getsize(path) // RECORD.size)
+        self.segments.append(segment)
+
+      if self.segments:
+        self.recover(self.segments[-1])
+        self.next_id = self.segments[-1].last_id + 1
+      self.next_id = max(self.next_id, self.cursor + 1)
+
+      self.reclaim()
+      self.pending_count = sum(
+        max(0, segment.last_id - max(segment.first_id, self.cursor + 1) + 1)
+        for segment in self.segments
+      )
+
+  def recover(self, segment:Segment):
+    valid = 0
+    with open(segment.path, 'r+b') as f:
+      data = f.read(segment.count * RECORD.size)
+      for i in range(segment.count):
+        offset = i * RECORD.size
+        record = RECORD.unpack_from(data, offset)
+        if record[0] != segment.first_id + i or zlib.crc32(data[offset:offset + BODY.size]) != record[4]:
+          break
+        valid += 1
+      if f.seek(0, os.SEEK_END) != valid * RECORD.size:
+        f.truncate(valid * RECORD.size)
+        metrics.increment('segment.recovered', segment.count - valid)
+    segment.count = valid
+
+    # Summaries are written before their records, so a crash can leave some for ids that were
+    # never stored, and those ids are about to be handed out again
+    summaries = segment.load()
+    kept      = {row_id: summary for row_id, summary in summaries.items() if row_id <= segment.last_id}
+    if os.path.exists(segment.summary_path) and os.path.getsize(segment.summary_path) != len(kept) * SUMMARY.size:
+      with open(segment.summary_path, 'r+b') as f:
+        f.truncate(len(kept) * SUMMARY.size)
+      segment.summaries = kept
+
+  def close(self):
+    with self.lock:
+      if self.file:
+        self.file.close()
+        self.file = None
+      self.series_file.close()
+      for segment in self.segments:
+        segment.close()
+
+  def sync_file(self, f):
+    f.flush()
+    if self.sync:
+      os.fsync(f.fileno())
+
+  def series_id(self, key:Tuple[str, str, str, str]) -> int:
+    # New series are appended to the series file, and synced even without sync, before any
+    # record refers to them. They are rare, and a record whose series is lost cannot be sent.
+    series_id = self.series_ids.get(key)
+    if series_id is None:
+      series_id = len(self.series) + 1
+      self.series_file.write(json.dumps([series_id, *key]) + '\n')
+      self.series_file.flush()
+      os.fsync(self.series_file.fileno())
+      self.series_ids[key]   = series_id
+      self.series[series_id] = key
+    return series_id
+
+  def encode(
+    self, 
+    measurements : Union[List[Union[Measurement, Aggregate]], MeasurementBatch]
+  ) -> Iterator[Tuple[int, float, int, Optional[Tuple[float, float, float, int]]]]:
+    if isinstance(measurements, MeasurementBatch):
+      summaries = measurements.summaries
+      for i, (value, timestamp, dimension, unit, sensor_name, sensor_id) in enumerate(measurements.rows()):
+        yield timestamp, value, self.series_id((sensor_name, str(sensor_id), dimension, unit)), summaries.get(i)
+    else:
+      for m in measurements:
+        yield (
+          timestamp_ns(m.timestamp), 
+          m.value, 
+          self.series_id((m.sensor_name, str(m.sensor_id), m.dimension, m.unit)),
+          (m.min, m.max, m.last, m.count) if isinstance(m, Aggregate) else None
+        )
+
+  def append(self, records:List[bytes], summaries:Dict[int, Tuple[float, float, float, int]]):
+    # Fills the last segment up to records_per_segment, then starts new ones
+    while records:
+      segment = self.segments[-1] if self.segments else None
+      if segment is None or segment.count >= self.records_per_segment:
+        if self.file:
+          self.file.close()
+        segment = Segment(os.path.join(self.directory, f'{self.next_id - len(records):020d}.seg'), self.next_id - len(records))
+        self.segments.append(segment)
+        self.file = None
+      if self.file is None:
+        self.file = open(segment.path, 'ab')
+
+      room             = self.records_per_segment - segment.count
+      chunk, records   = records[:room], records[room:]
+      first            = segment.first_id + segment.count
+      summarized       = [(i, summaries[i]) for i in range(first, first + len(chunk)) if i in summaries]
+      if summarized:
+        self.append_summaries(segment, summarized)
+      self.file.write(b''.join(chunk))
+      self.sync_file(self.file)
+      segment.count   += len(chunk)
+
+  def append_summaries(self, segment:Segment, summarized:List[Tuple[int, Tuple[float, float, float, int]]]):
+    segment.load().update(summarized)
+    with open(segment.summary_path, 'ab') as f:
+      for row_id, summary in summarized:
+        body = SUMMARY_BODY.pack(row_id, *summary)
+        f.write(body + CRC.pack(zlib.crc32(body)))
+      self.sync_file(f)
+
+  def insert(self, measurement):
+    return self.insert_many([measurement])
+
+  def insert_many(self, measurements:Union[Iterable[Measurement], MeasurementBatch]):
+    if not isinstance(measurements, MeasurementBatch):
+      measurements = list(measurements)
+    count = len(measurements)
+    if not count:
+      return True
+
+    try:
+      with self.lock:
+        if self.overflow == 'refuse' and self.pending_count + count > self.max_size:
+          metrics.increment('buffer.refused', count)
+          return False
+
+        records   = []
+        summaries = {}
+        for timestamp, value, series_id, summary in self.encode(measurements):
+          body = BODY.pack(self.next_id, timestamp, value, series_id)
+          records.append(body + CRC.pack(zlib.crc32(body)))
+          if summary is not None:
+            summaries[self.next_id] = summary
+          self.next_id += 1
+        self.append(records, summaries)
+        self.pending_count += count
+
+        if self.pending_count > self.max_size:
+          self.drop_oldest()
+        return True
+    except Exception as e:
+      print(f"Error inserting measurements: {e}")
+      return False
+
+  def insert_batch(self, batch:MeasurementBatch):
+    return self.insert_many(batch)
+
+  def drop_oldest(self):
+    # Gives up whole segments, never the one being appended to
+    dropped = 0
+    while self.pending_count > self.max_size and len(self.segments) > 1:
+      segment  = self.segments[0]
+      removed  = self.unacknowledged(max(segment.first_id, self.cursor + 1), segment.last_id)
+      dropped += removed
+      self.pending_count -= removed
+      self.cursor = max(self.cursor, segment.last_id)
+      self.advance()
+    if dropped:
+      metrics.increment('buffer.dropped', dropped, policy=self.overflow)
+
+  def unacknowledged(self, first:int, last:int) -> int:
+    # Counts the ids in [first, last] that are stored and not yet acknowledged
+    first = max(first, self.cursor + 1)
+    last  = min(last, self.next_id - 1)
+    if first > last:
+      return 0
+    if len(self.acked) < last - first + 1:
+      acked = sum(1 for i in self.acked if first <= i <= last)
+    else:
+      acked = sum(1 for i in range(first, last + 1) if i in self.acked)
+    return last - first + 1 - acked
+
+  def advance(self):
+    # Moves the cursor over every id acknowledged out of order, then persists it
+    # and deletes the segments it has passed
+    self.acked = {i for i in self.acked if i > self.cursor}
+    while self.cursor + 1 in self.acked:
+      self.cursor += 1
+      self.acked.discard(self.cursor)
+
+    temporary = self.cursor_path + '.tmp'
+    with open(temporary, 'w') as f:
+      f.write(str(self.cursor))
+      self.sync_file(f)
+    os.replace(temporary, self.cursor_path)
+    self.reclaim()
+
+  def reclaim(self):
+    while self.segments and self.segments[0].last_id <= self.cursor:
+      if len(self.segments) == 1 and self.segments[0].count < self.records_per_segment:
+        break
+      segment = self.segments.pop(0)
+      segment.close()
+      if self.file and not self.segments:
+        self.file.close()
+        self.file = None
+      os.remove(segment.path)
+      if os.path.exists(segment.summary_path):
+        os.remove(segment.summary_path)
+      metrics.increment('segment.reclaimed')
+
+  def read(self, after:int, limit:int) -> List[Tuple[int, int, float, int, Optional[Tuple[float, float, float, int]]]]:
+    # Reads up to limit unacknowledged (id, timestamp, value, series_id, summary) records after
+    # an id. A record that fails its checksum is lost, so it is counted and acknowledged, as is
+    # one whose series did not survive a crash.
+    rows     = []
+    corrupt  = []
+    orphaned = []
+    after   = max(after, self.cursor)
+    for segment in self.segments:
+      if segment.last_id <= after or not segment.count:
+        continue
+      view      = segment.view()
+      summaries = segment.load()
+      for i in range(max(after + 1, segment.first_id) - segment.first_id, segment.count):
+        row_id = segment.first_id + i
+        if row_id in self.acked:
+          continue
+        offset = i * RECORD.size
+        record = RECORD.unpack_from(view, offset)
+        if record[0] != row_id or zlib.crc32(view[offset:offset + BODY.size]) != record[4]:
+          corrupt.append(row_id)
+          continue
+        if record[3] not in self.series:
+          orphaned.append(row_id)
+          continue
+        rows.append((*record[:4], summaries.get(row_id)))
+        if len(rows) >= limit:
+          break
+      if len(rows) >= limit:
+        break
+
+    if corrupt:
+      metrics.increment('segment.corrupt', len(corrupt))
+      self.acknowledge(corrupt)
+    if orphaned:
+      metrics.increment('segment.orphaned', len(orphaned))
+      segment_log.warning(f'Skipped {len(orphaned)} records of unknown series')
+      self.acknowledge(orphaned)
+    return rows
+
+  def decode(
+    self, 
+    timestamp : int, 
+    value     : float, 
+    series_id : int, 
+    summary   : Optional[Tuple[float, float, float, int]] = None
+  ) -> Union[Measurement, Aggregate]:
+    sensor_name, sensor_id, dimension, unit = self.series[series_id]
+    if summary is not None:
+      minimum, maximum, latest, count = summary
+      return Aggregate(
+        mean        = value,
+        min         = minimum,
+        max         = maximum,
+        last        = latest,
+        count       = count,
+        dimension   = dimension,
+        unit        = unit,
+        sensor_name = sensor_name,
+        sensor_id   = sensor_id,
+        timestamp   = from_timestamp_ns(timestamp)
+      )
+    return self.type(
+      value       = value,
+      dimension   = dimension,
+      unit        = unit,
+      sensor_name = sensor_name,
+      sensor_id   = sensor_id,
+      timestamp   = from_timestamp_ns(timestamp)
+    )
+
+  def get_pending(self, limit:int=100):
+    try:
+      with self.lock:
+        return [(row_id, self.decode(*row)) for row_id, *row in self.read(0, limit)]
+    except Exception as e:
+      print(f"Error getting pending measurements: {e}")
+      return []
+
+  def iter_pending(self, chunk_size:int=500, after:int=0) -> Iterator[Tuple[range, MeasurementBatch]]:
+    # Same contract as MeasurementBuffer.iter_pending
+    strings = StringTable()
+    while True:
+      try:
+        with self.lock:
+          rows   = self.read(after, chunk_size)
+          series = self.series
+      except Exception as e:
+        print(f"Error getting pending measurements: {e}")
+        return
+      if not rows:
+        return
+
+      batch = MeasurementBatch(strings)
+      for _, timestamp, value, series_id, summary in rows:
+        sensor_name, sensor_id, dimension, unit = series[series_id]
+        batch.add(value, timestamp, dimension, unit, sensor_name, sensor_id, summary)
+
+      first, after = rows[0][0], rows[-1][0]
+      yield range(first, after + 1), batch
+
+  def compact(self, max_buckets:int=60) -> int:
+    # Records are never rewritten, so there are no retention tiers, only drop_oldest
+    return 0
+
+  def release(self):
+    # Nothing is leased, as records are never rewritten
+    pass
+
+  def acknowledge(self, ids:Union[range, Iterable[int]]) -> int:
+    try:
+      with self.lock:
+        if isinstance(ids, range) and ids.step == 1:
+          if not ids:
+            return 0
+          acknowledged = self.unacknowledged(ids.start, ids.stop - 1)
+          if ids.start <= self.cursor + 1:
+            self.cursor = max(self.cursor, min(ids.stop - 1, self.next_id - 1))
+          else:
+            self.acked.update(i for i in range(ids.start, min(ids.stop, self.next_id)))
+        else:
+          new = {i for i in ids if self.cursor < i < self.next_id and i not in self.acked}
+          acknowledged = len(new)
+          self.acked  |= new
+
+        if acknowledged:
+          self.pending_count -= acknowledged
+          self.advance()
+        return acknowledged
+    except Exception as e:
+      print(f"Error acknowledging measurements: {e}")
+      return 0
+
+  def mark_processed(self, measurement_id):
+    return self.acknowledge([measurement_id]) > 0
+
+  @property
+  def length(self):
+    return self.pending_count
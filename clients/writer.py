@@ -0,0 +1,94 @@
+# clients/writer.py
+import time
+import threading
+from typing import Iterable, Union
+from loguru import logger
+from sensors.base import Measurement
+from sensors.batch import MeasurementBatch
+from aggregator import Aggregate
+from metrics import metrics
+from .buffer import MeasurementBuffer
+
+writer_log = logger.bind(tags=['writer'])
+
+
+class GroupCommitWriter:
+  # Collects inserts from any number of producers and commits them to the buffer together,
+  # every `interval` milliseconds or as soon as `max_rows` are waiting, whichever comes first.
+  # A crash loses at most the rows that were waiting: fewer than max_rows, or interval ms worth.
+
+  def __init__(self, buffer:MeasurementBuffer, interval:int=250, max_rows:int=100):
+    self.buffer    = buffer
+    self.interval  = interval
+    self.max_rows  = max_rows
+    # Kept as a batch, so aggregates keep their summaries on the way to the buffer
+    self.pending   = MeasurementBatch()
+    self.condition = threading.Condition()
+    self.stopping  = False
+    self.thread    = threading.Thread(target=self.run, name='group-commit', daemon=True)
+    self.thread.start()
+
+  def __getattr__(self, name):
+    # Reads and acknowledgements go straight to the buffer
+    if name == 'buffer':
+      raise AttributeError(name)
+    return getattr(self.buffer, name)
+
+  def insert(self, measurement:Measurement):
+    return self.insert_many([measurement])
+
+  def insert_many(self, measurements:Union[Iterable[Measurement], MeasurementBatch]):
+    with self.condition:
+      if self.stopping:
+        return self.buffer.insert_many(measurements)
+      if isinstance(measurements, MeasurementBatch):
+        self.pending.extend(measurements)
+      else:
+        for m in measurements:
+          self.pending.append(m, (m.min, m.max, m.last, m.count) if isinstance(m, Aggregate) else None)
+      if len(self.pending) >= self.max_rows:
+        self.condition.notify()
+    return True
+
+  def insert_batch(self, batch:MeasurementBatch):
+    return self.insert_many(batch)
+
+  def take(self) -> MeasurementBatch:
+    with self.condition:
+      pending, self.pending = self.pending, MeasurementBatch()
+      return pending
+
+  def flush(self) -> int:
+    pending = self.take()
+    if pending:
+      started = time.perf_counter()
+      self.buffer.insert_many(pending)
+      metrics.observe('writer.commit_seconds', time.perf_counter() - started)
+      metrics.increment('writer.rows', len(pending))
+      writer_log.trace(f'Committed {len(pending)} rows')
+    return len(pending)
+
+  def run(self):
+    while True:
+      with self.condition:
+        self.condition.wait_for(
+          lambda: self.stopping or len(self.pending) >= self.max_rows,
+          timeout = self.interval / 1000
+        )
+        stopping = self.stopping
+      self.flush()
+      if stopping:
+        return
+
+  @property
+  def length(self):
+    with self.condition:
+      waiting = len(self.pending)
+    return self.buffer.length + waiting
+
+  def close(self):
+    with self.condition:
+      self.stopping = True
+      self.condition.notify()
+    self.thread.join()
+    self.flush()
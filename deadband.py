@@ -0,0 +1,50 @@
+import time
+from typing import Callable, Dict, Optional, Tuple, Union
+from loguru import logger
+from sensors.base import Measurement
+from aggregator import Aggregate
+from metrics import metrics
+
+deadband_log = logger.bind(tags=['deadband'])
+
+
+class Deadband:
+
+  def __init__(
+    self,
+    thresholds : Optional[Dict[Union[str, Tuple[str, str]], float]] = None,
+    heartbeat  : float                                              = 60.0,
+    clock      : Callable[[], float]                                = time.monotonic
+  ):
+    # thresholds maps a dimension, or a (sensor_name, dimension) pair that takes precedence over
+    # it, to the smallest change worth sending, in the reading's unit. A series is always sent at
+    # least every heartbeat seconds to show it is alive.
+    self.thresholds = thresholds or {}
+    self.heartbeat  = heartbeat
+    self.clock      = clock
+    self.last       : Dict[Tuple[str, str, str, str], Tuple[float, float]] = {}
+    self.suppressed = 0
+
+  def allow(self, item:Union[Measurement, Aggregate]) -> bool:
+    threshold = self.thresholds.get((item.sensor_name, item.dimension), self.thresholds.get(item.dimension))
+    if threshold is None:
+      return True
+
+    now  = self.clock()
+    key  = (item.sensor_name, item.sensor_id, item.dimension, item.unit)
+    last = self.last.get(key)
+
+    if (
+      last is None
+      or abs(item.value - last[0]) >= threshold
+      or now - last[1] >= self.heartbeat
+      # A window that moved enough inside itself still carries a spike worth keeping
+      or (isinstance(item, Aggregate) and item.max - item.min >= threshold)
+    ):
+      self.last[key] = (item.value, now)
+      return True
+
+    self.suppressed += 1
+    metrics.increment('deadband.suppressed', dimension=item.dimension)
+    deadband_log.trace(f'Suppressed {item.sensor_name} {item.dimension}', value=item.value)
+    return False
@@ -6,8 +6,13 @@ from loguru import logger
 from gpiozero import Device, PWMLED
 from gpiozero.pins.lgpio import LGPIOFactory
 from sensors import Sensor, Measurement, DS18B20, SHT41, RaspberryPi
+from sensors import Simulation, SimulatedDS18B20, SimulatedSHT41, SimulatedRaspberryPi
 from sampler import Sampler
-from clients import InfluxClient, MeasurementBuffer
+from aggregator import Aggregator, Aggregate
+from deadband import Deadband
+from aligner import Aligner
+from metrics import metrics
+from clients import AsyncInfluxClient, MeasurementBuffer, SegmentBuffer, GroupCommitWriter, BufferDrain
 from display import Screen
 from display.layers import TemperatureLayer, WifiLayer, MenuLayer
 
@@ -49,49 +54,146 @@ screen.layers = [
 
 #region Measurements 
 
-buffer = MeasurementBuffer()
-influx = InfluxClient(
-  url    = os.getenv('INFLUX_URL'),
-  token  = os.getenv('INFLUX_TOKEN'),
-  org    = os.getenv('INFLUX_ORG'),
-  bucket = os.getenv('INFLUX_BUCKET'),
-  buffer = buffer
+# BUFFER_BACKEND=segment keeps the offline backlog in append-only segment files instead of SQLite
+if os.getenv('BUFFER_BACKEND', 'sqlite') == 'segment':
+  store = SegmentBuffer(
+    directory = os.getenv('BUFFER_DIRECTORY', 'measurement_segments'),
+    overflow  = os.getenv('BUFFER_OVERFLOW', 'drop_oldest')
+  )
+else:
+  # Unsent readings stay at full resolution for BUFFER_FULL_RESOLUTION minutes, then per minute
+  # for BUFFER_MINUTE_RESOLUTION hours, then per hour
+  store = MeasurementBuffer(
+    overflow = os.getenv('BUFFER_OVERFLOW', 'drop_oldest'),
+    tiers    = [
+      (60 * float(os.getenv('BUFFER_FULL_RESOLUTION', 60)), 60),
+      (3600 * float(os.getenv('BUFFER_MINUTE_RESOLUTION', 24)), 3600)
+    ]
+  )
+
+# Offline writes are committed in groups, a crash loses at most one group
+buffer = GroupCommitWriter(
+  store,
+  interval = int(os.getenv('BUFFER_COMMIT_INTERVAL', 250)),
+  max_rows = int(os.getenv('BUFFER_COMMIT_ROWS', 100))
+)
+# Writes are batched on the event loop over one keep-alive connection, failed batches go to the buffer
+influx = AsyncInfluxClient(
+  url         = os.getenv('INFLUX_URL'),
+  token       = os.getenv('INFLUX_TOKEN'),
+  org         = os.getenv('INFLUX_ORG'),
+  bucket      = os.getenv('INFLUX_BUCKET'),
+  buffer      = buffer,
+  max_pending = int(os.getenv('INFLUX_MAX_PENDING', 10000)),
+  # The sensors resolve ~100 ms at best, and gzip shrinks request bodies ~20x on a weak link
+  precision   = os.getenv('INFLUX_PRECISION', 'ms'),
+  gzip_level  = int(os.getenv('INFLUX_GZIP_LEVEL', 6)),
+  grouped     = bool(float(os.getenv('ALIGN_TICK', 0)))
+)
+
+# Replays the buffer once InfluxDB is reachable, using at most BUFFER_DRAIN_SHARE of the uplink's time
+drain = BufferDrain(
+  influx,
+  buffer,
+  max_batch = int(os.getenv('BUFFER_DRAIN_BATCH', 5000)),
+  share     = float(os.getenv('BUFFER_DRAIN_SHARE', 0.5))
+)
+
+probe_options = dict(
+  resolution = int(os.getenv('DS18B20_RESOLUTION')) if os.getenv('DS18B20_RESOLUTION') else None,
+  frequency  = float(os.getenv('DS18B20_FREQUENCY', 1))
 )
 
+# SENSOR_BACKEND=simulated runs without any sensors attached
+if os.getenv('SENSOR_BACKEND', 'hardware') == 'simulated':
+  simulation = Simulation(
+    speed        = float(os.getenv('SIMULATION_SPEED', 1)),
+    latency      = float(os.getenv('SIMULATION_LATENCY', 0)),
+    failure_rate = float(os.getenv('SIMULATION_FAILURE_RATE', 0))
+  )
+  probe   = SimulatedDS18B20(simulation, **probe_options)
+  pi      = SimulatedRaspberryPi(simulation)
+  sensors = [probe, SimulatedSHT41(simulation), pi]
+else:
+  probe   = DS18B20(**probe_options)
+  pi      = RaspberryPi()
+  sensors = [probe, SHT41(), pi]
+
 sampler = Sampler(
-  sensors    = [DS18B20(), SHT41(), RaspberryPi()],
+  sensors    = sensors,
   dimensions = ['temperature', 'relative_humidity', 'cpu_load', 'cpu_temp']
 )
+
+# The probes are sampled far more often than they need to be stored
+aggregator = Aggregator(
+  windows = {(probe.name, 'temperature'): int(os.getenv('AGGREGATE_WINDOW', 10))},
+  max_age = float(os.getenv('AGGREGATE_MAX_AGE', 60))
+)
+
+# Readings that have barely moved are dropped, but every series is sent at least once per heartbeat.
+# The CPU temperature is a 'temperature' too, so it is told apart from the probes by sensor.
+deadband = Deadband(
+  thresholds = {
+    'temperature'            : 0.05,
+    (pi.name, 'temperature') : 1.0,
+    'relative_humidity'      : 0.5,
+    'cpu_load'               : 5.0,
+    'memory_usage'           : 1.0,
+    'disk_usage'             : 0.1
+  },
+  heartbeat  = float(os.getenv('DEADBAND_HEARTBEAT', 60))
+)
+
+# ALIGN_TICK=<seconds> snaps each sensor's readings to a shared tick and sends them as one point
+# with a field per dimension, the probe's point carrying the bias whenever it changes
+aligner = Aligner(tick=float(os.getenv('ALIGN_TICK'))) if float(os.getenv('ALIGN_TICK', 0)) else None
 #endregion
 
 
-async def poll_sensors(state, sleep_seconds=1):
-  buffer  = MeasurementBuffer()
-  influx  = InfluxClient(
-    url    = os.getenv('INFLUX_URL'),
-    token  = os.getenv('INFLUX_TOKEN'),
-    org    = os.getenv('INFLUX_ORG'),
-    bucket = os.getenv('INFLUX_BUCKET'),
-    buffer = buffer
-  )
-  sampler = Sampler(
-    sensors    = [DS18B20(), SHT41(), RaspberryPi()],
-    dimensions = ['temperature', 'relative_humidity', 'cpu_load', 'cpu_temp']
-  )
-  while True:
-    measurements = await sampler.get_measurements()
-    for m in measurements:
-      if m.sensor_name == 'DS18B20':
-        state['fahrenheit'] = m.value
-      try:
-        influx.insert_measurement(m)
-        current_bias = state['bias']
-        if state['last_bias'] != current_bias: 
-          influx.insert_bias(current_bias, m)
+async def send(item):
+  if aligner is None:
+    if isinstance(item, Aggregate):
+      await influx.insert_aggregate(item)
+    else:
+      await influx.insert_measurement(item)
+    return
+
+  for sample in aligner.add(item):
+    await influx.insert_sample(sample)
+
+async def poll_sensors(state):
+  async for m in sampler.run():
+    # With several probes on the bus the display follows the first one
+    followed = m.sensor_name == 'DS18B20' and m.sensor_id == probe.id
+    if followed:
+      state['fahrenheit'] = m.value
+    try:
+      for item in aggregator.add(m):
+        if deadband.allow(item):
+          await send(item)
+      current_bias = state['bias']
+      if state['last_bias'] != current_bias:
+        if aligner is None:
+          await influx.insert_bias(current_bias, m)
+          state['last_bias'] = current_bias
+        elif followed:
+          # Goes into the probe's tick whether or not the deadband let its reading through
+          await send(Measurement(current_bias, 'bias', m.unit, m.sensor_name, m.sensor_id, m.timestamp))
           state['last_bias'] = current_bias
-      except Exception as e:
-        logger.error(e)
-        raise e
+    except Exception as e:
+      logger.error(e)
+      raise e
+
+async def report_metrics(sleep_seconds=60):
+  while True:
+    await asyncio.sleep(sleep_seconds)
+    await influx.insert_metrics(metrics.snapshot())
+
+async def compact_buffer(sleep_seconds=60):
+  # Compacts in small steps until caught up, yielding to the loop between them
+  while True:
+    while await asyncio.to_thread(store.compact):
+      await asyncio.sleep(0)
     await asyncio.sleep(sleep_seconds)
 
 async def refresh_screen(state, screen, sleep_seconds=0.1):
@@ -110,8 +212,12 @@ async def main():
     'location'   : 'main'
   }
   
-  sensor_task = asyncio.create_task(poll_sensors(state))
-  screen_task = asyncio.create_task(refresh_screen(state, screen))
+  await influx.start()
+  sensor_task  = asyncio.create_task(poll_sensors(state))
+  screen_task  = asyncio.create_task(refresh_screen(state, screen))
+  metrics_task = asyncio.create_task(report_metrics())
+  compact_task = asyncio.create_task(compact_buffer())
+  drain_task   = asyncio.create_task(drain.run())
   
   # Create a task to watch for shutdown
   async def shutdown_monitor():
@@ -120,17 +226,28 @@ async def main():
         # Cancel all other tasks
         sensor_task.cancel()
         screen_task.cancel()
+        metrics_task.cancel()
+        compact_task.cancel()
+        drain_task.cancel()
         return
       await asyncio.sleep(0.1)
   
   monitor_task = asyncio.create_task(shutdown_monitor())
   
   try:
-    await asyncio.gather(sensor_task, screen_task, monitor_task)
+    await asyncio.gather(sensor_task, screen_task, metrics_task, compact_task, drain_task, monitor_task)
   except asyncio.CancelledError:
     # Handle task cancellation
     pass
   
+  # Send whatever the aggregator was still holding
+  for aggregate in aggregator.flush():
+    await send(aggregate)
+  for sample in aligner.flush() if aligner else []:
+    await influx.insert_sample(sample)
+  await influx.close()
+  buffer.close()
+  
   # Ensure screen shows shutdown message
   screen.shutdown()
 
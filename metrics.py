@@ -0,0 +1,72 @@
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+
+@dataclass
+class Timing:
+  count : int   = 0
+  total : float = 0.0
+  max   : float = 0.0
+
+  def observe(self, seconds:float):
+    self.count += 1
+    self.total += seconds
+    self.max    = max(self.max, seconds)
+
+  @property
+  def mean(self) -> float:
+    return self.total / self.count if self.count else 0.0
+
+
+class Metrics:
+  # Counters, gauges and timings shared by the sampling and uplink paths.
+  # Updated from worker threads as well as the event loop, so every access is locked.
+
+  def __init__(self):
+    self.lock     = threading.Lock()
+    self.counters : Dict[Tuple, float]  = {}
+    self.gauges   : Dict[Tuple, float]  = {}
+    self.timings  : Dict[Tuple, Timing] = {}
+
+  @staticmethod
+  def key(name:str, tags:Dict[str, str]) -> Tuple:
+    return (name, tuple(sorted((k, str(v)) for k, v in tags.items())))
+
+  def increment(self, name:str, amount:float=1, **tags):
+    key = self.key(name, tags)
+    with self.lock:
+      self.counters[key] = self.counters.get(key, 0) + amount
+
+  def gauge(self, name:str, value:float, **tags):
+    with self.lock:
+      self.gauges[self.key(name, tags)] = value
+
+  def observe(self, name:str, seconds:float, **tags):
+    key = self.key(name, tags)
+    with self.lock:
+      self.timings.setdefault(key, Timing()).observe(seconds)
+
+  def counter(self, name:str, **tags) -> float:
+    with self.lock:
+      return self.counters.get(self.key(name, tags), 0)
+
+  def snapshot(self) -> List[Tuple[str, Dict[str, str], Dict[str, float]]]:
+    # Returns (name, tags, fields) for every metric
+    with self.lock:
+      snapshot = []
+      for (name, tags), value in self.counters.items():
+        snapshot.append((name, dict(tags), {'count': float(value)}))
+      for (name, tags), value in self.gauges.items():
+        snapshot.append((name, dict(tags), {'value': float(value)}))
+      for (name, tags), timing in self.timings.items():
+        snapshot.append((name, dict(tags), {
+          'count' : float(timing.count),
+          'total' : timing.total,
+          'mean'  : timing.mean,
+          'max'   : timing.max
+        }))
+      return snapshot
+
+
+metrics = Metrics()
@@ -3,32 +3,114 @@ import asyncio
 import statistics
 from datetime import datetime
 from dataclasses import dataclass
-from typing import List, Optional
+from functools import partial
+from typing import List, Optional, Dict, Callable, AsyncIterator
 from loguru import logger
 from sensors.base import Sensor, Measurement
+from sensors.batch import MeasurementBatch
+from scheduler import Scheduler
+from metrics import metrics
 
 sampler_log = logger.bind(tags=['sampler'])
 
+# Put on the queue by a sensor task once it has finished all of its readings
+_DONE = object()
+
+
 class Sampler:
-  
+
   def __init__(self, sensors:List[Sensor], dimensions:Optional[List[str]]=None):
     self.sensors    = sensors
     self.dimensions = dimensions or ['temperature', 'relative_humidity']
-    self.delay      = 0.2
+    self.scheduler  = Scheduler(sensors, self.dimensions)
+    self.locks      : Dict[Sensor, asyncio.Lock] = {}
 
-  async def get_measurements(self) -> List[Measurement]:
-    measurements = []
-    for sensor in self.sensors:
-      for dimension, method in sensor.get_measurables().items():
-        if dimension in self.dimensions:
+  def select(self, sensor:Sensor) -> Dict[str, Callable]:
+    # Returns the ready measurables of a sensor that this sampler is interested in
+    return {
+      dimension: method
+      for dimension, method in sensor.get_measurables().items()
+      if dimension in self.dimensions
+    }
+
+  async def sample_sensor(self, sensor:Sensor, methods:Dict[str, Callable], queue:asyncio.Queue):
+    # Reads one sensor's measurables in turn, so a device is never read twice at once
+    lock = self.locks.setdefault(sensor, asyncio.Lock())
+    try:
+      async with lock:
+        for dimension, method in methods.items():
           with sampler_log.contextualize(sensor=sensor, dimension=dimension):
             try:
               sampler_log.trace('Awaiting result of sensor method')
-              measurement = await method()
-              if measurement is not None:
-                measurements.append(measurement)
-                sampler_log.trace('Measurement added to sample')
-                await asyncio.sleep(self.delay)
+              result = await method()
+              # Sensors with several devices return one measurement per device
+              for measurement in result if isinstance(result, list) else [result]:
+                if measurement is not None:
+                  await queue.put(measurement)
+                  sampler_log.trace('Measurement added to sample')
             except Exception as e:
               sampler_log.error(f'Error occured while taking sensor reading: {e}')
-    return measurements
+    finally:
+      await queue.put(_DONE)
+
+  async def stream(self) -> AsyncIterator[Measurement]:
+    # Samples every sensor concurrently, yielding measurements as soon as they are taken
+    queue = asyncio.Queue()
+    tasks = [
+      asyncio.create_task(self.sample_sensor(sensor, self.select(sensor), queue))
+      for sensor in self.sensors
+    ]
+    remaining = len(tasks)
+    try:
+      while remaining:
+        item = await queue.get()
+        if item is _DONE:
+          remaining -= 1
+        else:
+          yield item
+    finally:
+      for task in tasks:
+        task.cancel()
+
+  async def get_measurements(self) -> List[Measurement]:
+    return [measurement async for measurement in self.stream()]
+
+  async def get_batch(self) -> MeasurementBatch:
+    batch = MeasurementBatch()
+    async for measurement in self.stream():
+      batch.append(measurement)
+    return batch
+
+  async def dispatch(self, queue:asyncio.Queue):
+    # Starts the due measurables of each sensor at their deadlines without waiting for them to finish
+    pending = set()
+    try:
+      while True:
+        due = {}
+        for job in await self.scheduler.wait():
+          due.setdefault(job.sensor, {})[job.dimension] = partial(job.measurable.measure, job.sensor)
+
+        for sensor, methods in due.items():
+          lock = self.locks.get(sensor)
+          if lock is not None and lock.locked():
+            sampler_log.debug(f'{sensor.name} is still busy, skipping {", ".join(methods)}')
+            metrics.increment('sampler.skipped', sensor=sensor.name)
+            continue
+          task = asyncio.create_task(self.sample_sensor(sensor, methods, queue))
+          pending.add(task)
+          task.add_done_callback(pending.discard)
+    finally:
+      for task in pending:
+        task.cancel()
+
+  async def run(self) -> AsyncIterator[Measurement]:
+    # Takes measurements indefinitely, each measurable at its own frequency
+    queue      = asyncio.Queue()
+    dispatcher = asyncio.create_task(self.dispatch(queue))
+    try:
+      while True:
+        item = await queue.get()
+        if item is not _DONE:
+          yield item
+    finally:
+      dispatcher.cancel()
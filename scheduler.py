@@ -0,0 +1,82 @@
+import time
+import heapq
+import asyncio
+import itertools
+from dataclasses import dataclass, field
+from typing import List, Optional, Callable
+from loguru import logger
+from sensors.base import Sensor, Measurable
+
+scheduler_log = logger.bind(tags=['scheduler'])
+
+
+@dataclass(order=True)
+class Job:
+  due        : float
+  order      : int
+  sensor     : Sensor     = field(compare=False)
+  dimension  : str        = field(compare=False)
+  measurable : Measurable = field(compare=False)
+  period     : float      = field(compare=False)
+
+
+class Scheduler:
+
+  def __init__(
+    self,
+    sensors    : List[Sensor],
+    dimensions : Optional[List[str]]  = None,
+    clock      : Callable[[], float]  = time.monotonic
+  ):
+    self.clock   = clock
+    self.heap    : List[Job] = []
+    self.counter = itertools.count()
+
+    start = self.clock()
+    for sensor in sensors:
+      for dimension, measurable in sensor.measurables.items():
+        if dimensions is None or dimension in dimensions:
+          self.add(sensor, dimension, measurable, due=start)
+
+  def add(self, sensor:Sensor, dimension:str, measurable:Measurable, due:Optional[float]=None):
+    # Sensors can override the frequency their class declares
+    period = float(sensor.frequencies.get(dimension, measurable.frequency))
+    if period <= 0:
+      raise ValueError(f'Frequency of {sensor.name}.{dimension} must be positive')
+
+    due = self.clock() if due is None else due
+    heapq.heappush(self.heap, Job(due, next(self.counter), sensor, dimension, measurable, period))
+
+  def reschedule(self, job:Job, now:float):
+    # Deadlines advance from the previous deadline rather than from now, so no drift accumulates.
+    # Periods missed while the loop was busy are skipped instead of being fired in a burst.
+    missed = max(0, int((now - job.due) // job.period))
+    if missed:
+      scheduler_log.debug(f'Skipped {missed} deadline(s) of {job.sensor.name}.{job.dimension}')
+    due = job.due + (missed + 1) * job.period
+    heapq.heappush(self.heap, Job(due, next(self.counter), job.sensor, job.dimension, job.measurable, job.period))
+
+  def pop_due(self, now:Optional[float]=None) -> List[Job]:
+    now = self.clock() if now is None else now
+    due = []
+    while self.heap and self.heap[0].due <= now:
+      job = heapq.heappop(self.heap)
+      due.append(job)
+      self.reschedule(job, now)
+    return due
+
+  @property
+  def next_deadline(self) -> Optional[float]:
+    return self.heap[0].due if self.heap else None
+
+  async def wait(self) -> List[Job]:
+    # Sleeps until the earliest deadline, then returns every job that is due
+    if not self.heap:
+      raise RuntimeError('No measurables to schedule')
+
+    while True:
+      now   = self.clock()
+      delay = self.heap[0].due - now
+      if delay <= 0:
+        return self.pop_due(now)
+      await asyncio.sleep(delay)
@@ -1,13 +1,21 @@
 from .base import Sensor, Measurement
+from .batch import MeasurementBatch
 from .ds18b20 import DS18B20
 from .sht41 import SHT41
 from .si7021 import SI7021
 from .pi import RaspberryPi
+from .simulated import Simulation, SimulatedDS18B20, SimulatedSHT41, SimulatedSI7021, SimulatedRaspberryPi
 
 
 __ALL__ = [
+  MeasurementBatch,
   DS18B20,
   SHT41,
   SI7021,
-  RaspberryPi
+  RaspberryPi,
+  Simulation,
+  SimulatedDS18B20,
+  SimulatedSHT41,
+  SimulatedSI7021,
+  SimulatedRaspberryPi
 ]
\ No newline at end of file
@@ -1,11 +1,10 @@
 import os
+import sys
 import glob
 import time
 import asyncio
 import inspect
-import board
-import adafruit_si7021
-import RPi.GPIO as GPIO
+import threading
 from functools import wraps
 from loguru import logger
 from pint import UnitRegistry, Unit, Quantity
@@ -13,13 +12,67 @@ from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from datetime import datetime
 from typing import List, Optional, Dict, Any, Callable
+from .executor import BlockingExecutor, executor
 
 
 units = UnitRegistry()
 units.formatter.default_format = '.2f'
 
+# pint is not thread-safe, and blocking measurables take their first reading, which builds their
+# plans, on executor threads at the same time
+plans_lock = threading.Lock()
 
-@dataclass
+
+@dataclass(frozen=True)
+class ConversionPlan:
+  # A unit conversion resolved once with pint and then applied with plain float arithmetic
+  scale     : float
+  offset    : float
+  dimension : str
+  unit      : str
+
+  @classmethod
+  def build(cls, unit:Unit, preferred_units:List[Unit], override_dimension:Optional[str]=None) -> 'ConversionPlan':
+    zero = Quantity(0.0, unit).to_preferred(preferred_units)
+    one  = Quantity(1.0, unit).to_preferred(preferred_units)
+    if zero.units != one.units:
+      raise ValueError(f'Preferred unit for {unit} depends on magnitude')
+    
+    dimensions = list(one.dimensionality.keys())
+    if not dimensions:
+      if override_dimension:
+        dimension = override_dimension
+      else:
+        raise ValueError("Must provide an override_dimension for dimensionless quantities")
+    elif len(dimensions) == 1:
+      dimension = dimensions[0].strip('[]')
+    else:
+      raise ValueError("Compound dimensions are not supported")
+    
+    plan = cls(
+      scale     = float(one.magnitude - zero.magnitude),
+      offset    = float(zero.magnitude),
+      dimension = sys.intern(dimension),
+      unit      = sys.intern(str(one.units).lower())
+    )
+    
+    # Every unit in the registry converts linearly, but check rather than assume
+    expected = Quantity(100.0, unit).to_preferred(preferred_units).magnitude
+    if abs(plan.convert(100.0) - expected) > 1e-9 * max(1.0, abs(expected)):
+      raise ValueError(f'Conversion from {unit} to {one.units} is not linear')
+    return plan
+
+  @property
+  def identity(self) -> bool:
+    return self.scale == 1.0 and self.offset == 0.0
+
+  def convert(self, value:float) -> float:
+    if self.identity:
+      return value
+    return value * self.scale + self.offset
+
+
+@dataclass(slots=True)
 class Measurement:
   value       : float
   dimension   : str
@@ -30,12 +83,18 @@ class Measurement:
 
 
 class Measurable:
-  def __init__(self, frequency:int=5):
+  def __init__(self, frequency:float=5, blocking:bool=False, timeout:Optional[float]=None):
+    # Blocking measurables are plain methods that are run on the sensor's executor
     self.frequency      = frequency
+    self.blocking       = blocking
+    self.timeout        = timeout
     self.dimension      = None
+    self.method         = None
     self._last_measured = None
     
   def __call__(self, method):
+    self.method = method
+    
     @wraps(method)
     async def wrapper(sensor_instance, *args, **kwargs):
       # TODO: Do I check if self.dimension is none and then update or just do it this way?
@@ -43,7 +102,7 @@ class Measurable:
       now = datetime.now()
       
       if self.ready:
-        result = await method(sensor_instance, *args, **kwargs)
+        result = await self.measure(sensor_instance, *args, **kwargs)
         self.last_measured = now
         return result
       
@@ -51,6 +110,17 @@ class Measurable:
     
     wrapper.measurable = self
     return wrapper
+  
+  async def measure(self, sensor_instance, *args, **kwargs):
+    # Takes a reading regardless of when the last one was taken
+    if self.blocking:
+      return await sensor_instance.executor.run(
+        f'{sensor_instance.name}.{self.method.__name__}',
+        self.method, sensor_instance, *args,
+        timeout = self.timeout,
+        **kwargs
+      )
+    return await self.method(sensor_instance, *args, **kwargs)
       
   @property
   def ready(self) -> bool:
@@ -73,15 +143,30 @@ class Measurable:
 
 class Sensor(ABC):
     
-  def __init__(self, name:str, preferred_units:Optional[List[Unit]]=[]):
-    self.name            : str        = name
-    self.preferred_units : List[Unit] = preferred_units or []
+  def __init__(self, name:str, preferred_units:Optional[List[Unit]]=[], executor:BlockingExecutor=executor):
+    self.name            : str              = name
+    self.preferred_units : List[Unit]       = preferred_units or []
+    self.executor        : BlockingExecutor = executor
+    self.frequencies     : Dict[str, float] = {}
+    self._measurables    : Optional[Dict[str, Measurable]] = None
+    self._plans          : Dict[tuple, ConversionPlan]     = {}
     
   @property
   @abstractmethod
   def id(self):
     pass
 
+  @property
+  def measurables(self) -> Dict[str, Measurable]:
+    # Every measurable declared on the sensor's class, whether it is ready or not
+    if self._measurables is None:
+      self._measurables = {
+        name: method.measurable
+        for name, method in inspect.getmembers(type(self), predicate=inspect.isfunction)
+        if hasattr(method, 'measurable')
+      }
+    return self._measurables
+
   def get_measurables(self):
     measurables = {}
     for name, method in inspect.getmembers(self, predicate=inspect.ismethod):
@@ -90,26 +175,27 @@ class Sensor(ABC):
           measurables[name] = method
     return measurables
 
-  def create_measurement(self, quantity:Quantity, override_dimension:Optional[str]=None):
-    #logger.debug('Creating measurement')
-    quantity   = quantity.to_preferred(self.preferred_units)
-    dimensions = list(quantity.dimensionality.keys())
-    
-    if not dimensions:
-      if override_dimension:
-        dimension = override_dimension
-      else:
-        raise ValueError("Must provide an override_dimension for dimensionless quantities")
-    elif len(dimensions) == 1:
-      dimension = dimensions[0].strip('[]')
-    else:
-      raise ValueError("Compound dimensions are not supported")
-    
+  def plan(self, unit:Unit, override_dimension:Optional[str]=None) -> ConversionPlan:
+    # Input units and preferred_units never change, so each conversion is resolved only once
+    key = (unit, override_dimension)
+    plan = self._plans.get(key)
+    if plan is None:
+      with plans_lock:
+        plan = self._plans.get(key)
+        if plan is None:
+          plan = self._plans[key] = ConversionPlan.build(unit, self.preferred_units, override_dimension)
+    return plan
+
+  def make_measurement(self, value:float, unit:Unit, override_dimension:Optional[str]=None, sensor_id:Optional[str]=None):
+    plan = self.plan(unit, override_dimension)
     return Measurement(
-      value       = quantity.magnitude,
-      dimension   = dimension,
-      unit        = str(quantity.units).lower(),
+      value       = plan.convert(value),
+      dimension   = plan.dimension,
+      unit        = plan.unit,
       sensor_name = self.name,
-      sensor_id   = self.id,
+      sensor_id   = sensor_id or self.id,
       timestamp   = datetime.now()
     )
+
+  def create_measurement(self, quantity:Quantity, override_dimension:Optional[str]=None, sensor_id:Optional[str]=None):
+    return self.make_measurement(quantity.magnitude, quantity.units, override_dimension, sensor_id)
@@ -0,0 +1,121 @@
+from array import array
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from .base import Measurement
+
+
+def timestamp_ns(timestamp:datetime) -> int:
+  # Rounded to whole microseconds, which is all a datetime holds, so the float does not leak into the result
+  return round(timestamp.timestamp() * 1_000_000) * 1_000
+
+
+def from_timestamp_ns(timestamp:int) -> datetime:
+  # fromtimestamp rounds to the nearest microsecond, which absorbs the float's error
+  return datetime.fromtimestamp(timestamp / 1_000_000_000)
+
+
+class StringTable:
+  # Dictionary encoding for the string fields that repeat on every reading
+
+  def __init__(self):
+    self.ids     : Dict[str, int] = {}
+    self.strings : List[str]      = []
+
+  def encode(self, string:str) -> int:
+    i = self.ids.get(string)
+    if i is None:
+      i = self.ids[string] = len(self.strings)
+      self.strings.append(string)
+    return i
+
+  def decode(self, i:int) -> str:
+    return self.strings[i]
+
+  def __len__(self):
+    return len(self.strings)
+
+
+class MeasurementBatch:
+  # Measurements stored column-wise: float64 values, int64 nanosecond timestamps and
+  # string fields as ids into a StringTable that can be shared between batches. Rows that
+  # summarize a window carry (min, max, last, count) in summaries, keyed by row index.
+
+  def __init__(self, strings:Optional[StringTable]=None):
+    self.strings      = strings if strings is not None else StringTable()
+    self.values       = array('d')
+    self.timestamps   = array('q')
+    self.dimensions   = array('I')
+    self.units        = array('I')
+    self.sensor_names = array('I')
+    self.sensor_ids   = array('I')
+    self.summaries    : Dict[int, Tuple[float, float, float, int]] = {}
+
+  @classmethod
+  def from_measurements(cls, measurements:Iterable[Measurement], strings:Optional[StringTable]=None) -> 'MeasurementBatch':
+    batch = cls(strings)
+    for measurement in measurements:
+      batch.append(measurement)
+    return batch
+
+  def add(
+    self, 
+    value       : float, 
+    timestamp   : int, 
+    dimension   : str, 
+    unit        : str, 
+    sensor_name : str, 
+    sensor_id   : str, 
+    summary     : Optional[Tuple[float, float, float, int]] = None
+  ):
+    encode = self.strings.encode
+    if summary is not None:
+      self.summaries[len(self.values)] = summary
+    self.values.append(value)
+    self.timestamps.append(timestamp)
+    self.dimensions.append(encode(dimension))
+    self.units.append(encode(unit))
+    self.sensor_names.append(encode(sensor_name))
+    self.sensor_ids.append(encode(sensor_id))
+
+  def append(self, measurement:Measurement, summary:Optional[Tuple[float, float, float, int]]=None):
+    self.add(
+      measurement.value,
+      timestamp_ns(measurement.timestamp),
+      measurement.dimension,
+      measurement.unit,
+      measurement.sensor_name,
+      measurement.sensor_id,
+      summary
+    )
+
+  def extend(self, batch:'MeasurementBatch'):
+    # Appends another batch's rows, summaries included
+    summaries = batch.summaries
+    for i, row in enumerate(batch.rows()):
+      self.add(*row, summaries.get(i))
+
+  def rows(self) -> Iterator[Tuple[float, int, str, str, str, str]]:
+    # Yields (value, timestamp, dimension, unit, sensor_name, sensor_id) without building Measurements
+    strings = self.strings.strings
+    for value, timestamp, dimension, unit, sensor_name, sensor_id in zip(
+      self.values, self.timestamps, self.dimensions, self.units, self.sensor_names, self.sensor_ids
+    ):
+      yield value, timestamp, strings[dimension], strings[unit], strings[sensor_name], strings[sensor_id]
+
+  def __getitem__(self, i:int) -> Measurement:
+    decode = self.strings.decode
+    return Measurement(
+      value       = self.values[i],
+      dimension   = decode(self.dimensions[i]),
+      unit        = decode(self.units[i]),
+      sensor_name = decode(self.sensor_names[i]),
+      sensor_id   = decode(self.sensor_ids[i]),
+      timestamp   = from_timestamp_ns(self.timestamps[i])
+    )
+
+  def __iter__(self) -> Iterator[Measurement]:
+    for i in range(len(self)):
+      yield self[i]
+
+  def __len__(self):
+    return len(self.values)
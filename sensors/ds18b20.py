@@ -1,49 +1,171 @@
+import os
 import glob
-from pint import Quantity
+import time
+from typing import Dict, List, Optional
+from loguru import logger
+from metrics import metrics
 from .base import Sensor, Measurement, Measurable, units
 
+ds18b20_log = logger.bind(tags=['ds18b20'])
+
 
 class DS18B20(Sensor):
   
-  def __init__(self):
-    # TODO: Handle multiple DS18B20 devices
+  # Seconds needed for a conversion at each resolution in bits
+  CONVERSION_TIMES = {9: 0.09375, 10: 0.1875, 11: 0.375, 12: 0.75}
+
+  def __init__(
+    self, 
+    base_dir        : str             = '/sys/bus/w1/devices/', 
+    resolution      : Optional[int]   = None,
+    frequency       : Optional[float] = None,
+    conversion_time : Optional[float] = None,
+    retries         : int             = 5
+  ):
     super().__init__(name='DS18B20', preferred_units=[units.fahrenheit])
-    self._base_dir = '/sys/bus/w1/devices/'
-    self._folder   = glob.glob(self._base_dir + '28*')[0]
-    self._file     = self._folder + '/w1_slave'
-    self._id       = self._folder.split('/')[-1]
+    if frequency is not None:
+      self.frequencies['temperature'] = frequency
+
+    self._base_dir                 = base_dir
+    self._folders, self._bulk_file = self._discover(base_dir)
+    if not self._folders:
+      raise RuntimeError(f'No DS18B20 devices found in {base_dir}')
+
+    self.retries       = retries
+    self.retry_delay   = 0.2
+    self._last_reading = None
+    self.resolution    = None
+    if resolution is not None:
+      self.set_resolution(resolution)
+    else:
+      self.resolution = self._read_resolution()
+    
+    # An explicit conversion time wins over the one implied by the resolution
+    self.conversion_time = conversion_time or self.CONVERSION_TIMES.get(self.resolution, 0.75)
+    ds18b20_log.info(
+      f'Found {len(self._folders)} DS18B20 device(s)', 
+      bulk_read  = self._bulk_file is not None,
+      resolution = self.resolution
+    )
+
+  def _discover(self, base_dir:str):
+    folders = sorted(glob.glob(os.path.join(base_dir, '28-*')))
+    
+    # Writing 'trigger' here starts a conversion on every probe on the bus at once
+    bulk_files = glob.glob(os.path.join(base_dir, 'w1_bus_master*', 'therm_bulk_read'))
+    return folders, bulk_files[0] if bulk_files else None
 
   @property
   def id(self):
-    return self._id
-  
-  @Measurable(frequency=1)
-  async def temperature(self) -> Measurement:
-    quantity = Quantity(await self._temperature(), units.celsius)
-    return self.create_measurement(quantity=quantity)
+    return self.ids[0]
+
+  @property
+  def ids(self) -> List[str]:
+    return [os.path.basename(folder) for folder in self._folders]
+
+  def set_resolution(self, bits:int):
+    # Lower resolutions convert faster: ~94 ms at 9 bits up to ~750 ms at 12 bits
+    if bits not in self.CONVERSION_TIMES:
+      raise ValueError(f'DS18B20 resolution must be one of {list(self.CONVERSION_TIMES)}, not {bits}')
     
-  async def _temperature(self):
-    def read_file():
+    for folder in self._folders:
       try:
-        with open(self._file, 'r') as f:
-          lines = f.readlines()
-        return lines
-      except Exception as e:
-        raise RuntimeWarning(f"Error reading sensor file: {e}")
-        return None
-   
-    lines = read_file()
-    if not lines:
-      return None
+        self._write_resolution(folder, bits)
+      except OSError as e:
+        raise RuntimeError(f'Could not set resolution of {os.path.basename(folder)}: {e}')
     
-    while lines[0].strip()[-3:] != 'YES':
-      time.sleep(0.2)
-      lines = read_file()
+    self.resolution      = bits
+    self.conversion_time = self.CONVERSION_TIMES[bits]
+    metrics.gauge('ds18b20.resolution', bits, sensor_id=self.id)
+    ds18b20_log.info(f'Set resolution to {bits} bits', conversion_time=self.conversion_time)
+
+  def _write_resolution(self, folder:str, bits:int):
+    with open(os.path.join(folder, 'resolution'), 'w') as f:
+      f.write(f'{bits}\n')
+
+  def _read_resolution(self) -> Optional[int]:
+    try:
+      with open(os.path.join(self._folders[0], 'resolution'), 'r') as f:
+        return int(f.read().strip())
+    except (OSError, ValueError):
+      return None
+
+  @Measurable(frequency=1, blocking=True)
+  def temperature(self) -> List[Measurement]:
+    measurements = []
+    for sensor_id, celsius in self._temperatures().items():
+      if celsius is not None:
+        measurements.append(self.make_measurement(celsius, units.celsius, sensor_id=sensor_id))
     
-    equals_position = lines[1].find('t=')
-    if equals_position != -1:
-      temperature_string  = lines[1][equals_position+2:]
-      temperature_celsius = float(temperature_string) / 1000.0
-      return temperature_celsius
-        
-    
\ No newline at end of file
+    # The rate actually achieved, which the conversion time can hold below the scheduled one
+    now = time.monotonic()
+    if self._last_reading is not None:
+      metrics.gauge('ds18b20.sample_rate', 1 / (now - self._last_reading), sensor_id=self.id)
+    self._last_reading = now
+    return measurements
+
+  def _temperatures(self) -> Dict[str, Optional[float]]:
+    # With a bulk conversion every w1_slave read below returns the converted value straight away,
+    # otherwise each read starts (and waits for) its own conversion
+    self._convert()
+    temperatures = {}
+    for folder in self._folders:
+      sensor_id = os.path.basename(folder)
+      try:
+        temperatures[sensor_id] = self._temperature(folder)
+      except RuntimeWarning as e:
+        # An unplugged probe only loses its own reading
+        ds18b20_log.warning(f'Could not read {sensor_id}: {e}')
+        temperatures[sensor_id] = None
+    return temperatures
+
+  def _convert(self) -> bool:
+    if self._bulk_file is None:
+      return False
+
+    try:
+      with open(self._bulk_file, 'w') as f:
+        f.write('trigger\n')
+    except OSError as e:
+      ds18b20_log.warning(f'Bulk conversion failed, reading probes one at a time: {e}')
+      return False
+
+    # therm_bulk_read reads -1 while any probe is still converting
+    deadline = time.monotonic() + 2 * self.conversion_time
+    time.sleep(self.conversion_time)
+    while self._bulk_state() == '-1' and time.monotonic() < deadline:
+      time.sleep(self.conversion_time / 10)
+    return True
+
+  def _bulk_state(self) -> Optional[str]:
+    try:
+      with open(self._bulk_file, 'r') as f:
+        return f.read().strip()
+    except OSError:
+      return None
+
+  def _read_lines(self, folder:str) -> List[str]:
+    try:
+      with open(os.path.join(folder, 'w1_slave'), 'r') as f:
+        return f.readlines()
+    except Exception as e:
+      raise RuntimeWarning(f"Error reading sensor file: {e}")
+
+  def _temperature(self, folder:str) -> Optional[float]:
+    for _ in range(self.retries):
+      lines = self._read_lines(folder)
+      if not lines:
+        return None
+
+      if lines[0].strip()[-3:] == 'YES':
+        equals_position = lines[1].find('t=')
+        if equals_position != -1:
+          temperature_string  = lines[1][equals_position+2:]
+          temperature_celsius = float(temperature_string) / 1000.0
+          return temperature_celsius
+        return None
+
+      time.sleep(self.retry_delay)
+
+    ds18b20_log.warning(f'CRC check failed {self.retries} times for {os.path.basename(folder)}')
+    return None
@@ -0,0 +1,60 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from loguru import logger
+from metrics import metrics
+
+executor_log = logger.bind(tags=['executor'])
+
+
+class BlockingExecutor:
+  # Runs sensor reads that block (I2C transactions, sysfs polling, psutil intervals)
+  # on a small thread pool so the event loop keeps serving the screen and buttons.
+
+  def __init__(self, max_workers:int=2, timeout:float=5.0):
+    self.max_workers = max_workers
+    self.timeout     = timeout
+    self.pool        = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sensor-io')
+
+  async def run(self, name:str, function:Callable, *args, timeout:Optional[float]=None, **kwargs):
+    # The timeout runs from when a worker picks the read up, so a read queued behind a slow one
+    # is not cut short. Time spent waiting for a worker is recorded on its own.
+    timeout = self.timeout if timeout is None else timeout
+    loop    = asyncio.get_running_loop()
+    picked  = loop.create_future()
+
+    def call():
+      started = time.perf_counter()
+      loop.call_soon_threadsafe(lambda: picked.done() or picked.set_result(started))
+      return function(*args, **kwargs)
+
+    queued  = time.perf_counter()
+    started = None
+    future  = loop.run_in_executor(self.pool, call)
+    # A read dropped from the queue by shutdown() is never picked up
+    future.add_done_callback(lambda _: picked.done() or picked.cancel())
+    try:
+      try:
+        started = await picked
+      except asyncio.CancelledError:
+        future.cancel()
+        raise
+      metrics.observe('executor.queued_seconds', started - queued, measurable=name)
+
+      try:
+        return await asyncio.wait_for(future, max(0.0, started + timeout - time.perf_counter()))
+      except asyncio.TimeoutError:
+        # The worker thread cannot be interrupted, it is only abandoned until the read returns
+        metrics.increment('executor.timeouts', measurable=name)
+        raise TimeoutError(f'{name} did not finish within {timeout}s')
+    finally:
+      elapsed = time.perf_counter() - (queued if started is None else started)
+      metrics.observe('executor.seconds', elapsed, measurable=name)
+      executor_log.trace(f'{name} spent {elapsed:.3f}s in executor')
+
+  def shutdown(self, wait:bool=False):
+    self.pool.shutdown(wait=wait, cancel_futures=True)
+
+
+executor = BlockingExecutor()
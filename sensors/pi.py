@@ -2,7 +2,6 @@ import os
 import psutil
 import subprocess
 import asyncio
-from pint import Quantity
 from .base import Sensor, Measurement, Measurable, units
 
 
@@ -46,40 +45,44 @@ class RaspberryPi(Sensor):
   def id(self):
     return self._id
   
-  @Measurable(frequency=30)
-  async def cpu_load(self) -> Measurement:
-    # Get CPU load as percentage (average over all cores)
-    load = psutil.cpu_percent(interval=1)
-    quantity = Quantity(load, units.percent)
-    return self.create_measurement(quantity=quantity, override_dimension='cpu_load')
+  def _cpu_percent(self) -> float:
+    return psutil.cpu_percent(interval=1)
+  
+  def _memory_percent(self) -> float:
+    return psutil.virtual_memory().percent
+  
+  def _disk_percent(self) -> float:
+    return psutil.disk_usage('/').percent
+  
+  def _cpu_temp_celsius(self) -> float:
+    with open(self._temp_path, 'r') as f:
+      return int(f.read().strip()) / 1000.0
+  
+  @Measurable(frequency=30, blocking=True)
+  def cpu_load(self) -> Measurement:
+    # Get CPU load as percentage (average over all cores), sampled over a one second interval
+    load = self._cpu_percent()
+    return self.make_measurement(load, units.percent, override_dimension='cpu_load')
   
   @Measurable(frequency=30)
   async def memory_usage(self) -> Measurement:
     # Get memory usage as percentage
-    memory = psutil.virtual_memory()
-    quantity = Quantity(memory.percent, units.percent)
-    return self.create_measurement(quantity=quantity, override_dimension='memory_usage')
+    return self.make_measurement(self._memory_percent(), units.percent, override_dimension='memory_usage')
   
   @Measurable(frequency=30)
   async def disk_usage(self) -> Measurement:
     # Get disk usage as percentage for root partition
-    disk = psutil.disk_usage('/')
-    quantity = Quantity(disk.percent, units.percent)
-    return self.create_measurement(quantity=quantity, override_dimension='disk_usage')
+    return self.make_measurement(self._disk_percent(), units.percent, override_dimension='disk_usage')
   
   @Measurable(frequency=30)
   async def cpu_temp(self) -> Measurement:
       # Read CPU temperature from system file and convert to Fahrenheit
       try:
-        with open(self._temp_path, 'r') as f:
-          temp_millicelsius = int(f.read().strip())
-          temp_celsius = temp_millicelsius / 1000.0
-          # Create quantity in Celsius but will be converted to Fahrenheit by preferred_units
-          quantity = Quantity(temp_celsius, units.celsius)
-          return self.create_measurement(quantity=quantity)
+        temp_celsius = self._cpu_temp_celsius()
+        # Create quantity in Celsius but will be converted to Fahrenheit by preferred_units
+        return self.make_measurement(temp_celsius, units.celsius)
       except (IOError, ValueError) as e:
         # Fallback for systems without temperature sensor
         print(f"Error reading CPU temperature: {e}")
         # Return 0°C as fallback (will be converted to °F)
-        quantity = Quantity(0, units.celsius)
-        return self.create_measurement(quantity=quantity)
\ No newline at end of file
+        return self.make_measurement(0, units.celsius)
\ No newline at end of file
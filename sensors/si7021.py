@@ -1,29 +1,29 @@
-import board
-import adafruit_si7021
 from loguru import logger
-from pint import Quantity
 from .base import Sensor, Measurement, Measurable, units
 
 class SI7021(Sensor):
   
-  def __init__(self):
+  def __init__(self, device=None):
     super().__init__(name='SI7021', preferred_units=[units.fahrenheit, units.percent])
-    self._sensor = adafruit_si7021.SI7021(board.I2C())
+    if device is None:
+      # Imported here so the package can be used without the Blinka hardware stack
+      import board
+      import adafruit_si7021
+      device = adafruit_si7021.SI7021(board.I2C())
+    self._sensor = device
 
   @property
   def id(self):
     return self._sensor.serial_number
   
-  @Measurable(frequency=60)
-  async def temperature(self) -> Measurement:
-    quantity = Quantity(self._sensor.temperature, units.celsius)
-    return self.create_measurement(quantity=quantity)
+  @Measurable(frequency=60, blocking=True)
+  def temperature(self) -> Measurement:
+    return self.make_measurement(self._sensor.temperature, units.celsius)
     
-  @Measurable(frequency=60)
-  async def relative_humidity(self) -> Measurement:
+  @Measurable(frequency=60, blocking=True)
+  def relative_humidity(self) -> Measurement:
     try:
-      quantity = Quantity(self._sensor.relative_humidity, units.percent)
-      return self.create_measurement(quantity=quantity, override_dimension='relative_humidity')
+      return self.make_measurement(self._sensor.relative_humidity, units.percent, override_dimension='relative_humidity')
     except ValueError as e:
       logger.error(e)
       pass
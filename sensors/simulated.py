@@ -0,0 +1,200 @@
+import math
+import time
+import random
+from typing import Dict, List, Optional
+from .base import Sensor
+from .ds18b20 import DS18B20
+from .sht41 import SHT41
+from .si7021 import SI7021
+from .pi import RaspberryPi
+
+
+class Signal:
+  # A value that follows a daily cycle around a baseline, wanders off it in a random walk and carries noise
+
+  def __init__(
+    self,
+    baseline  : float,
+    amplitude : float = 0.0,
+    period    : float = 86_400.0,
+    drift     : float = 0.0,
+    noise     : float = 0.0,
+    minimum   : float = -math.inf,
+    maximum   : float = math.inf
+  ):
+    self.baseline  = baseline
+    self.amplitude = amplitude
+    self.period    = period
+    self.drift     = drift
+    self.noise     = noise
+    self.minimum   = minimum
+    self.maximum   = maximum
+    self.offset    = 0.0
+    self.last      = None
+
+  def sample(self, t:float, rng:random.Random) -> float:
+    # drift is the standard deviation of the random walk after one second
+    if self.last is not None and t > self.last:
+      self.offset += rng.gauss(0.0, self.drift * math.sqrt(t - self.last))
+    self.last = t
+
+    value = (
+      self.baseline
+      + self.offset
+      + self.amplitude * math.sin(2 * math.pi * t / self.period)
+      + rng.gauss(0.0, self.noise)
+    )
+    return min(self.maximum, max(self.minimum, value))
+
+
+class Simulation:
+  # Shared settings for simulated sensors. Time runs `speed` times faster than real time, and
+  # latency (in simulated seconds) is added to every read, a share of which fail.
+
+  def __init__(self, speed:float=1.0, latency:float=0.0, failure_rate:float=0.0, seed:Optional[int]=None):
+    if speed <= 0:
+      raise ValueError('Simulation speed must be positive')
+    self.speed        = speed
+    self.latency      = latency
+    self.failure_rate = failure_rate
+    self.rng          = random.Random(seed)
+    self.started      = time.monotonic()
+
+  def now(self) -> float:
+    return (time.monotonic() - self.started) * self.speed
+
+  def sleep(self, seconds:float):
+    if seconds > 0:
+      time.sleep(seconds / self.speed)
+
+  def failed(self) -> bool:
+    return self.rng.random() < self.failure_rate
+
+  def read(self, signal:Signal, duration:float=0.0) -> float:
+    self.sleep(duration + self.latency)
+    if self.failed():
+      raise RuntimeError('Simulated read failure')
+    return signal.sample(self.now(), self.rng)
+
+  def accelerate(self, sensor:Sensor):
+    # Schedules every measurable of the sensor `speed` times more often
+    for name, measurable in sensor.measurables.items():
+      sensor.frequencies[name] = sensor.frequencies.get(name, measurable.frequency) / self.speed
+
+
+class SimulatedDS18B20(DS18B20):
+  # Replaces the 1-Wire sysfs files, so the driver's own bulk conversion, parsing and CRC retries still run
+
+  def __init__(self, simulation:Optional[Simulation]=None, count:int=1, **kwargs):
+    self.simulation  = simulation or Simulation()
+    self._count      = count
+    self._resolution = 12
+    self._signals    : Dict[str, Signal] = {}
+    super().__init__(base_dir='simulated', **kwargs)
+    self.retry_delay = 0.2 / self.simulation.speed
+    self.simulation.accelerate(self)
+
+  def _discover(self, base_dir:str):
+    folders = [f'{base_dir}/28-{i + 1:012x}' for i in range(self._count)]
+    for i, folder in enumerate(folders):
+      self._signals[folder] = Signal(baseline=36.8 + 0.1 * i, amplitude=0.3, drift=0.002, noise=0.02)
+    return folders, f'{base_dir}/w1_bus_master1/therm_bulk_read'
+
+  def _convert(self) -> bool:
+    self.simulation.sleep(self.conversion_time)
+    return True
+
+  def _write_resolution(self, folder:str, bits:int):
+    self._resolution = bits
+
+  def _read_resolution(self) -> Optional[int]:
+    return self._resolution
+
+  def _read_lines(self, folder:str) -> List[str]:
+    self.simulation.sleep(self.simulation.latency)
+    celsius = self._signals[folder].sample(self.simulation.now(), self.simulation.rng)
+    crc     = 'NO' if self.simulation.failed() else 'YES'
+    return [
+      f'72 01 4b 46 7f ff 0e 10 57 : crc=57 {crc}\n',
+      f'72 01 4b 46 7f ff 0e 10 57 t={round(celsius * 1000)}\n'
+    ]
+
+
+class SimulatedI2CDevice:
+  # Stands in for the Adafruit SHT4x and SI7021 drivers
+
+  def __init__(self, simulation:Simulation, serial_number:int, duration:float, temperature:Signal, humidity:Signal):
+    self.simulation    = simulation
+    self.serial_number = serial_number
+    self.duration      = duration
+    self._temperature  = temperature
+    self._humidity     = humidity
+
+  @property
+  def temperature(self) -> float:
+    return self.simulation.read(self._temperature, self.duration)
+
+  @property
+  def relative_humidity(self) -> float:
+    return self.simulation.read(self._humidity, self.duration)
+
+
+class SimulatedSHT41(SHT41):
+
+  def __init__(self, simulation:Optional[Simulation]=None):
+    self.simulation = simulation or Simulation()
+    super().__init__(device=SimulatedI2CDevice(
+      self.simulation,
+      serial_number = 0x0A1B2C3D,
+      duration      = 0.01,
+      temperature   = Signal(baseline=22.0, amplitude=2.0, drift=0.005, noise=0.05),
+      humidity      = Signal(baseline=45.0, amplitude=8.0, drift=0.02, noise=0.3, minimum=0.0, maximum=100.0)
+    ))
+    self.simulation.accelerate(self)
+
+
+class SimulatedSI7021(SI7021):
+
+  def __init__(self, simulation:Optional[Simulation]=None):
+    self.simulation = simulation or Simulation()
+    super().__init__(device=SimulatedI2CDevice(
+      self.simulation,
+      serial_number = 0x15B5A2F0,
+      duration      = 0.02,
+      temperature   = Signal(baseline=22.0, amplitude=2.0, drift=0.005, noise=0.1),
+      humidity      = Signal(baseline=45.0, amplitude=8.0, drift=0.02, noise=0.5, minimum=0.0, maximum=100.0)
+    ))
+    self.simulation.accelerate(self)
+
+
+class SimulatedRaspberryPi(RaspberryPi):
+
+  def __init__(self, simulation:Optional[Simulation]=None):
+    self.simulation = simulation or Simulation()
+    self._signals   = {
+      'cpu_load'     : Signal(baseline=15.0, drift=0.5, noise=5.0, minimum=0.0, maximum=100.0),
+      'memory_usage' : Signal(baseline=40.0, drift=0.05, noise=0.5, minimum=0.0, maximum=100.0),
+      'disk_usage'   : Signal(baseline=30.0, drift=0.0001, minimum=0.0, maximum=100.0),
+      'cpu_temp'     : Signal(baseline=48.0, amplitude=3.0, drift=0.05, noise=0.5)
+    }
+    super().__init__()
+    self.simulation.accelerate(self)
+
+  def _get_hardware_id(self):
+    return 'simulated'
+
+  def _cpu_percent(self) -> float:
+    # psutil samples the load over a one second interval
+    return self.simulation.read(self._signals['cpu_load'], duration=1.0)
+
+  def _memory_percent(self) -> float:
+    return self.simulation.read(self._signals['memory_usage'])
+
+  def _disk_percent(self) -> float:
+    return self.simulation.read(self._signals['disk_usage'])
+
+  def _cpu_temp_celsius(self) -> float:
+    try:
+      return self.simulation.read(self._signals['cpu_temp'])
+    except RuntimeError as e:
+      raise IOError(e)
@@ -0,0 +1,9 @@
+import pytest
+from clients.buffer import MeasurementBuffer
+
+
+@pytest.fixture
+def buffer(tmp_path):
+  buffer = MeasurementBuffer(db_path=str(tmp_path / 'buffer.db'))
+  yield buffer
+  buffer.close()
@@ -0,0 +1,15 @@
+from datetime import datetime
+from sensors.base import Measurement
+
+
+class Clock:
+  # Stands in for time.monotonic, tests move it forward by setting `now`
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+
+def reading(value=98.6, dimension='temperature', sensor_id='28-000000000001', second=0, microsecond=500, unit='degree_fahrenheit', sensor_name='DS18B20'):
+  return Measurement(value, dimension, unit, sensor_name, sensor_id, datetime(2025, 1, 1, 12, 0, second, microsecond))
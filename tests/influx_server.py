@@ -0,0 +1,139 @@
+import gzip
+import time
+import random
+import threading
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from urllib.parse import urlparse, parse_qs
+
+
+@dataclass
+class Fault:
+  # Misbehaviour between start and end, in seconds after the server started. rate is the share
+  # of requests affected, below 1 for a partial outage.
+  start  : float
+  end    : float
+  delay  : float         = 0.0
+  status : Optional[int] = None
+  drop   : bool          = False
+  rate   : float         = 1.0
+
+
+class InfluxServer:
+  # Stands in for InfluxDB's /api/v2/write on a local port. Records every write it receives,
+  # answers with `status` after `delay` seconds, and keeps connections alive like InfluxDB.
+  # Faults, checked in order, override that while they are active: adding latency, answering
+  # 429/503 or dropping the connection without an answer.
+
+  def __init__(self, status:int=204, delay:float=0.0, faults:Optional[List[Fault]]=None, seed:Optional[int]=None):
+    self.status   = status
+    self.delay    = delay
+    self.faults   = faults or []
+    self.rng      = random.Random(seed)
+    self.requests = []
+    self.lock     = threading.Lock()
+    self.started  = None
+
+    server = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'
+
+      def log_message(self, *args):
+        pass
+
+      def do_GET(self):
+        # /ping
+        fault = server.fault()
+        if fault and fault.drop:
+          self.close_connection = True
+          return
+        time.sleep(fault.delay if fault else 0.0)
+        self.respond(fault.status if fault and fault.status else 204)
+
+      def do_POST(self):
+        received = time.time()
+        fault    = server.fault()
+        body     = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(server.delay + (fault.delay if fault else 0.0))
+
+        if fault and fault.drop:
+          status = None
+        elif fault and fault.status:
+          status = fault.status
+        else:
+          status = server.status
+
+        size = len(body)
+        if self.headers.get('Content-Encoding') == 'gzip':
+          body = gzip.decompress(body)
+        url = urlparse(self.path)
+        with server.lock:
+          server.requests.append(dict(
+            path     = url.path,
+            query    = {k: v[0] for k, v in parse_qs(url.query).items()},
+            port     = self.client_address[1],
+            lines    = body.split(b'\n'),
+            bytes    = size,
+            encoding = self.headers.get('Content-Encoding'),
+            received = received,
+            status   = status
+          ))
+
+        if status is None:
+          # Hangs up without answering, as a dropped connection looks to the client
+          self.close_connection = True
+          return
+        self.respond(status)
+
+      def respond(self, status:int):
+        body = b'' if status < 300 else b'{"code":"unavailable","message":"stand-in failure"}'
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        if status == 429:
+          self.send_header('Retry-After', '1')
+        if body:
+          self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body)
+
+    self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    self.server.daemon_threads = True
+    self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+  def fault(self) -> Optional[Fault]:
+    elapsed = time.monotonic() - self.started
+    with self.lock:
+      for fault in self.faults:
+        if fault.start <= elapsed < fault.end and self.rng.random() < fault.rate:
+          return fault
+    return None
+
+  @property
+  def url(self) -> str:
+    return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+  @property
+  def lines(self):
+    with self.lock:
+      return [line for request in self.requests for line in request['lines']]
+
+  @property
+  def accepted(self):
+    # Lines from writes that were answered with success, and when they arrived
+    with self.lock:
+      return [
+        (line, request['received'])
+        for request in self.requests if request['status'] and request['status'] < 300
+        for line in request['lines']
+      ]
+
+  def __enter__(self):
+    self.started = time.monotonic()
+    self.thread.start()
+    return self
+
+  def __exit__(self, *args):
+    self.server.shutdown()
+    self.server.server_close()
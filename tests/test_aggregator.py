@@ -0,0 +1,46 @@
+from aggregator import Aggregator, Aggregate
+from tests.helpers import reading
+
+
+def test_window_emits_summary_when_full():
+  aggregator = Aggregator(windows={'temperature': 4})
+  emitted    = []
+  for value in [97.0, 98.0, 104.0, 97.0]:
+    emitted += aggregator.add(reading(value))
+
+  assert len(emitted) == 1
+  aggregate = emitted[0]
+  assert isinstance(aggregate, Aggregate)
+  assert (aggregate.mean, aggregate.min, aggregate.max, aggregate.last, aggregate.count) == (99.0, 97.0, 104.0, 97.0, 4)
+
+
+def test_series_are_windowed_separately():
+  aggregator = Aggregator(windows={'temperature': 2})
+  assert aggregator.add(reading(97.0, sensor_id='a')) == []
+  assert aggregator.add(reading(98.0, sensor_id='b')) == []
+  assert [a.sensor_id for a in aggregator.add(reading(99.0, sensor_id='a'))] == ['a']
+
+
+def test_other_dimensions_pass_through():
+  aggregator  = Aggregator(windows={'temperature': 10})
+  measurement = reading(12.0, dimension='cpu_load')
+  assert aggregator.add(measurement) == [measurement]
+
+
+def test_windows_can_be_set_per_sensor():
+  aggregator = Aggregator(windows={('DS18B20', 'temperature'): 10})
+  cpu_temp   = reading(120.0, sensor_id='pi', sensor_name='RPi Zero 2W')
+  assert aggregator.add(reading(97.0)) == []
+  assert aggregator.add(cpu_temp) == [cpu_temp]
+
+
+def test_old_windows_are_closed():
+  aggregator = Aggregator(windows={'temperature': 10}, max_age=0)
+  assert [a.count for a in aggregator.add(reading(97.0))] == [1]
+
+
+def test_flush_returns_partial_windows():
+  aggregator = Aggregator(windows={'temperature': 10})
+  aggregator.add(reading(97.0))
+  assert [a.count for a in aggregator.flush()] == [1]
+  assert aggregator.flush() == []
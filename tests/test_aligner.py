@@ -0,0 +1,42 @@
+from datetime import datetime
+from aggregator import Aggregate
+from aligner import Aligner
+from tests.helpers import Clock, reading
+
+
+def test_readings_in_one_tick_are_grouped():
+  aligner = Aligner(tick=1.0, clock=Clock())
+  assert aligner.add(reading(21.0, microsecond=100_000)) == []
+  assert aligner.add(reading(45.0, 'relative_humidity', microsecond=400_000)) == []
+
+  [sample] = aligner.add(reading(21.1, second=1))
+  assert sample.timestamp == datetime(2025, 1, 1, 12, 0, 0)
+  assert {d: (m.value, m.timestamp) for d, m in sample.items.items()} == {
+    'temperature'       : (21.0, datetime(2025, 1, 1, 12, 0, 0)),
+    'relative_humidity' : (45.0, datetime(2025, 1, 1, 12, 0, 0))
+  }
+  assert [s.items['temperature'].value for s in aligner.flush()] == [21.1]
+
+
+def test_sensors_are_grouped_separately_and_keep_the_latest_reading():
+  aligner = Aligner(tick=5.0, clock=Clock())
+  aligner.add(reading(21.0, sensor_id='0x44'))
+  aligner.add(reading(22.0, sensor_id='0x45'))
+  aligner.add(reading(21.5, second=3, sensor_id='0x44'))
+
+  samples = aligner.flush()
+  assert [(s.sensor_id, s.items['temperature'].value) for s in samples] == [('0x44', 21.5), ('0x45', 22.0)]
+
+
+def test_samples_expire_after_their_tick_and_grace():
+  clock   = Clock()
+  aligner = Aligner(tick=1.0, grace=0.5, clock=clock)
+  start   = datetime(2025, 1, 1, 12, 0, 0).timestamp()
+  aligner.add(Aggregate(21.0, 20.5, 21.5, 21.2, 10, 'temperature', 'degree_Celsius', 'DS18B20', '28-1', datetime.fromtimestamp(start + 0.2)))
+
+  clock.now = start + 1.4
+  assert aligner.add(reading(45.0, 'relative_humidity', second=1)) == []
+  clock.now = start + 1.5
+  [sample] = aligner.add(reading(45.0, 'relative_humidity', second=1))
+  assert sample.sensor_name == 'DS18B20'
+  assert sample.items['temperature'].count == 10
@@ -0,0 +1,39 @@
+from datetime import datetime
+from sensors.base import Measurement
+from sensors.batch import MeasurementBatch, StringTable
+
+
+def make_measurements(count):
+  return [
+    Measurement(
+      value       = 98.6 + i,
+      dimension   = 'temperature',
+      unit        = 'degree_fahrenheit',
+      sensor_name = 'DS18B20',
+      sensor_id   = f'28-00000000000{i % 2}',
+      timestamp   = datetime(2025, 1, 1, 12, 0, i, 123456)
+    )
+    for i in range(count)
+  ]
+
+
+def test_batch_round_trips_measurements():
+  measurements = make_measurements(4)
+  batch        = MeasurementBatch.from_measurements(measurements)
+
+  assert len(batch) == 4
+  assert list(batch) == measurements
+
+
+def test_strings_are_dictionary_encoded():
+  batch = MeasurementBatch.from_measurements(make_measurements(10))
+  assert len(batch.strings) == 5
+  assert set(batch.sensor_ids) == {3, 4}
+
+
+def test_string_table_can_be_shared():
+  strings = StringTable()
+  first   = MeasurementBatch.from_measurements(make_measurements(2), strings)
+  second  = MeasurementBatch.from_measurements(make_measurements(2), strings)
+  assert first.strings is second.strings
+  assert len(strings) == 5
@@ -0,0 +1,342 @@
+import json
+import time
+import sqlite3
+import threading
+import pytest
+from datetime import datetime, timedelta
+from sensors.base import Measurement
+from sensors.batch import MeasurementBatch
+from aggregator import Aggregate
+from clients.buffer import MeasurementBuffer, SCHEMA_VERSION
+from clients.writer import GroupCommitWriter
+from tests.helpers import reading
+
+
+def test_buffer_uses_wal(buffer):
+  assert buffer.conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+def test_pending_round_trip(buffer):
+  buffer.insert(reading(97.0))
+  buffer.insert(reading(98.0))
+
+  pending = buffer.get_pending()
+  assert [m for _, m in pending] == [reading(97.0), reading(98.0)]
+  assert buffer.length == 2
+
+  assert buffer.mark_processed(pending[0][0])
+  assert buffer.length == 1
+
+
+def test_buffer_is_shared_across_threads(buffer):
+  threads = [threading.Thread(target=lambda: [buffer.insert(reading()) for _ in range(50)]) for _ in range(4)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert buffer.length == 200
+
+
+def test_buffer_survives_reopening(tmp_path):
+  buffer = MeasurementBuffer(db_path=str(tmp_path / 'buffer.db'))
+  buffer.insert(reading())
+  buffer.close()
+
+  reopened = MeasurementBuffer(db_path=str(tmp_path / 'buffer.db'))
+  assert reopened.length == 1
+  reopened.close()
+
+
+def test_insert_many_inserts_in_order(buffer):
+  assert buffer.insert_many([reading(v) for v in range(10)])
+  assert buffer.length == 10
+  assert [m.value for _, m in buffer.get_pending()] == list(range(10))
+
+
+def test_group_commit_writer_flushes_on_rows(buffer):
+  writer = GroupCommitWriter(buffer, interval=60_000, max_rows=5)
+  for v in range(5):
+    writer.insert(reading(v))
+
+  deadline = time.monotonic() + 5
+  while buffer.length < 5 and time.monotonic() < deadline:
+    time.sleep(0.01)
+  assert buffer.length == 5
+  writer.close()
+
+
+def test_group_commit_writer_flushes_on_close(buffer):
+  writer = GroupCommitWriter(buffer, interval=60_000, max_rows=1000)
+  writer.insert_many([reading(v) for v in range(3)])
+  assert writer.length == 3
+  writer.close()
+  assert buffer.length == 3
+
+
+def test_group_commit_writer_keeps_summaries(buffer):
+  aggregate = Aggregate(
+    mean = 1.5, min = 1.0, max = 2.0, last = 2.0, count = 2, dimension = 'temperature', unit = 'degree_fahrenheit',
+    sensor_name = 'DS18B20', sensor_id = '28-000000000001', timestamp = datetime(2025, 1, 1)
+  )
+  writer = GroupCommitWriter(buffer, interval=60_000, max_rows=1000)
+  writer.insert_batch(MeasurementBatch.from_measurements([reading()]))
+  writer.insert_many([aggregate])
+  batch = MeasurementBatch()
+  batch.append(aggregate, (1.0, 2.0, 2.0, 2))
+  writer.insert_batch(batch)
+  writer.close()
+  assert [m for _, m in buffer.get_pending()] == [reading(), aggregate, aggregate]
+
+
+def test_counts_are_tracked_without_counting(buffer):
+  buffer.insert_many([reading(v) for v in range(5)])
+  buffer.mark_processed(1)
+  buffer.mark_processed(1)
+  assert buffer.pending_count == 4
+  assert buffer.conn.execute('SELECT COUNT(*) FROM measurements').fetchone()[0] == 4
+
+
+def test_acknowledge_range(buffer):
+  buffer.insert_many([reading(v) for v in range(10)])
+  pending = buffer.get_pending(limit=6)
+
+  # The range can cover ids that are already gone
+  buffer.acknowledge([3])
+  assert buffer.acknowledge(range(pending[0][0], pending[-1][0] + 1)) == 5
+  assert [m.value for _, m in buffer.get_pending()] == [6, 7, 8, 9]
+  assert buffer.length == 4
+
+
+def test_acknowledge_ids(buffer):
+  buffer.insert_many([reading(v) for v in range(10)])
+  assert buffer.acknowledge([9, 1, 2, 2, 3, 7, 42]) == 5
+  assert [m.value for _, m in buffer.get_pending()] == [3, 4, 5, 7, 9]
+  assert buffer.length == 5
+
+
+@pytest.mark.parametrize('overflow, kept', [
+  ('drop_oldest', [4, 5, 6, 7, 8, 9, 10, 11]),
+  ('downsample',  [0, 2, 4, 6, 8, 9, 10, 11]),
+])
+def test_overflow_of_pending_rows(tmp_path, overflow, kept):
+  buffer = MeasurementBuffer(db_path=str(tmp_path / 'buffer.db'), max_size=8, rotate_chunk=4, overflow=overflow)
+  buffer.insert_many([reading(v) for v in range(8)])
+  buffer.insert_many([reading(v) for v in range(8, 12)])
+
+  assert [m.value for _, m in buffer.get_pending()] == kept
+  assert buffer.length == len(kept)
+  buffer.close()
+
+
+def test_downsample_keeps_every_series(tmp_path):
+  buffer = MeasurementBuffer(db_path=str(tmp_path / 'buffer.db'), max_size=8, rotate_chunk=4, overflow='downsample')
+  buffer.insert_many([reading(v, sensor_id=sensor_id) for v in range(6) for sensor_id in ('28-A', '28-B')])
+
+  # The oldest 8 rows lose every other reading of each probe
+  pending = [(m.sensor_id, m.value) for _, m in buffer.get_pending()]
+  assert pending == [('28-A', 0), ('28-B', 0), ('28-A', 2), ('28-B', 2), ('28-A', 4), ('28-B', 4), ('28-A', 5), ('28-B', 5)]
+  buffer.close()
+
+
+def test_refuse_overflow(tmp_path):
+  buffer = MeasurementBuffer(db_path=str(tmp_path / 'buffer.db'), max_size=2, overflow='refuse')
+  assert buffer.insert_many([reading(), reading()])
+  assert not buffer.insert(reading())
+  assert buffer.length == 2
+  buffer.close()
+
+
+def test_counts_are_loaded_at_startup(tmp_path):
+  buffer = MeasurementBuffer(db_path=str(tmp_path / 'buffer.db'))
+  buffer.insert_many([reading(), reading()])
+  buffer.mark_processed(1)
+  buffer.close()
+
+  reopened = MeasurementBuffer(db_path=str(tmp_path / 'buffer.db'))
+  assert reopened.pending_count == 1
+  reopened.close()
+
+
+def test_rows_share_a_series(buffer):
+  buffer.insert_many([reading(), reading(), reading(sensor_id='28-000000000002')])
+  buffer.insert_batch(MeasurementBatch.from_measurements([reading(99.0)]))
+
+  assert buffer.conn.execute('SELECT COUNT(*) FROM series').fetchone()[0] == 2
+  assert [m for _, m in buffer.get_pending()][-1] == reading(99.0)
+
+
+def test_series_survive_reopening(tmp_path):
+  buffer = MeasurementBuffer(db_path=str(tmp_path / 'buffer.db'))
+  buffer.insert(reading())
+  buffer.close()
+
+  reopened = MeasurementBuffer(db_path=str(tmp_path / 'buffer.db'))
+  reopened.insert(reading(99.0))
+  assert [m for _, m in reopened.get_pending()] == [reading(), reading(99.0)]
+  assert reopened.conn.execute('SELECT COUNT(*) FROM series').fetchone()[0] == 1
+  reopened.close()
+
+
+def test_json_rows_are_migrated(tmp_path):
+  path = str(tmp_path / 'buffer.db')
+  conn = sqlite3.connect(path)
+  conn.execute('''
+    CREATE TABLE measurements (
+      id         INTEGER PRIMARY KEY AUTOINCREMENT,
+      timestamp  REAL    NOT NULL,
+      processed  INTEGER DEFAULT 0,
+      data       TEXT    NOT NULL
+    )
+  ''')
+  for value, processed in [(97.0, 1), (98.0, 0), (99.0, 0)]:
+    m = reading(value)
+    conn.execute('INSERT INTO measurements (timestamp, processed, data) VALUES (?, ?, ?)', (time.time(), processed, json.dumps({
+      'value'       : m.value,
+      'dimension'   : m.dimension,
+      'unit'        : m.unit,
+      'sensor_name' : m.sensor_name,
+      'sensor_id'   : m.sensor_id,
+      'timestamp'   : m.timestamp.isoformat()
+    })))
+  conn.execute('DELETE FROM measurements WHERE id = 3')
+  conn.commit()
+  conn.close()
+
+  buffer = MeasurementBuffer(db_path=path)
+  assert buffer.conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+  assert buffer.pending_count == 1
+  assert buffer.get_pending() == [(2, reading(98.0))]
+
+  # Ids of rows deleted before the migration are not handed out again
+  buffer.insert(reading(100.0))
+  assert [row_id for row_id, _ in buffer.get_pending()] == [2, 4]
+  buffer.close()
+
+
+def test_iter_pending_streams_chunks(buffer):
+  buffer.insert_many([reading(v) for v in range(10)])
+
+  chunks = buffer.iter_pending(chunk_size=4)
+  ids, batch = next(chunks)
+  assert ids == range(1, 5)
+  assert [m.value for m in batch] == [0, 1, 2, 3]
+
+  # Rows acknowledged or added while streaming are picked up by the next chunk
+  buffer.acknowledge(ids)
+  buffer.acknowledge([6])
+  buffer.insert(reading(10))
+  assert [[m.value for m in batch] for _, batch in chunks] == [[4, 6, 7, 8], [9, 10]]
+  assert [(ids, list(batch)) for ids, batch in buffer.iter_pending(after=10)] == [(range(11, 12), [reading(10)])]
+
+
+def test_old_rows_are_compacted_into_tiers(tmp_path):
+  start  = datetime(2025, 1, 1, 12, 0, 0)
+  now    = [start.timestamp() + 3 * 3600]
+  buffer = MeasurementBuffer(
+    db_path = str(tmp_path / 'buffer.db'),
+    tiers   = [(600, 60), (2 * 3600, 3600)],
+    clock   = lambda: now[0]
+  )
+  # One reading every 10 seconds for three hours, on two probes
+  buffer.insert_many([
+    Measurement(float(i % 6), 'temperature', 'degree_Celsius', 'DS18B20', sensor_id, start + timedelta(seconds=10 * i))
+    for i in range(3 * 360) for sensor_id in ('28-1', '28-2')
+  ])
+
+  while buffer.compact():
+    pass
+  pending = [m for _, m in buffer.get_pending(limit=10_000)]
+  assert buffer.length == len(pending)
+
+  # The first hour is hourly, the next hour and 50 minutes per minute, the last 10 minutes raw
+  hourly = [m for m in pending if isinstance(m, Aggregate) and m.count == 360]
+  minute = [m for m in pending if isinstance(m, Aggregate) and m.count == 6]
+  raw    = [m for m in pending if isinstance(m, Measurement)]
+  assert (len(hourly), len(minute), len(raw)) == (2, 2 * 110, 2 * 60)
+  assert hourly[0] == Aggregate(
+    mean = 2.5, min = 0.0, max = 5.0, last = 5.0, count = 360, dimension = 'temperature', unit = 'degree_Celsius',
+    sensor_name = 'DS18B20', sensor_id = '28-1', timestamp = start
+  )
+
+  # Drained chunks carry the summaries
+  summaries = [batch.summaries.get(0) for _, batch in buffer.iter_pending(chunk_size=1)]
+  assert summaries.count((0.0, 5.0, 5.0, 360)) == 2
+  assert summaries.count(None) == len(raw)
+  buffer.close()
+
+
+def test_aggregates_keep_their_summary(buffer):
+  aggregate = Aggregate(
+    mean = 1.5, min = 1.0, max = 2.0, last = 2.0, count = 2, dimension = 'temperature', unit = 'degree_fahrenheit',
+    sensor_name = 'DS18B20', sensor_id = '28-000000000001', timestamp = datetime(2025, 1, 1)
+  )
+  buffer.insert_many([aggregate, reading()])
+  assert [m for _, m in buffer.get_pending()] == [aggregate, reading()]
+
+
+def test_compaction_keeps_chunk_ids_and_order(tmp_path):
+  start  = datetime(2025, 1, 1, 12, 0, 0)
+  buffer = MeasurementBuffer(
+    db_path = str(tmp_path / 'buffer.db'),
+    tiers   = [(600, 60)],
+    clock   = lambda: start.timestamp() + 3600
+  )
+  # One reading every 10 seconds for an hour, so 12:00 to 12:49 is due for compaction
+  buffer.insert_many([
+    Measurement(float(i % 6), 'temperature', 'degree_Celsius', 'DS18B20', '28-1', start + timedelta(seconds=10 * i))
+    for i in range(360)
+  ])
+
+  # The first chunk is read, compaction runs while it is being written, then it is acknowledged
+  ids, batch = next(buffer.iter_pending(chunk_size=100))
+  while buffer.compact():
+    pass
+  assert buffer.acknowledge(ids) == 100
+  assert [m.value for m in batch] == [float(i % 6) for i in range(100)]
+
+  # The rest of 12:00 to 12:49 went into aggregates, except the minute that straddles the
+  # chunk, and everything is still replayed oldest first
+  pending = [m for _, batch in buffer.iter_pending(chunk_size=50) for m in batch]
+  assert [m.timestamp for m in pending] == sorted(m.timestamp for m in pending)
+  aggregates = [m for m in pending if m.timestamp < start + timedelta(minutes=50) and m.timestamp >= start + timedelta(minutes=17)]
+  assert len(aggregates) == 50 - 17
+  assert all(m.timestamp.second == 0 for m in aggregates)
+  assert len(pending) == 2 + (50 - 17) + 60
+  assert buffer.length == len(pending)
+  buffer.close()
+
+
+def test_compaction_steps_over_a_chunk_that_is_never_acknowledged(tmp_path):
+  start  = datetime(2025, 1, 1, 12, 0, 0)
+  buffer = MeasurementBuffer(
+    db_path  = str(tmp_path / 'buffer.db'),
+    max_size = 100_000,
+    tiers    = [(600, 60), (2 * 3600, 3600)],
+    clock    = lambda: start.timestamp() + 6 * 3600
+  )
+  # One reading every 10 seconds for six hours
+  buffer.insert_many([
+    Measurement(float(i % 6), 'temperature', 'degree_Celsius', 'DS18B20', '28-1', start + timedelta(seconds=10 * i))
+    for i in range(6 * 360)
+  ])
+
+  # A chunk of the first 83 minutes is read and its write fails, without the lease being given up
+  next(buffer.iter_pending(chunk_size=500))
+  while buffer.compact():
+    pass
+
+  # The leased rows and the hours they touch stay raw, the hours after them are hourly, the
+  # last 10 minutes raw
+  pending = [m for _, m in buffer.get_pending(limit=10_000)]
+  hourly  = [m for m in pending if isinstance(m, Aggregate) and m.count == 360]
+  assert [m.timestamp.hour for m in hourly] == [14, 15]
+  assert len(pending) < 1000
+
+  # Once the lease is released everything due is compacted
+  buffer.release()
+  while buffer.compact():
+    pass
+  pending = [m for _, m in buffer.get_pending(limit=10_000)]
+  assert [m.timestamp.hour for m in pending if isinstance(m, Aggregate) and m.count == 360] == [12, 13, 14, 15]
+  assert len(pending) == 4 + 110 + 60
+  buffer.close()
@@ -0,0 +1,63 @@
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from pint import Quantity
+from sensors.base import Sensor, ConversionPlan, units
+
+
+class FakeSensor(Sensor):
+  def __init__(self, preferred_units):
+    super().__init__(name='Fake', preferred_units=preferred_units)
+
+  @property
+  def id(self):
+    return 'fake'
+
+
+CASES = [
+  (units.celsius, [units.fahrenheit],                                None),
+  (units.celsius, [units.percent, units.fahrenheit, units.gigabyte], None),
+  (units.kelvin,  [units.fahrenheit],                                None),
+  (units.percent, [units.fahrenheit, units.percent],                 'relative_humidity'),
+  (units.percent, [units.fahrenheit],                                'cpu_load'),
+]
+
+
+@pytest.mark.parametrize('unit, preferred_units, override_dimension', CASES)
+@pytest.mark.parametrize('value', [-40.0, 0.0, 21.5, 37.0, 100.0])
+def test_plan_matches_to_preferred(unit, preferred_units, override_dimension, value):
+  sensor   = FakeSensor(preferred_units)
+  measured = sensor.make_measurement(value, unit, override_dimension)
+  expected = Quantity(value, unit).to_preferred(preferred_units)
+
+  assert measured.value == pytest.approx(expected.magnitude, abs=1e-9)
+  assert measured.unit  == str(expected.units).lower()
+  if override_dimension:
+    assert measured.dimension == override_dimension
+  else:
+    assert measured.dimension == list(expected.dimensionality)[0].strip('[]')
+
+
+def test_plan_is_cached():
+  sensor = FakeSensor([units.fahrenheit])
+  assert sensor.plan(units.celsius) is sensor.plan(units.celsius)
+
+
+def test_dimensionless_needs_override():
+  with pytest.raises(ValueError):
+    ConversionPlan.build(units.percent, [units.fahrenheit])
+
+
+def test_plans_are_built_safely_from_threads():
+  # Blocking measurables build their first plans on executor threads at the same moment
+  sensors = [FakeSensor(preferred_units) for _, preferred_units, _ in CASES for _ in range(4)]
+  barrier = threading.Barrier(len(sensors))
+
+  def build(i):
+    unit, _, override_dimension = CASES[i // 4]
+    barrier.wait()
+    return sensors[i].plan(unit, override_dimension)
+
+  with ThreadPoolExecutor(len(sensors)) as pool:
+    plans = list(pool.map(build, range(len(sensors))))
+  assert plans == [ConversionPlan.build(unit, preferred_units, override_dimension) for unit, preferred_units, override_dimension in CASES for _ in range(4)]
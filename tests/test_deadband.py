@@ -0,0 +1,49 @@
+from datetime import datetime
+from aggregator import Aggregate
+from deadband import Deadband
+from tests.helpers import Clock, reading
+
+
+def test_small_changes_are_suppressed():
+  deadband = Deadband(thresholds={'temperature': 0.05}, clock=Clock())
+  assert deadband.allow(reading(98.60))
+  assert not deadband.allow(reading(98.62))
+  assert not deadband.allow(reading(98.64))
+  assert deadband.allow(reading(98.66))
+  assert deadband.suppressed == 2
+
+
+def test_heartbeat_sends_unchanged_value():
+  clock    = Clock()
+  deadband = Deadband(thresholds={'temperature': 0.05}, heartbeat=60, clock=clock)
+  assert deadband.allow(reading(98.6))
+
+  clock.now = 59
+  assert not deadband.allow(reading(98.6))
+  clock.now = 60
+  assert deadband.allow(reading(98.6))
+
+
+def test_unconfigured_dimensions_always_pass():
+  deadband = Deadband(thresholds={'temperature': 0.05}, clock=Clock())
+  assert deadband.allow(reading(10.0, dimension='cpu_load'))
+  assert deadband.allow(reading(10.0, dimension='cpu_load'))
+
+
+def test_sensor_thresholds_take_precedence():
+  deadband = Deadband(thresholds={'temperature': 0.05, ('RPi Zero 2W', 'temperature'): 1.0}, clock=Clock())
+  cpu_temp = lambda value: reading(value, sensor_id='pi', sensor_name='RPi Zero 2W')
+  assert deadband.allow(cpu_temp(120.0))
+  assert not deadband.allow(cpu_temp(120.5))
+  assert deadband.allow(cpu_temp(121.0))
+
+  assert deadband.allow(reading(98.6))
+  assert deadband.allow(reading(98.7))
+
+
+def test_aggregate_with_spike_passes():
+  deadband = Deadband(thresholds={'temperature': 0.05}, clock=Clock())
+  assert deadband.allow(reading(98.6))
+
+  spike = Aggregate(98.6, 98.0, 99.5, 98.6, 10, 'temperature', 'degree_fahrenheit', 'DS18B20', '28-000000000001', datetime.now())
+  assert deadband.allow(spike)
@@ -0,0 +1,92 @@
+import time
+import asyncio
+import pytest
+from clients.drain import BufferDrain
+from metrics import metrics
+from tests.helpers import reading
+
+
+class Uplink:
+  # Stands in for InfluxClient, taking `seconds` per write and failing the first `failures`
+
+  def __init__(self, seconds=0.0, failures=0, error='write failed'):
+    self.seconds  = seconds
+    self.failures = failures
+    self.error    = error
+    self.written  = []
+    self.healthy  = True
+
+  def ping(self):
+    return self.healthy
+
+  def write_chunk(self, batch):
+    time.sleep(self.seconds)
+    if self.failures:
+      self.failures -= 1
+      raise ConnectionError(self.error)
+    self.written.extend(m.value for m in batch)
+
+
+@pytest.fixture
+def buffer(buffer):
+  buffer.insert_many([reading(v) for v in range(1000)])
+  return buffer
+
+
+def drain_all(drain):
+  async def steps():
+    while await drain.step() is not None:
+      pass
+  asyncio.run(steps())
+
+
+def test_drains_oldest_first_in_growing_batches(buffer):
+  uplink = Uplink()
+  drain  = BufferDrain(uplink, buffer, min_batch=10, max_batch=160, share=1.0)
+  drain_all(drain)
+
+  assert uplink.written == list(range(1000))
+  assert buffer.length == 0
+  assert drain.batch_size == 160
+  gauges = {name: fields['value'] for name, _, fields in metrics.snapshot() if name.startswith('drain.') and 'value' in fields}
+  assert gauges['drain.backlog'] == gauges['drain.eta_seconds'] == 0
+  assert gauges['drain.rate'] > 0
+
+
+def test_slow_writes_shrink_the_batch(buffer):
+  drain = BufferDrain(Uplink(seconds=0.02), buffer, min_batch=10, max_batch=160, target_seconds=0.01, share=1.0)
+  drain.batch_size = 80
+  asyncio.run(drain.step())
+  assert drain.batch_size == 40
+
+
+def test_share_paces_the_drain(buffer):
+  drain   = BufferDrain(Uplink(seconds=0.05), buffer, min_batch=10, share=0.25)
+  started = time.monotonic()
+  asyncio.run(drain.step())
+  # The write took 0.05s, so the drain keeps off the uplink for another 0.15s
+  assert time.monotonic() - started >= 0.2
+
+
+@pytest.mark.parametrize('error', ['write failed', '{"code":"unavailable","message":"service unavailable"}'])
+def test_failed_writes_are_not_acknowledged(buffer, error):
+  uplink = Uplink(failures=1, error=error)
+  drain  = BufferDrain(uplink, buffer, min_batch=10, idle_seconds=0.01, share=1.0)
+
+  async def run():
+    task = asyncio.create_task(drain.run())
+    while buffer.length:
+      await asyncio.sleep(0.01)
+    task.cancel()
+
+  asyncio.run(asyncio.wait_for(run(), 10))
+  assert uplink.written == list(range(1000))
+  assert metrics.counter('drain.errors') >= 1
+
+
+def test_failed_writes_give_up_their_lease(buffer):
+  drain = BufferDrain(Uplink(failures=1), buffer, min_batch=10, share=1.0)
+  with pytest.raises(ConnectionError):
+    asyncio.run(drain.step())
+  assert buffer.leased == 0
+  assert buffer.length == 1000
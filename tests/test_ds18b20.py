@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+from sensors.ds18b20 import DS18B20
+
+
+def write_probe(devices, device_id, millicelsius, crc='YES'):
+  folder = devices / device_id
+  folder.mkdir()
+  (folder / 'w1_slave').write_text(
+    f'72 01 4b 46 7f ff 0e 10 57 : crc=57 {crc}\n'
+    f'72 01 4b 46 7f ff 0e 10 57 t={millicelsius}\n'
+  )
+
+
+@pytest.fixture
+def devices(tmp_path):
+  devices = tmp_path / 'devices'
+  devices.mkdir()
+  (devices / 'w1_bus_master1').mkdir()
+  (devices / 'w1_bus_master1' / 'therm_bulk_read').write_text('0\n')
+  write_probe(devices, '28-000000000001', 23125)
+  write_probe(devices, '28-000000000002', 37000)
+  return devices
+
+
+def measure(sensor):
+  return asyncio.run(sensor.measurables['temperature'].measure(sensor))
+
+
+def test_every_probe_is_measured(devices):
+  sensor       = DS18B20(base_dir=str(devices), conversion_time=0.01)
+  measurements = measure(sensor)
+
+  assert sensor.ids == ['28-000000000001', '28-000000000002']
+  assert [m.sensor_id for m in measurements] == sensor.ids
+  assert [round(m.value, 2) for m in measurements] == [73.62, 98.6]
+  assert all(m.sensor_name == 'DS18B20' for m in measurements)
+
+
+def test_conversion_is_triggered_once_for_the_bus(devices):
+  sensor = DS18B20(base_dir=str(devices), conversion_time=0.01)
+  measure(sensor)
+  assert (devices / 'w1_bus_master1' / 'therm_bulk_read').read_text() == 'trigger\n'
+
+
+def test_probe_failing_crc_is_skipped(devices):
+  write_probe(devices, '28-000000000003', 0, crc='NO')
+  sensor       = DS18B20(base_dir=str(devices), conversion_time=0.01, retries=1)
+  measurements = measure(sensor)
+  assert [m.sensor_id for m in measurements] == ['28-000000000001', '28-000000000002']
+
+
+def test_unplugged_probe_is_skipped(devices):
+  sensor = DS18B20(base_dir=str(devices), conversion_time=0.01)
+  (devices / '28-000000000001' / 'w1_slave').unlink()
+  measurements = measure(sensor)
+  assert [m.sensor_id for m in measurements] == ['28-000000000002']
+
+
+def test_missing_bus_raises(tmp_path):
+  with pytest.raises(RuntimeError):
+    DS18B20(base_dir=str(tmp_path))
+
+
+def test_resolution_sets_conversion_time(devices):
+  sensor = DS18B20(base_dir=str(devices), resolution=9)
+
+  assert sensor.conversion_time == DS18B20.CONVERSION_TIMES[9]
+  assert (devices / '28-000000000002' / 'resolution').read_text() == '9\n'
+
+
+def test_resolution_is_read_from_device(devices):
+  (devices / '28-000000000001' / 'resolution').write_text('10\n')
+  sensor = DS18B20(base_dir=str(devices))
+
+  assert sensor.resolution == 10
+  assert sensor.conversion_time == DS18B20.CONVERSION_TIMES[10]
+
+
+def test_invalid_resolution_raises(devices):
+  with pytest.raises(ValueError):
+    DS18B20(base_dir=str(devices), resolution=8)
@@ -0,0 +1,97 @@
+import time
+import asyncio
+import pytest
+from sensors.base import Sensor, Measurable
+from sensors.executor import BlockingExecutor
+from metrics import metrics, Timing
+
+
+class BlockingSensor(Sensor):
+  # Reads by sleeping its thread for `seconds`, as an I2C transaction or sysfs poll would block
+
+  def __init__(self, executor, seconds):
+    super().__init__(name='Blocking', executor=executor)
+    self.seconds = seconds
+
+  @property
+  def id(self):
+    return 'blocking'
+
+  @Measurable(frequency=1, blocking=True, timeout=0.2)
+  def temperature(self):
+    time.sleep(self.seconds)
+    return self.seconds
+
+
+@pytest.fixture
+def executor():
+  executor = BlockingExecutor(max_workers=2)
+  yield executor
+  executor.shutdown()
+
+
+def measure(sensor):
+  return sensor.measurables['temperature'].measure(sensor)
+
+
+def timing(name, **tags):
+  return metrics.timings.get(metrics.key(name, tags), Timing())
+
+
+def test_reads_are_timed(executor):
+  sensor = BlockingSensor(executor, 0.05)
+  count  = timing('executor.seconds', measurable='Blocking.temperature').count
+
+  assert asyncio.run(measure(sensor)) == 0.05
+  observed = timing('executor.seconds', measurable='Blocking.temperature')
+  assert observed.count == count + 1
+  assert observed.max >= 0.05
+
+
+def test_slow_reads_time_out(executor):
+  sensor   = BlockingSensor(executor, 0.5)
+  timeouts = metrics.counter('executor.timeouts', measurable='Blocking.temperature')
+
+  started = time.monotonic()
+  with pytest.raises(TimeoutError, match='Blocking.temperature did not finish within 0.2s'):
+    asyncio.run(measure(sensor))
+  assert time.monotonic() - started < 0.4
+  assert metrics.counter('executor.timeouts', measurable='Blocking.temperature') == timeouts + 1
+
+
+def test_loop_keeps_running_during_a_read(executor):
+  sensor = BlockingSensor(executor, 0.15)
+
+  async def run():
+    # Ticks every 10 ms while the read blocks its worker thread
+    ticks = 0
+    read  = asyncio.create_task(measure(sensor))
+    while not read.done():
+      await asyncio.sleep(0.01)
+      ticks += 1
+    return await read, ticks
+
+  value, ticks = asyncio.run(run())
+  assert value == 0.15
+  assert ticks >= 10
+
+
+def test_time_queued_for_a_worker_does_not_count_towards_the_timeout():
+  executor = BlockingExecutor(max_workers=1)
+
+  async def run():
+    # The second read waits 0.15s for the only worker, then takes 0.05s of its 0.1s
+    slow = asyncio.create_task(executor.run('Slow.temperature', time.sleep, 0.15, timeout=1.0))
+    await asyncio.sleep(0.01)
+    await executor.run('Fast.temperature', time.sleep, 0.05, timeout=0.1)
+    await slow
+
+  asyncio.run(run())
+  assert timing('executor.queued_seconds', measurable='Fast.temperature').max >= 0.1
+  assert timing('executor.seconds', measurable='Fast.temperature').max < 0.1
+  executor.shutdown()
+
+
+def test_explicit_zero_timeout_is_kept(executor):
+  with pytest.raises(TimeoutError):
+    asyncio.run(executor.run('Zero.temperature', time.sleep, 0.05, timeout=0))
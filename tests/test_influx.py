@@ -0,0 +1,91 @@
+import time
+import pytest
+from datetime import datetime
+from sensors.batch import MeasurementBatch
+from aggregator import Aggregate
+from clients.influx import InfluxClient
+from metrics import metrics
+from tests.helpers import reading
+
+
+class Queue:
+  # Stands in for the batching WriteAPI, keeping whatever was queued
+
+  def __init__(self):
+    self.records = []
+
+  def write(self, bucket, record, **options):
+    self.records.extend(record)
+
+  def close(self):
+    pass
+
+
+def client(buffer):
+  # Nothing listens on the discard port, so every write fails straight away
+  return InfluxClient(
+    url             = 'http://127.0.0.1:9',
+    token           = 'token',
+    org             = 'org',
+    bucket          = 'bucket',
+    buffer          = buffer,
+    flush_interval  = 100,
+    jitter_interval = 0,
+    max_retries     = 0
+  )
+
+
+@pytest.fixture
+def influx(buffer):
+  influx = client(buffer)
+  influx.write_api.close()
+  influx.write_api = Queue()
+  yield influx
+  influx.close()
+
+
+def queued(influx):
+  return b'\n'.join(influx.inflight)
+
+
+def test_failed_batches_are_buffered(influx, buffer):
+  aggregate = Aggregate(1.5, 1.0, 2.0, 2.0, 2, 'temperature', 'degree_fahrenheit', 'DS18B20', '28-000000000001', datetime(2025, 1, 1))
+  influx.insert_measurement(reading(97.0))
+  influx.insert_batch(MeasurementBatch.from_measurements([reading(98.0), reading(99.0)]))
+  influx.insert_aggregate(aggregate)
+  assert buffer.length == 0
+
+  influx.on_error(('bucket', 'org', 'ns'), queued(influx), ConnectionError('refused'))
+  assert [m for _, m in buffer.get_pending()] == [reading(97.0), reading(98.0), reading(99.0), aggregate]
+  assert influx.inflight == {}
+  assert metrics.counter('influx.points', outcome='error') >= 4
+
+
+def test_successful_batches_are_settled(influx, buffer):
+  # The same line queued twice stays tracked until both copies are written
+  influx.insert_measurement(reading())
+  influx.insert_measurement(reading())
+  line = queued(influx)
+
+  influx.on_success(('bucket', 'org', 'ns'), line)
+  assert len(influx.inflight) == 1
+  influx.on_success(('bucket', 'org', 'ns'), line)
+  assert influx.inflight == {}
+  assert buffer.length == 0
+
+
+def test_untracked_lines_are_ignored(influx, buffer):
+  influx.on_error(('bucket', 'org', 'ns'), b'Metrics,metric=x count=1 1', ConnectionError('refused'))
+  assert buffer.length == 0
+
+
+def test_batches_failing_on_the_batching_thread_are_buffered(buffer):
+  influx = client(buffer)
+  influx.insert_measurement(reading())
+
+  deadline = time.monotonic() + 10
+  while buffer.length < 1 and time.monotonic() < deadline:
+    time.sleep(0.01)
+  influx.close()
+  assert [m for _, m in buffer.get_pending()] == [reading()]
+  assert metrics.counter('influx.batches', outcome='error') >= 1
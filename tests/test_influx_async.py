@@ -0,0 +1,142 @@
+import time
+import asyncio
+from sensors.base import Measurement
+from clients.influx_async import AsyncInfluxClient
+from clients.drain import BufferDrain
+from aligner import Aligner
+from metrics import metrics
+from tests.influx_server import InfluxServer
+from tests.helpers import reading
+
+
+def client(server, buffer, **options):
+  return AsyncInfluxClient(url=server.url, token='token', org='org', bucket='bucket', buffer=buffer, **options)
+
+
+def test_batches_by_size_over_one_connection(buffer):
+  async def run(server):
+    async with client(server, buffer, batch_size=3, flush_interval=60_000) as influx:
+      futures = [await influx.insert_measurement(reading(v)) for v in range(7)]
+      assert await asyncio.gather(*futures[:6]) == [True] * 6
+      assert not futures[6].done()
+
+  with InfluxServer() as server:
+    asyncio.run(run(server))
+
+  # The last, partial batch is sent on close
+  assert [len(r['lines']) for r in server.requests] == [3, 3, 1]
+  assert len({r['port'] for r in server.requests}) == 1
+  assert server.requests[0]['query'] == {'org': 'org', 'bucket': 'bucket', 'precision': 'ns'}
+  assert buffer.length == 0
+
+
+def test_batches_by_time(buffer):
+  async def run(server):
+    async with client(server, buffer, flush_interval=50) as influx:
+      started = time.monotonic()
+      assert await (await influx.insert_measurement(reading()))
+      return time.monotonic() - started
+
+  with InfluxServer() as server:
+    elapsed = asyncio.run(run(server))
+  assert 0.04 <= elapsed < 5
+  assert len(server.lines) == 1
+
+
+def test_failed_batches_are_buffered(buffer):
+  async def run(server):
+    async with client(server, buffer, batch_size=2) as influx:
+      future = await influx.insert_measurement(reading(97.0))
+      await influx.insert_measurement(reading(98.0))
+      await influx.insert_metrics([('buffer.dropped', {}, {'count': 1})])
+      return await future
+
+  with InfluxServer(status=503) as server:
+    assert asyncio.run(run(server)) is False
+  assert [m for _, m in buffer.get_pending()] == [reading(97.0), reading(98.0)]
+  assert metrics.counter('influx.batches', outcome='error') >= 2
+
+
+def test_full_queue_holds_writers_back(buffer):
+  async def run(server):
+    async with client(server, buffer, batch_size=1, max_pending=1) as influx:
+      await influx.insert_measurement(reading(1.0))
+      started = time.monotonic()
+      await influx.insert_measurement(reading(2.0))
+      return time.monotonic() - started
+
+  with InfluxServer(delay=0.2) as server:
+    assert asyncio.run(run(server)) >= 0.15
+  assert len(server.lines) == 2
+
+
+def test_drains_the_buffer_on_the_loop(buffer):
+  buffer.insert_many([reading(v) for v in range(250)])
+
+  async def run(server):
+    async with client(server, buffer) as influx:
+      drain = BufferDrain(influx, buffer, min_batch=100, share=1.0)
+      while await drain.step() is not None:
+        pass
+
+  with InfluxServer() as server:
+    asyncio.run(run(server))
+  assert [len(r['lines']) for r in server.requests] == [100, 150]
+  assert buffer.length == 0
+
+
+def test_live_batches_do_not_wait_behind_the_drain(buffer):
+  buffer.insert_many([reading(v) for v in range(100)])
+
+  async def run(server):
+    async with client(server, buffer, flush_interval=0) as influx:
+      drain   = asyncio.create_task(influx.write_chunk(next(buffer.iter_pending())[1]))
+      await asyncio.sleep(0.05)
+      started = time.monotonic()
+      assert await (await influx.insert_measurement(reading(1000.0)))
+      elapsed = time.monotonic() - started
+      await drain
+      return elapsed
+
+  with InfluxServer(delay=0.3) as server:
+    elapsed = asyncio.run(run(server))
+  # Over a shared connection the live write would have waited for the chunk to finish
+  assert elapsed < 0.5
+  assert [len(r['lines']) for r in server.requests] == [100, 1]
+  assert len({r['port'] for r in server.requests}) == 2
+
+
+def test_compressed_writes_at_reduced_precision(buffer):
+  async def run(server):
+    async with client(server, buffer, precision='ms', gzip_level=6) as influx:
+      await (await influx.insert_measurement(reading()))
+
+  with InfluxServer() as server:
+    asyncio.run(run(server))
+  request = server.requests[0]
+  assert request['query']['precision'] == 'ms'
+  assert request['encoding'] == 'gzip'
+  assert request['lines'][0].endswith(b' %d' % (reading().timestamp.timestamp() * 1000))
+
+
+def test_grouped_samples_replay_as_the_same_point(buffer):
+  aligner = Aligner(tick=1.0, clock=lambda: 0.0)
+  for item in [reading(97.0), Measurement(-0.5, 'bias', 'degree_fahrenheit', 'DS18B20', '28-000000000001', reading().timestamp)]:
+    aligner.add(item)
+  [sample] = aligner.flush()
+
+  async def run(server):
+    async with client(server, buffer, grouped=True) as influx:
+      assert not await (await influx.insert_sample(sample))
+      server.status = 204
+      drain = BufferDrain(influx, buffer, share=1.0)
+      while await drain.step() is not None:
+        pass
+
+  with InfluxServer(status=503) as server:
+    asyncio.run(run(server))
+  live, replayed = server.requests
+  assert live['lines'] == replayed['lines'] == [
+    b'DS18B20,sensor_id=28-000000000001 bias=-0.5,bias_unit="degree_fahrenheit",temperature=97,temperature_unit="degree_fahrenheit" 1735732800000000000'
+  ]
+  assert buffer.length == 0
@@ -0,0 +1,98 @@
+from datetime import datetime
+from hypothesis import given, strategies as st
+from influxdb_client import Point
+from sensors.base import Measurement
+from sensors.batch import MeasurementBatch, timestamp_ns
+from clients.line_protocol import LineEncoder
+
+
+def point(name, fields, timestamp, dimension, unit, sensor_id):
+  point = Point(name)
+  if timestamp is not None:
+    point.time(timestamp)
+  point.tag('dimension', dimension).tag('unit', unit).tag('sensor_id', sensor_id)
+  for key, value in fields.items():
+    point.field(key, value)
+  return point.to_line_protocol()
+
+
+names  = st.text(st.characters(blacklist_categories=['Cs']), min_size=1).filter(lambda s: not s.startswith('#'))
+tags   = st.text(st.characters(blacklist_categories=['Cs']))
+floats = st.floats(allow_nan=True, allow_infinity=True)
+values = st.one_of(floats, st.integers(), st.booleans(), st.text(st.characters(blacklist_categories=['Cs'])), st.none())
+
+
+@given(names, st.dictionaries(names, values, max_size=4), st.one_of(st.none(), st.integers(0, 2**62)), tags, tags, tags)
+def test_lines_match_point(name, fields, timestamp, dimension, unit, sensor_id):
+  line = LineEncoder().line(name, fields, timestamp, dimension, unit, sensor_id)
+  assert line == point(name, fields, timestamp, dimension, unit, sensor_id)
+
+
+@given(st.lists(st.tuples(floats, st.integers(0, 2**62), tags, tags, names, tags, st.booleans()), max_size=20))
+def test_batches_match_point(rows):
+  batch = MeasurementBatch()
+  for value, timestamp, dimension, unit, sensor_name, sensor_id, summarized in rows:
+    batch.add(value, timestamp, dimension, unit, sensor_name, sensor_id, (value - 1, value + 1, value, 3) if summarized else None)
+
+  expected = []
+  for i, (value, timestamp, dimension, unit, sensor_name, sensor_id) in enumerate(batch.rows()):
+    fields  = {'value': value}
+    summary = batch.summaries.get(i)
+    if summary:
+      fields.update(zip(['min', 'max', 'last', 'count'], summary))
+    expected.append(point(sensor_name, fields, timestamp, dimension, unit, sensor_id))
+
+  encoder = LineEncoder()
+  assert encoder.lines(batch) == expected
+  assert encoder.encode(batch) == '\n'.join(expected).encode()
+
+
+def test_series_prefixes_are_reused():
+  encoder  = LineEncoder()
+  readings = [
+    Measurement(v, 'temperature', 'degree_Celsius', 'DS18B20', '28-000000000001', datetime(2025, 1, 1, 12, 0, v))
+    for v in range(3)
+  ]
+  batch = MeasurementBatch.from_measurements(readings)
+  assert encoder.encode(batch) == b'\n'.join(
+    f'DS18B20,dimension=temperature,sensor_id=28-000000000001,unit=degree_Celsius value={v} {timestamp_ns(m.timestamp)}'.encode()
+    for v, m in enumerate(readings)
+  )
+  assert len(encoder.prefixes) == 1
+
+
+def test_timestamps_are_truncated_to_the_precision():
+  batch = MeasurementBatch()
+  batch.add(1.5, 1_735_732_800_123_456_789, 'temperature', 'degree_Celsius', 'DS18B20', '28-000000000001')
+  assert LineEncoder('ms').encode(batch).endswith(b' 1735732800123')
+  assert LineEncoder('s').line('DS18B20', {'value': 1.5}, 1_735_732_800_999_999_999, 'temperature', 'degree_Celsius', '28-1').endswith(' 1735732800')
+
+
+def test_grouped_rows_are_one_point_per_sensor_and_timestamp():
+  encoder = LineEncoder(grouped=True)
+  batch   = MeasurementBatch()
+  batch.add(21.5, 1_000, 'temperature', 'degree_Celsius', 'SHT41', '0x44')
+  batch.add(98.6, 1_000, 'temperature', 'degree_Fahrenheit', 'DS18B20', '28-1', (98.0, 99.0, 98.5, 10))
+  batch.add(45.0, 1_000, 'relative_humidity', 'percent', 'SHT41', '0x44')
+  batch.add(-0.5, 1_000, 'bias', 'degree_Fahrenheit', 'DS18B20', '28-1')
+  batch.add(21.6, 2_000, 'temperature', 'degree_Celsius', 'SHT41', '0x44')
+
+  assert encoder.lines(batch) == [
+    'SHT41,sensor_id=0x44 relative_humidity=45,relative_humidity_unit="percent",temperature=21.5,temperature_unit="degree_Celsius" 1000',
+    'DS18B20,sensor_id=28-1 bias=-0.5,bias_unit="degree_Fahrenheit",temperature=98.6,temperature_count=10i,'
+    'temperature_last=98.5,temperature_max=99,temperature_min=98,temperature_unit="degree_Fahrenheit" 1000',
+    'SHT41,sensor_id=0x44 temperature=21.6,temperature_unit="degree_Celsius" 2000'
+  ]
+
+
+def test_grouped_series_does_not_depend_on_the_dimensions_present():
+  # A missing reading, or a sample split across drain chunks, still lands in the same series
+  encoder  = LineEncoder(grouped=True)
+  complete = MeasurementBatch()
+  complete.add(21.5, 1_000, 'temperature', 'degree_Celsius', 'SHT41', '0x44')
+  complete.add(45.0, 1_000, 'relative_humidity', 'percent', 'SHT41', '0x44')
+  partial  = MeasurementBatch()
+  partial.add(21.6, 2_000, 'temperature', 'degree_Celsius', 'SHT41', '0x44')
+
+  series = {line.split(' ', 1)[0] for line in encoder.lines(complete) + encoder.lines(partial)}
+  assert series == {'SHT41,sensor_id=0x44'}
@@ -0,0 +1,172 @@
+import time
+import asyncio
+import statistics
+import pytest
+from collections import Counter
+from datetime import datetime, timedelta
+from sensors.base import Measurement
+from sensors import Simulation, SimulatedDS18B20, SimulatedSHT41, SimulatedRaspberryPi
+from sampler import Sampler
+from clients import InfluxClient, AsyncInfluxClient, MeasurementBuffer, GroupCommitWriter, BufferDrain
+from clients.line_protocol import LineEncoder
+from metrics import metrics
+from tests.influx_server import InfluxServer, Fault
+
+# Load and fault tests for the whole uplink: simulated sensors -> Sampler -> AsyncInfluxClient,
+# failed batches -> GroupCommitWriter -> MeasurementBuffer -> BufferDrain, against the stand-in
+# server. Each run reports throughput, end-to-end latency and loss; -s shows the reports.
+
+
+@pytest.fixture
+def store(tmp_path):
+  store = MeasurementBuffer(db_path=str(tmp_path / 'buffer.db'), max_size=1_000_000)
+  yield store
+  store.close()
+
+
+async def pipeline(server, store, seconds:float):
+  simulation = Simulation(speed=1000, seed=1)
+  sampler    = Sampler(
+    sensors    = [SimulatedDS18B20(simulation, count=4), SimulatedSHT41(simulation), SimulatedRaspberryPi(simulation)],
+    dimensions = ['temperature', 'relative_humidity', 'cpu_load', 'cpu_temp']
+  )
+  buffer = GroupCommitWriter(store, interval=50)
+  influx = AsyncInfluxClient(url=server.url, token='token', org='org', bucket='bucket', buffer=buffer, batch_size=200, flush_interval=50)
+  drain  = BufferDrain(influx, buffer, min_batch=100, idle_seconds=0.05, max_backoff=0.2, share=1.0)
+  sent   = []
+
+  async def poll_sensors():
+    # As main.poll_sensors, without the display
+    async for m in sampler.run():
+      sent.append(m)
+      await influx.insert_measurement(m)
+
+  await influx.start()
+  poll_task  = asyncio.create_task(poll_sensors())
+  drain_task = asyncio.create_task(drain.run())
+  await asyncio.sleep(seconds)
+  poll_task.cancel()
+  await asyncio.gather(poll_task, return_exceptions=True)
+  sampled = time.monotonic()
+
+  # Everything still queued is sent, then whatever failed is drained
+  while influx.queued:
+    await asyncio.sleep(0.01)
+  buffer.flush()
+  deadline = time.monotonic() + 30
+  while buffer.length and time.monotonic() < deadline:
+    await asyncio.sleep(0.05)
+  drain_task.cancel()
+  await asyncio.gather(drain_task, return_exceptions=True)
+  await influx.close()
+  buffer.close()
+  return sent, time.monotonic() - sampled
+
+
+def report(name, server, sent, seconds, settled):
+  encoder  = LineEncoder()
+  expected = Counter(encoder.measurement(m).encode() for m in sent)
+  accepted = server.accepted
+  received = Counter(line for line, _ in accepted)
+
+  lost       = sum((expected - received).values())
+  duplicated = sum((received - expected).values())
+  latencies  = sorted(at - int(line.rsplit(b' ', 1)[1]) / 1e9 for line, at in accepted)
+  result     = dict(
+    readings   = len(sent),
+    throughput = len(received & expected) / (seconds + settled),
+    p50        = statistics.median(latencies),
+    p99        = latencies[int(0.99 * (len(latencies) - 1))],
+    lost       = lost,
+    duplicated = duplicated,
+    requests   = len(server.requests),
+    failed     = sum(1 for r in server.requests if not r['status'] or r['status'] >= 300)
+  )
+  print(
+    f'\n{name}: {result["readings"]} readings, {result["throughput"]:,.0f}/s, '
+    f'latency p50 {result["p50"] * 1000:.0f} ms p99 {result["p99"] * 1000:.0f} ms, '
+    f'{lost} lost, {duplicated} duplicated, {result["failed"]}/{result["requests"]} requests failed'
+  )
+  return result
+
+
+def test_healthy_uplink(store):
+  with InfluxServer() as server:
+    sent, settled = asyncio.run(pipeline(server, store, seconds=1.0))
+  result = report('healthy', server, sent, 1.0, settled)
+
+  assert result['readings'] > 100
+  assert result['lost'] == result['duplicated'] == result['failed'] == 0
+  assert result['p99'] < 1.0
+  assert store.length == 0
+
+
+def test_faults_lose_nothing(store):
+  faults = [
+    Fault(0.2, 0.5, status=503),
+    Fault(0.5, 0.8, drop=True),
+    Fault(0.8, 1.1, status=429, rate=0.5),
+    Fault(1.1, 1.4, delay=0.2)
+  ]
+  errors  = metrics.counter('influx.batches', outcome='error')
+  drained = metrics.counter('drain.rows')
+  with InfluxServer(faults=faults, seed=1) as server:
+    sent, settled = asyncio.run(pipeline(server, store, seconds=1.5))
+  result = report('faults', server, sent, 1.5, settled)
+
+  # Failed batches went through the buffer and were replayed, none twice
+  assert result['failed'] > 0
+  assert metrics.counter('influx.batches', outcome='error') > errors
+  assert metrics.counter('drain.rows') > drained
+  assert result['lost'] == result['duplicated'] == 0
+  assert store.length == 0
+
+
+def test_slow_uplink_holds_the_sampler_back(store):
+  async def run(server):
+    influx = AsyncInfluxClient(url=server.url, token='token', org='org', bucket='bucket', buffer=store, batch_size=50, flush_interval=10, max_pending=100)
+    sampler = Sampler(sensors=[SimulatedDS18B20(Simulation(speed=1000, seed=1), count=4)], dimensions=['temperature'])
+    await influx.start()
+    peak = 0
+
+    async def poll():
+      nonlocal peak
+      async for m in sampler.run():
+        await influx.insert_measurement(m)
+        peak = max(peak, influx.queued)
+
+    task = asyncio.create_task(poll())
+    await asyncio.sleep(1.0)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await influx.close()
+    return peak
+
+  with InfluxServer(delay=0.1) as server:
+    peak = asyncio.run(run(server))
+  # Memory stays bounded by max_pending, plus the one write that found the last free slot
+  assert peak <= 100 + 4
+  assert store.length == 0
+
+
+def test_threaded_client_recovers_an_outage(store):
+  start    = datetime.now()
+  readings = [Measurement(v + 0.5, 'temperature', 'degree_fahrenheit', 'DS18B20', '28-000000000001', start + timedelta(milliseconds=v)) for v in range(50)]
+  with InfluxServer(faults=[Fault(0.0, 1.0, status=503)]) as server:
+    influx = InfluxClient(
+      url=server.url, token='token', org='org', bucket='bucket', buffer=store,
+      batch_size=10, flush_interval=50, jitter_interval=0, retry_interval=50, max_retries=0
+    )
+    for m in readings:
+      influx.insert_measurement(m)
+    influx.write_api.flush()
+
+    deadline = time.monotonic() + 10
+    while store.length < len(readings) and time.monotonic() < deadline:
+      time.sleep(0.05)
+    while time.monotonic() - server.started < 1.0:
+      time.sleep(0.05)
+    assert influx.process_buffer() == len(readings)
+    influx.close()
+  result = report('threaded outage', server, readings, 1.0, 0.0)
+  assert result['lost'] == result['duplicated'] == 0
@@ -0,0 +1,49 @@
+import time
+import asyncio
+from datetime import datetime
+from sensors.base import Sensor, Measurable, Measurement
+from sampler import Sampler
+
+
+class FakeSensor(Sensor):
+  # Takes `delay` seconds per reading, then raises `error` if it has one
+
+  def __init__(self, name, delay, error=None):
+    super().__init__(name=name)
+    self.delay = delay
+    self.error = error
+
+  @property
+  def id(self):
+    return self.name
+
+  # The Measurable is shared by every instance, so it has to be ready again straight away
+  @Measurable(frequency=0.001)
+  async def temperature(self):
+    await asyncio.sleep(self.delay)
+    if self.error:
+      raise self.error
+    return Measurement(self.delay, 'temperature', 'degree_Celsius', self.name, self.id, datetime.now())
+
+
+def test_slow_and_failing_sensors_do_not_hold_up_the_others():
+  sampler = Sampler([FakeSensor('slow', 0.3), FakeSensor('broken', 0.01, RuntimeError('no ack')), FakeSensor('fast', 0.01)])
+
+  async def stream():
+    started = time.monotonic()
+    arrived = [(m.sensor_name, time.monotonic() - started) async for m in sampler.stream()]
+    return arrived, time.monotonic() - started
+
+  arrived, elapsed = asyncio.run(stream())
+  assert [name for name, _ in arrived] == ['fast', 'slow']
+  assert arrived[0][1] < 0.1
+  # A cycle takes about as long as the slowest read, not the sum of them
+  assert 0.3 <= elapsed < 0.4
+
+
+def test_measurements_and_batches_collect_a_cycle():
+  sampler = Sampler([FakeSensor('slow', 0.02), FakeSensor('fast', 0.01)])
+  assert [m.sensor_name for m in asyncio.run(sampler.get_measurements())] == ['fast', 'slow']
+
+  batch = asyncio.run(sampler.get_batch())
+  assert [(m.sensor_name, m.value) for m in batch] == [('fast', 0.01), ('slow', 0.02)]
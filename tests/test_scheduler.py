@@ -0,0 +1,57 @@
+from sensors.base import Sensor, Measurable
+from scheduler import Scheduler
+from tests.helpers import Clock
+
+
+class FakeSensor(Sensor):
+  def __init__(self):
+    super().__init__(name='Fake')
+
+  @property
+  def id(self):
+    return 'fake'
+
+  @Measurable(frequency=0.5)
+  async def temperature(self):
+    return None
+
+  @Measurable(frequency=2)
+  async def relative_humidity(self):
+    return None
+
+
+def due_dimensions(scheduler):
+  return sorted(job.dimension for job in scheduler.pop_due())
+
+
+def test_only_due_measurables_are_returned():
+  clock     = Clock()
+  scheduler = Scheduler([FakeSensor()], clock=clock)
+  assert due_dimensions(scheduler) == ['relative_humidity', 'temperature']
+
+  clock.now = 0.4
+  assert due_dimensions(scheduler) == []
+
+  clock.now = 0.5
+  assert due_dimensions(scheduler) == ['temperature']
+  assert scheduler.next_deadline == 1.0
+
+
+def test_deadlines_do_not_drift():
+  clock     = Clock()
+  scheduler = Scheduler([FakeSensor()], dimensions=['temperature'], clock=clock)
+  scheduler.pop_due()
+
+  clock.now = 0.6
+  scheduler.pop_due()
+  assert scheduler.next_deadline == 1.0
+
+
+def test_missed_deadlines_are_skipped():
+  clock     = Clock()
+  scheduler = Scheduler([FakeSensor()], dimensions=['temperature'], clock=clock)
+  scheduler.pop_due()
+
+  clock.now = 2.2
+  assert due_dimensions(scheduler) == ['temperature']
+  assert scheduler.next_deadline == 2.5
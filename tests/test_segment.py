@@ -0,0 +1,183 @@
+import os
+import pytest
+from datetime import datetime
+from sensors.batch import MeasurementBatch
+from aggregator import Aggregate
+from clients.segment import SegmentBuffer, RECORD
+from clients.writer import GroupCommitWriter
+from tests.helpers import reading
+
+
+def segments(directory):
+  return sorted(name for name in os.listdir(directory) if name.endswith('.seg'))
+
+
+@pytest.fixture
+def buffer(tmp_path):
+  buffer = SegmentBuffer(directory=str(tmp_path), records_per_segment=4)
+  yield buffer
+  buffer.close()
+
+
+def test_pending_round_trip(buffer):
+  buffer.insert_many([reading(97.0), reading(98.0, sensor_id='28-000000000002')])
+  buffer.insert_batch(MeasurementBatch.from_measurements([reading(99.0)]))
+
+  pending = buffer.get_pending()
+  assert [row_id for row_id, _ in pending] == [1, 2, 3]
+  assert [m for _, m in pending] == [reading(97.0), reading(98.0, sensor_id='28-000000000002'), reading(99.0)]
+  assert buffer.mark_processed(2)
+  assert [m.value for _, m in buffer.get_pending()] == [97.0, 99.0]
+  assert buffer.length == 2
+
+
+def test_records_span_segments(buffer, tmp_path):
+  buffer.insert_many([reading(v) for v in range(10)])
+  assert segments(tmp_path) == [f'{i:020d}.seg' for i in (1, 5, 9)]
+  assert [[m.value for m in batch] for _, batch in buffer.iter_pending(chunk_size=3)] == [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]]
+
+
+def test_acknowledged_segments_are_reclaimed(buffer, tmp_path):
+  buffer.insert_many([reading(v) for v in range(10)])
+
+  ids, _ = next(buffer.iter_pending(chunk_size=6))
+  assert buffer.acknowledge(ids) == 6
+  assert segments(tmp_path) == [f'{i:020d}.seg' for i in (5, 9)]
+
+  # Out of order acknowledgements only move the cursor once the gap is filled
+  assert buffer.acknowledge([8, 9, 10]) == 3
+  assert buffer.cursor == 6
+  assert buffer.acknowledge(range(7, 8)) == 1
+  assert buffer.cursor == 10
+  assert segments(tmp_path) == [f'{9:020d}.seg']
+  assert buffer.length == 0
+
+
+def test_cursor_and_series_survive_reopening(tmp_path):
+  buffer = SegmentBuffer(directory=str(tmp_path), records_per_segment=4)
+  buffer.insert_many([reading(v) for v in range(6)])
+  buffer.acknowledge(range(1, 3))
+  buffer.close()
+
+  reopened = SegmentBuffer(directory=str(tmp_path), records_per_segment=4)
+  assert reopened.length == 4
+  reopened.insert(reading(6, sensor_id='28-000000000002'))
+  assert [(row_id, m.value) for row_id, m in reopened.get_pending()] == [(3, 2), (4, 3), (5, 4), (6, 5), (7, 6)]
+  assert reopened.get_pending()[-1][1] == reading(6, sensor_id='28-000000000002')
+  reopened.close()
+
+
+def test_torn_tail_is_dropped_on_recovery(tmp_path):
+  buffer = SegmentBuffer(directory=str(tmp_path))
+  buffer.insert_many([reading(v) for v in range(3)])
+  buffer.close()
+
+  path = os.path.join(tmp_path, segments(tmp_path)[-1])
+  with open(path, 'r+b') as f:
+    # Corrupts the value of the last record and leaves half a record after it
+    f.seek(2 * RECORD.size + 16)
+    f.write(b'\xff')
+    f.seek(0, os.SEEK_END)
+    f.write(b'\x00' * (RECORD.size // 2))
+
+  reopened = SegmentBuffer(directory=str(tmp_path))
+  assert reopened.length == 2
+  assert os.path.getsize(path) == 2 * RECORD.size
+  reopened.insert(reading(3))
+  assert [(row_id, m.value) for row_id, m in reopened.get_pending()] == [(1, 0), (2, 1), (3, 3)]
+  reopened.close()
+
+
+def test_records_of_a_torn_series_file_are_skipped(tmp_path):
+  buffer = SegmentBuffer(directory=str(tmp_path))
+  buffer.insert_many([reading(0), reading(1, sensor_id='28-000000000002'), reading(2)])
+  buffer.close()
+
+  # A crash from before series were always synced, which kept the records but not the last series
+  path = os.path.join(tmp_path, 'series')
+  with open(path) as f:
+    first = f.readline()
+  with open(path, 'w') as f:
+    f.write(first)
+
+  reopened = SegmentBuffer(directory=str(tmp_path))
+  assert [[m.value for m in batch] for _, batch in reopened.iter_pending()] == [[0, 2]]
+  assert reopened.length == 2
+  reopened.close()
+
+
+def test_corrupt_records_are_skipped(buffer, tmp_path):
+  buffer.insert_many([reading(v) for v in range(6)])
+  with open(os.path.join(tmp_path, segments(tmp_path)[0]), 'r+b') as f:
+    f.seek(RECORD.size + 16)
+    f.write(b'\xff')
+
+  assert [m.value for _, m in buffer.get_pending()] == [0, 2, 3, 4, 5]
+  assert buffer.length == 5
+
+
+def test_drop_oldest_segments(tmp_path):
+  buffer = SegmentBuffer(directory=str(tmp_path), max_size=8, records_per_segment=4)
+  buffer.insert_many([reading(v) for v in range(10)])
+
+  assert [m.value for _, m in buffer.get_pending()] == [4, 5, 6, 7, 8, 9]
+  assert buffer.length == 6
+  buffer.close()
+
+
+def test_refuse_overflow(tmp_path):
+  buffer = SegmentBuffer(directory=str(tmp_path), max_size=2, overflow='refuse')
+  assert buffer.insert_many([reading(), reading()])
+  assert not buffer.insert(reading())
+  assert buffer.length == 2
+  buffer.close()
+
+
+def test_group_commit_writer(buffer):
+  writer = GroupCommitWriter(buffer, interval=60_000, max_rows=1000)
+  writer.insert_many([reading(v) for v in range(3)])
+  writer.close()
+  assert [m.value for _, m in buffer.get_pending()] == [0, 1, 2]
+
+
+def test_aggregates_keep_their_summary(tmp_path):
+  aggregate = Aggregate(
+    mean = 1.5, min = 1.0, max = 2.0, last = 2.0, count = 2, dimension = 'temperature', unit = 'degree_fahrenheit',
+    sensor_name = 'DS18B20', sensor_id = '28-000000000001', timestamp = datetime(2025, 1, 1)
+  )
+  buffer = SegmentBuffer(directory=str(tmp_path), records_per_segment=2)
+  buffer.insert_many([reading(0), reading(1), aggregate])
+  writer = GroupCommitWriter(buffer, interval=60_000, max_rows=1000)
+  writer.insert_batch(MeasurementBatch.from_measurements([reading(2)]))
+  writer.insert_many([aggregate])
+  writer.close()
+  buffer.close()
+
+  reopened = SegmentBuffer(directory=str(tmp_path), records_per_segment=2)
+  assert [m for _, m in reopened.get_pending()] == [reading(0), reading(1), aggregate, reading(2), aggregate]
+  assert [batch.summaries for _, batch in reopened.iter_pending(chunk_size=2)] == [{}, {0: (1.0, 2.0, 2.0, 2)}, {0: (1.0, 2.0, 2.0, 2)}]
+
+  # Summary files go with their segments
+  reopened.acknowledge(range(1, 5))
+  assert sorted(os.listdir(tmp_path)) == ['00000000000000000005.seg', '00000000000000000005.sum', 'cursor', 'series']
+  reopened.close()
+
+
+def test_summaries_of_lost_records_are_dropped_on_recovery(tmp_path):
+  aggregate = Aggregate(
+    mean = 1.5, min = 1.0, max = 2.0, last = 2.0, count = 2, dimension = 'temperature', unit = 'degree_fahrenheit',
+    sensor_name = 'DS18B20', sensor_id = '28-000000000001', timestamp = datetime(2025, 1, 1)
+  )
+  buffer = SegmentBuffer(directory=str(tmp_path))
+  buffer.insert_many([reading(0), aggregate])
+  buffer.close()
+
+  # A crash after the summary was written, but before its record
+  path = os.path.join(tmp_path, segments(tmp_path)[-1])
+  with open(path, 'r+b') as f:
+    f.truncate(RECORD.size)
+
+  reopened = SegmentBuffer(directory=str(tmp_path))
+  reopened.insert(reading(2))
+  assert [m for _, m in reopened.get_pending()] == [reading(0), reading(2)]
+  reopened.close()
@@ -0,0 +1,56 @@
+import asyncio
+import pytest
+from sensors import Simulation, SimulatedDS18B20, SimulatedSHT41, SimulatedSI7021, SimulatedRaspberryPi
+from sampler import Sampler
+
+
+def measure(sensor, dimension):
+  return asyncio.run(sensor.measurables[dimension].measure(sensor))
+
+
+def test_simulated_probes_have_their_own_ids():
+  sensor       = SimulatedDS18B20(Simulation(speed=1000, seed=1), count=3)
+  measurements = measure(sensor, 'temperature')
+
+  assert [m.sensor_id for m in measurements] == sensor.ids
+  assert all(95 < m.value < 101 for m in measurements)
+  assert all(m.unit == 'degree_fahrenheit' for m in measurements)
+
+
+def test_crc_failures_are_retried_then_dropped():
+  sensor = SimulatedDS18B20(Simulation(speed=1000, failure_rate=1.0, seed=1), retries=2)
+  assert measure(sensor, 'temperature') == []
+
+
+def test_i2c_failures_raise():
+  sensor = SimulatedSHT41(Simulation(speed=1000, failure_rate=1.0, seed=1))
+  with pytest.raises(RuntimeError):
+    measure(sensor, 'temperature')
+
+
+def test_speed_shortens_frequencies():
+  sensor = SimulatedRaspberryPi(Simulation(speed=10))
+  assert sensor.frequencies['cpu_load'] == 3.0
+
+
+def test_sampler_runs_on_simulated_sensors():
+  simulation = Simulation(speed=1000, seed=1)
+  sampler    = Sampler(
+    sensors    = [SimulatedDS18B20(simulation), SimulatedSI7021(simulation), SimulatedRaspberryPi(simulation)],
+    dimensions = ['temperature', 'relative_humidity', 'cpu_load', 'cpu_temp']
+  )
+
+  async def collect():
+    seen = set()
+    async for m in sampler.run():
+      seen.add((m.sensor_name, m.dimension))
+      if len(seen) == 5:
+        return seen
+
+  assert asyncio.run(asyncio.wait_for(collect(), 10)) == {
+    ('DS18B20', 'temperature'),
+    ('SI7021', 'temperature'),
+    ('SI7021', 'relative_humidity'),
+    ('RPi Zero 2W', 'temperature'),
+    ('RPi Zero 2W', 'cpu_load')
+  }